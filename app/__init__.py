@@ -8,15 +8,29 @@ import sys
 from pathlib import Path
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, jsonify, make_response, render_template, request
 from flask_wtf.csrf import CSRFError
 
+from . import ratelimit
 from .cli import register_cli
 from .config import get_config
 from .crypto import init_encryption
 from .extensions import csrf, db, limiter, migrate
-from .security import apply_security_headers, current_user, load_current_user
+from .metrics import init_metrics
+from .passwords import PasswordHashingBusy, init_passwords
+from .security import (
+    apply_security_headers,
+    current_user,
+    init_audit_writer,
+    init_auth_cache,
+    load_current_user,
+)
+from .services import counselor
+from .services.admission import init_generation_gate
+from .services.degradation import init_degradation
 from .services.hf_client import HuggingFaceService, NullHuggingFaceService
+from .services.keepwarm import init_keepwarm
+from .services.token_budget import init_token_budget
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -79,10 +93,16 @@ def _build_hf_service(app: Flask):
         suicide_model=app.config["HF_SUICIDE_MODEL"],
         emotion_model=app.config["HF_EMOTION_MODEL"],
         sentiment_model=app.config["HF_SENTIMENT_MODEL"],
+        fallback_chat_models=app.config["HF_CHAT_FALLBACK_MODELS"],
         provider=app.config.get("HF_PROVIDER"),
         timeout=app.config["LLM_TIMEOUT_SECONDS"],
+        latency_slo=app.config["LLM_LATENCY_SLO_SECONDS"],
+        hedge_rate=app.config["LLM_HEDGE_RATE"],
+        retry_attempts=app.config["HF_RETRY_ATTEMPTS"],
+        classify_budget=app.config["HF_CLASSIFY_BUDGET_SECONDS"],
         max_tokens=app.config["LLM_MAX_TOKENS"],
         temperature=app.config["LLM_TEMPERATURE"],
+        metrics=app.extensions.get("metrics"),
     )
 
 
@@ -98,22 +118,44 @@ def create_app(config_name: str | None = None) -> Flask:
     _configure_logging(app.config["LOG_LEVEL"])
     _validate_secrets(app)
 
-    init_encryption(app.config["ENCRYPTION_KEY"])
+    init_encryption(
+        app.config["ENCRYPTION_KEY"],
+        previous_keys=app.config["ENCRYPTION_PREVIOUS_KEYS"],
+        decrypt_workers=app.config["DECRYPT_WORKERS"],
+        write_version=app.config["ENCRYPTION_WRITE_VERSION"],
+        compress_min_bytes=app.config["ENCRYPTION_COMPRESS_MIN_BYTES"],
+    )
+
+    init_passwords(
+        app.config["PASSWORD_HASH_METHOD"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        queue=app.config["PASSWORD_HASH_QUEUE"],
+    )
 
     db.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
 
     if app.config.get("RATELIMIT_ENABLED", True):
+        app.config["RATELIMIT_STORAGE_URI"] = ratelimit.resolve_uri(
+            app.config["RATELIMIT_STORAGE_URI"], app.instance_path
+        )
         limiter.init_app(app)
         if app.config["RATELIMIT_STORAGE_URI"] == "memory://" and not app.testing:
             app.logger.warning(
                 "Rate limiting is using in-process memory. With more than one gunicorn "
-                "worker each worker counts separately -- set RATELIMIT_STORAGE_URI to a "
-                "redis:// URL in production."
+                "worker each worker counts separately -- set RATELIMIT_STORAGE_URI to "
+                "sqlite:///ratelimit.db (one host, in the instance folder) or a "
+                "redis:// URL."
             )
 
+    counselor.register_metrics(init_metrics(app))
     app.extensions["huggingface"] = _build_hf_service(app)
+    init_generation_gate(app)
+    counselor.init_generations(app)
+    init_degradation(app)
+    init_keepwarm(app)
+    init_token_budget(app)
 
     from .blueprints import auth, chat, main, safety_plan, wellness
 
@@ -129,6 +171,8 @@ def create_app(config_name: str | None = None) -> Flask:
     csrf.exempt(chat.api_guest_chat)
     csrf.exempt(chat.api_guest_reset)
 
+    init_auth_cache(app)
+    init_audit_writer(app)
     app.before_request(load_current_user)
     app.after_request(apply_security_headers)
 
@@ -186,6 +230,19 @@ def _register_error_handlers(app: Flask) -> None:
             return jsonify({"error": "rate_limited", "message": message}), 429
         return render_template("404.html", message=message), 429
 
+    @app.errorhandler(PasswordHashingBusy)
+    def hashing_busy(error):
+        # Every hashing slot is taken: answer now rather than queue a login
+        # behind a burst of others.
+        message = "Lots of people are signing in right now. Please try again in a few seconds."
+        if _wants_json():
+            response = jsonify({"error": "busy", "message": message})
+        else:
+            response = make_response(render_template("404.html", message=message))
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+
     @app.errorhandler(CSRFError)
     def csrf_error(error):
         if _wants_json():
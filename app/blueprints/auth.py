@@ -12,12 +12,19 @@ from flask import (
     url_for,
 )
 from sqlalchemy import func, or_
-from werkzeug.security import generate_password_hash
 
 from ..extensions import db, limiter
 from ..forms import ChangePasswordForm, DeleteAccountForm, LoginForm, RegistrationForm
 from ..models import User, utcnow
-from ..security import audit, current_user, login_required, login_user, logout_user
+from ..passwords import hash_password
+from ..security import (
+    audit,
+    current_user,
+    current_user_record,
+    login_required,
+    login_user,
+    logout_user,
+)
 
 bp = Blueprint("auth", __name__)
 
@@ -100,7 +107,7 @@ def login():
             # Hash anyway so a missing account and a wrong password take the
             # same amount of time. Otherwise response timing reveals which
             # usernames exist -- and here, having an account is itself sensitive.
-            generate_password_hash(form.password.data)
+            hash_password(form.password.data)
             valid = False
         else:
             valid = user.check_password(form.password.data)
@@ -108,6 +115,9 @@ def login():
         if user is not None and valid and user.is_active:
             login_user(user)
             user.last_login = utcnow()
+            # The one moment the plaintext is at hand: bring hashes made under
+            # an older PASSWORD_HASH_METHOD up to the current cost.
+            user.upgrade_password_hash(form.password.data)
             db.session.commit()
             audit("auth.login.success", user_id=user.id)
             return redirect(_safe_next(request.args.get("next")))
@@ -138,7 +148,7 @@ def account():
         "account.html",
         password_form=ChangePasswordForm(),
         delete_form=DeleteAccountForm(),
-        user=current_user(),
+        user=current_user_record(),
     )
 
 
@@ -146,7 +156,7 @@ def account():
 @login_required
 @limiter.limit("5 per hour")
 def change_password():
-    user = current_user()
+    user = current_user_record()
     form = ChangePasswordForm()
     if not form.validate_on_submit():
         for errors in form.errors.values():
@@ -174,7 +184,7 @@ def change_password():
 def delete_account():
     """Hard delete. Cascades remove every conversation, message, mood entry
     and check-in. This is a right-to-erasure path, so nothing is retained."""
-    user = current_user()
+    user = current_user_record()
     form = DeleteAccountForm()
     if not form.validate_on_submit() or not user.check_password(form.password.data):
         flash("Could not verify your identity. Account not deleted.", "error")
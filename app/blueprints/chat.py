@@ -9,18 +9,25 @@ into the backend and made stored XSS trivial. Rendering belongs to the client.
 from __future__ import annotations
 
 from flask import Blueprint, current_app, jsonify, render_template, request, session
+from sqlalchemy import func
 
 from ..extensions import db, limiter
-from ..models import Conversation, Message
+from ..models import Conversation, Message, RiskLevel
 from ..security import current_user, login_required
 from ..services import counselor
+from ..services.history import history_window, latest_message_id, message_to_dict
 from ..services.safety import CRISIS_RESOURCES
+from ..services.search import search_messages
 
 bp = Blueprint("chat", __name__)
 
 MAX_MESSAGE_LENGTH = 4000
 GUEST_HISTORY_KEY = "guest_history"
 GUEST_HISTORY_LIMIT = 24
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_LIMIT = 500
+CONVERSATION_PAGE_SIZE = 25
+SEARCH_PAGE_SIZE = 50
 
 
 @bp.get("/chat")
@@ -65,6 +72,9 @@ def api_chat():
         hf=current_app.extensions["huggingface"],
         config=current_app.config,
         user=current_user(),
+        gate=current_app.extensions["generation_gate"],
+        degradation=current_app.extensions["degradation"],
+        token_budget=current_app.extensions["token_budget"],
     )
     return jsonify(reply.to_dict())
 
@@ -87,6 +97,9 @@ def api_guest_chat():
         config=current_app.config,
         user=None,
         guest_history=history,
+        gate=current_app.extensions["generation_gate"],
+        degradation=current_app.extensions["degradation"],
+        token_budget=current_app.extensions["token_budget"],
     )
 
     history = history + [
@@ -105,48 +118,219 @@ def api_guest_reset():
     return jsonify({"ok": True})
 
 
+def _limit_arg(default: int = 100) -> int:
+    try:
+        return min(max(int(request.args.get("limit", default)), 1), HISTORY_MAX_LIMIT)
+    except (TypeError, ValueError):
+        return default
+
+
+def _int_arg(name: str) -> int | None:
+    """A positive integer query parameter, or None if absent or malformed."""
+    try:
+        value = int(request.args.get(name, ""))
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _one_cursor_only():
+    # Older or newer, not both: the window cannot go both ways at once.
+    return jsonify(
+        {"error": "bad_request", "message": "Pass before_id or after_id, not both."}
+    ), 400
+
+
 @bp.get("/api/history")
 @login_required
 def api_history():
+    """Paged history. Pass ``before_id`` for older messages, ``after_id`` for
+    newer ones; the response carries the cursors for the next request."""
     user = current_user()
-    try:
-        limit = min(int(request.args.get("limit", 100)), 500)
-    except (TypeError, ValueError):
-        limit = 100
+    limit = _limit_arg()
+    before_id = _int_arg("before_id")
+    after_id = _int_arg("after_id")
+    if before_id is not None and after_id is not None:
+        return _one_cursor_only()
+    rows, has_more = history_window(user.id, limit=limit, before_id=before_id, after_id=after_id)
+    return jsonify(
+        {
+            "messages": [message_to_dict(m) for m in rows],
+            "has_more": has_more,
+            "oldest_id": rows[0].id if rows else before_id,
+            "newest_id": rows[-1].id if rows else after_id,
+        }
+    )
+
+
+@bp.get("/api/history/since")
+@login_required
+def api_history_since():
+    """Delta sync for a chat page that already holds history up to ``after_id``.
+
+    The common case on a tab switch or reconnect is that nothing has changed,
+    so that case is answered from the ``(conversation_id, id)`` index alone:
+    one ``MAX(id)`` probe, no row fetch, nothing decrypted.
+    """
+    user = current_user()
+    after_id = request.args.get("after_id", type=int)
+    if after_id is None or after_id < 0:
+        return jsonify({"error": "bad_request", "message": "after_id is required."}), 400
+    limit = _limit_arg()
+
+    newest = latest_message_id(user.id)
+    if newest is None or newest <= after_id:
+        return jsonify({"messages": [], "has_more": False, "newest_id": after_id})
+
+    rows, has_more = history_window(user.id, limit=limit, after_id=after_id)
+    return jsonify(
+        {
+            "messages": [message_to_dict(m) for m in rows],
+            "has_more": has_more,
+            "newest_id": rows[-1].id if rows else after_id,
+        }
+    )
+
+
+@bp.get("/api/search")
+@login_required
+def api_search():
+    """Messages containing every word of ``q``, newest first.
 
-    rows = (
-        db.session.query(Message)
-        .join(Conversation, Message.conversation_id == Conversation.id)
+    Answered from the blind index; only the matches are decrypted.
+    """
+    user = current_user()
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"error": "bad_request", "message": "q is required."}), 400
+    rows, has_more = search_messages(user.id, query, limit=_limit_arg(SEARCH_PAGE_SIZE))
+    return jsonify(
+        {
+            "query": query,
+            "messages": [
+                {**message_to_dict(m), "conversation_id": m.conversation_id} for m in rows
+            ],
+            "has_more": has_more,
+        }
+    )
+
+
+@bp.get("/api/conversations")
+@login_required
+def api_conversations():
+    """Each conversation with its size, last activity and peak risk.
+
+    One grouped query over plaintext columns -- ids, roles, risk levels,
+    timestamps -- so listing a user's threads decrypts nothing, however many
+    messages they hold. Newest first, paged by ``before_id``.
+    """
+    user = current_user()
+    limit = min(_limit_arg(CONVERSATION_PAGE_SIZE), CONVERSATION_PAGE_SIZE * 4)
+    before_id = _int_arg("before_id")
+
+    query = (
+        db.session.query(
+            Conversation.id,
+            Conversation.title,
+            Conversation.created_at,
+            func.count(Message.id),
+            func.max(Message.created_at),
+            func.max(Message.risk_level),
+        )
+        .outerjoin(Message, Message.conversation_id == Conversation.id)
         .filter(Conversation.user_id == user.id)
-        .order_by(Message.id.desc())
-        .limit(limit)
-        .all()
+        .group_by(Conversation.id, Conversation.title, Conversation.created_at)
     )
-    messages = [
+    if before_id is not None:
+        query = query.filter(Conversation.id < before_id)
+    rows = query.order_by(Conversation.id.desc()).limit(limit + 1).all()
+
+    conversations = [
         {
-            "role": m.role,
-            "content": m.content,
-            "risk": m.risk.label,
-            "timestamp": m.created_at.isoformat() if m.created_at else None,
+            "id": cid,
+            "title": title,
+            "message_count": count,
+            "created_at": created.isoformat() if created else None,
+            "last_activity": (last or created).isoformat() if (last or created) else None,
+            "peak_risk": RiskLevel.from_value(peak or 0).label,
         }
-        for m in reversed(rows)
+        for cid, title, created, count, last, peak in rows[:limit]
     ]
-    return jsonify({"messages": messages})
+    return jsonify(
+        {
+            "conversations": conversations,
+            "has_more": len(rows) > limit,
+            "oldest_id": conversations[-1]["id"] if conversations else before_id,
+        }
+    )
+
+
+@bp.get("/api/conversations/<int:conversation_id>/messages")
+@login_required
+def api_conversation_messages(conversation_id: int):
+    """One thread, paged exactly like ``/api/history``."""
+    user = current_user()
+    owned = (
+        db.session.query(Conversation.id)
+        .filter(Conversation.id == conversation_id, Conversation.user_id == user.id)
+        .scalar()
+    )
+    if owned is None:
+        # Same answer for "not yours" and "does not exist".
+        return jsonify({"error": "not_found"}), 404
+
+    before_id = _int_arg("before_id")
+    after_id = _int_arg("after_id")
+    if before_id is not None and after_id is not None:
+        return _one_cursor_only()
+    rows, has_more = history_window(
+        user.id,
+        limit=_limit_arg(),
+        before_id=before_id,
+        after_id=after_id,
+        conversation_id=conversation_id,
+    )
+    return jsonify(
+        {
+            "conversation_id": conversation_id,
+            "messages": [message_to_dict(m) for m in rows],
+            "has_more": has_more,
+            "oldest_id": rows[0].id if rows else before_id,
+            "newest_id": rows[-1].id if rows else after_id,
+        }
+    )
 
 
 @bp.get("/history")
 @login_required
 def history_page():
+    """First page is rendered server-side; older pages stream in on scroll.
+    ``?before_id=`` also works without JavaScript via the "earlier" link, and
+    ``?q=`` shows search results in the same layout."""
     user = current_user()
-    rows = (
-        db.session.query(Message)
-        .join(Conversation, Message.conversation_id == Conversation.id)
-        .filter(Conversation.user_id == user.id)
-        .order_by(Message.id.desc())
-        .limit(200)
-        .all()
+    query = (request.args.get("q") or "").strip()
+    if query:
+        # Matches only, oldest first like the timeline, without paging.
+        hits, _ = search_messages(user.id, query, limit=SEARCH_PAGE_SIZE)
+        return render_template(
+            "chat_history.html",
+            messages=list(reversed(hits)),
+            query=query,
+            has_more=False,
+            oldest_id=None,
+            page_size=HISTORY_PAGE_SIZE,
+        )
+    rows, has_more = history_window(
+        user.id, limit=HISTORY_PAGE_SIZE, before_id=_int_arg("before_id")
+    )
+    return render_template(
+        "chat_history.html",
+        messages=rows,
+        query="",
+        has_more=has_more,
+        oldest_id=rows[0].id if rows else None,
+        page_size=HISTORY_PAGE_SIZE,
     )
-    return render_template("chat_history.html", messages=list(reversed(rows)))
 
 
 @bp.post("/api/conversation/reset")
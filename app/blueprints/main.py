@@ -2,7 +2,18 @@
 
 from __future__ import annotations
 
-from flask import Blueprint, current_app, jsonify, redirect, render_template, url_for
+import hmac
+
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from sqlalchemy import text
 
 from ..extensions import db
@@ -47,8 +58,22 @@ def healthz():
     checks["encryption"] = (
         "enabled" if current_app.config.get("ENCRYPTION_KEY") else "disabled"
     )
+    # Informational: a degraded worker is still serving, and still safe.
+    checks["degradation"] = current_app.extensions["degradation"].stats()
 
     status = "ok" if ok and checks["huggingface"] == "configured" else (
         "ok" if ok else "error"
     )
     return jsonify({"status": status, "checks": checks}), (200 if ok else 503)
+
+
+@bp.get("/metrics")
+def metrics():
+    """Prometheus text format, for this worker only (see ``app/metrics.py``)."""
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        abort(404)
+    body = current_app.extensions["metrics"].render()
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4", "Cache-Control": "no-store"}
@@ -7,19 +7,20 @@ from datetime import date, timedelta
 
 from flask import Blueprint, jsonify, render_template, request
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 
+from ..crypto import ciphertext, decrypt_many
 from ..extensions import db, limiter
 from ..models import (
     CheckIn,
     Conversation,
-    Message,
     MoodEntry,
     RiskLevel,
     SafetyPlan,
-    checkin_calendar,
-    compute_streaks,
 )
-from ..security import current_user, login_required
+from ..security import current_user, current_user_record, login_required
+from ..services import streaks as streak_service
+from ..services.history import messages_by_conversation
 
 bp = Blueprint("wellness", __name__)
 
@@ -34,11 +35,11 @@ ENCOURAGEMENTS = [
 @bp.get("/streak")
 @login_required
 def streak_page():
-    user = current_user()
+    summary = streak_service.checkin_summary(current_user().id)
     return render_template(
         "streak.html",
-        streak=compute_streaks(user.id),
-        calendar=checkin_calendar(user.id),
+        streak=summary.streak,
+        calendar=summary.calendar,
         today=date.today().isoformat(),
     )
 
@@ -46,10 +47,8 @@ def streak_page():
 @bp.get("/api/streak")
 @login_required
 def api_streak():
-    user = current_user()
-    return jsonify(
-        {"streak": compute_streaks(user.id), "calendar": checkin_calendar(user.id)}
-    )
+    summary = streak_service.checkin_summary(current_user().id)
+    return jsonify({"streak": summary.streak, "calendar": summary.calendar})
 
 
 @bp.post("/api/checkin")
@@ -74,12 +73,15 @@ def api_checkin():
     entry = CheckIn(user_id=user.id, checkin_date=today, mood_score=mood_score, note=note)
     db.session.add(entry)
     try:
+        # Same transaction as the check-in: the streak row can never count a
+        # check-in the database then rejected.
+        streak_service.apply_checkin(user.id, today)
         db.session.commit()
     except IntegrityError:
         # The unique constraint is what enforces one check-in per day. Two
         # simultaneous taps used to both succeed and double-count the streak.
         db.session.rollback()
-        streak = compute_streaks(user.id)
+        streak = streak_service.checkin_summary(user.id, today=today).streak
         return (
             jsonify(
                 {
@@ -91,14 +93,15 @@ def api_checkin():
             409,
         )
 
-    streak = compute_streaks(user.id, today)
+    summary = streak_service.checkin_summary(user.id, today=today)
+    streak = summary.streak
     n = streak["current_streak"]
     return jsonify(
         {
             "ok": True,
             "message": ENCOURAGEMENTS[n % len(ENCOURAGEMENTS)].format(n=n),
             "streak": streak,
-            "calendar": checkin_calendar(user.id),
+            "calendar": summary.calendar,
         }
     )
 
@@ -147,7 +150,7 @@ def api_insights():
         for k, v in sorted(by_day.items())
     ]
 
-    checkins = compute_streaks(user.id)
+    checkins = streak_service.checkin_summary(user.id).streak
     elevated = sum(1 for e in entries if e.risk_level >= int(RiskLevel.MODERATE))
 
     return jsonify(
@@ -215,10 +218,42 @@ def api_export():
     The counterpart to account deletion: people can see exactly what is stored
     before deciding whether to keep it.
     """
-    user = current_user()
+    user = current_user_record()
     conversations = (
-        db.session.query(Conversation).filter(Conversation.user_id == user.id).all()
+        db.session.query(Conversation)
+        .options(undefer(Conversation.summary))
+        .filter(Conversation.user_id == user.id)
+        .order_by(Conversation.id.asc())
+        .all()
     )
+    # Everything encrypted below is read raw and decrypted in batches: an
+    # export is the single largest decrypt this app does.
+    threads = messages_by_conversation([c.id for c in conversations])
+
+    moods = (
+        db.session.query(
+            MoodEntry.sentiment,
+            MoodEntry.emotions,
+            MoodEntry.risk_level,
+            ciphertext(MoodEntry.excerpt),
+            MoodEntry.created_at,
+        )
+        .filter(MoodEntry.user_id == user.id)
+        .order_by(MoodEntry.created_at.asc())
+        .all()
+    )
+    excerpts = decrypt_many([m.excerpt for m in moods])
+
+    checkins = (
+        db.session.query(CheckIn.checkin_date, CheckIn.mood_score, ciphertext(CheckIn.note))
+        .filter(CheckIn.user_id == user.id)
+        .order_by(CheckIn.checkin_date.asc())
+        .all()
+    )
+    notes = decrypt_many([c.note for c in checkins])
+
+    plan = db.session.query(SafetyPlan).filter(SafetyPlan.user_id == user.id).first()
+
     payload = {
         "account": {
             "username": user.username,
@@ -239,42 +274,29 @@ def api_export():
                         "risk": m.risk.label,
                         "timestamp": m.created_at.isoformat() if m.created_at else None,
                     }
-                    for m in db.session.query(Message)
-                    .filter(Message.conversation_id == c.id)
-                    .order_by(Message.id.asc())
-                    .all()
+                    for m in threads[c.id]
                 ],
             }
             for c in conversations
         ],
         "mood_entries": [
             {
-                "sentiment": e.sentiment,
-                "emotions": e.emotion_list,
-                "risk": RiskLevel.from_value(e.risk_level).label,
-                "excerpt": e.excerpt,
-                "timestamp": e.created_at.isoformat() if e.created_at else None,
+                "sentiment": m.sentiment,
+                "emotions": [e for e in (m.emotions or "").split(",") if e],
+                "risk": RiskLevel.from_value(m.risk_level).label,
+                "excerpt": excerpt,
+                "timestamp": m.created_at.isoformat() if m.created_at else None,
             }
-            for e in db.session.query(MoodEntry)
-            .filter(MoodEntry.user_id == user.id)
-            .order_by(MoodEntry.created_at.asc())
-            .all()
+            for m, excerpt in zip(moods, excerpts, strict=True)
         ],
-        "safety_plan": (
-            db.session.query(SafetyPlan).filter(SafetyPlan.user_id == user.id).first().to_dict()
-            if db.session.query(SafetyPlan).filter(SafetyPlan.user_id == user.id).first()
-            else None
-        ),
+        "safety_plan": plan.to_dict() if plan else None,
         "checkins": [
             {
                 "date": c.checkin_date.isoformat(),
                 "mood_score": c.mood_score,
-                "note": c.note,
+                "note": note,
             }
-            for c in db.session.query(CheckIn)
-            .filter(CheckIn.user_id == user.id)
-            .order_by(CheckIn.checkin_date.asc())
-            .all()
+            for c, note in zip(checkins, notes, strict=True)
         ],
     }
     response = jsonify(payload)
@@ -17,44 +17,32 @@ from flask.cli import with_appcontext
 from sqlalchemy import inspect, text
 
 from .extensions import db
+from .services.hf_client import error_class
 
 OK = "  [ok]  "
 BAD = "  [FAIL]"
 WARN = "  [warn]"
 
+_HF_ERROR_ACTIONS = {
+    "auth": "token rejected. Check HF_TOKEN at https://huggingface.co/settings/tokens",
+    "gated": (
+        "access denied. This model is gated -- open its page on huggingface.co "
+        "and accept the licence with the same account that owns the token."
+    ),
+    "not_found": "model id not found. Check the spelling, or the model was removed.",
+    "cold_start": "model is cold-starting. Wait ~30s and run this again.",
+    "rate_limited": "rate limited or out of credits on your HF account.",
+    "no_provider": (
+        "no inference provider serves this model. Pick a different HF_CHAT_MODEL, "
+        "or set HF_PROVIDER to one that hosts it."
+    ),
+    "timeout": "request timed out. Network issue, or raise LLM_TIMEOUT_SECONDS.",
+}
+
 
 def _explain_hf_error(exc: Exception) -> str:
     """Turn an HF exception into something actionable."""
-    msg = str(exc)
-    low = msg.lower()
-    if (
-        "401" in msg
-        or "unauthorized" in low
-        or "invalid credentials" in low
-        # The wording the hub actually returns for a bad token -- verified live.
-        or "invalid user token" in low
-        or "invalid token" in low
-    ):
-        return "token rejected. Check HF_TOKEN at https://huggingface.co/settings/tokens"
-    if "403" in msg or "forbidden" in low or "gated" in low or "awaiting a review" in low:
-        return (
-            "access denied. This model is gated -- open its page on huggingface.co "
-            "and accept the licence with the same account that owns the token."
-        )
-    if "404" in msg or "not found" in low:
-        return "model id not found. Check the spelling, or the model was removed."
-    if "503" in msg or "loading" in low or "currently loading" in low:
-        return "model is cold-starting. Wait ~30s and run this again."
-    if "429" in msg or "rate limit" in low or "quota" in low:
-        return "rate limited or out of credits on your HF account."
-    if "supported" in low and "provider" in low:
-        return (
-            "no inference provider serves this model. Pick a different HF_CHAT_MODEL, "
-            "or set HF_PROVIDER to one that hosts it."
-        )
-    if "timed out" in low or "timeout" in low:
-        return "request timed out. Network issue, or raise LLM_TIMEOUT_SECONDS."
-    return msg[:200]
+    return _HF_ERROR_ACTIONS.get(error_class(exc)) or str(exc)[:200]
 
 
 def register_cli(app: Flask) -> None:
@@ -74,6 +62,45 @@ def register_cli(app: Flask) -> None:
             fg="yellow",
         )
 
+    @app.cli.command("calibrate-hash")
+    @click.option(
+        "--target-ms", default=250, show_default=True, help="Longest one hash should take."
+    )
+    @click.option(
+        "--method", "algorithm", type=click.Choice(["scrypt", "pbkdf2"]), default="scrypt",
+        show_default=True,
+    )
+    def calibrate_hash(target_ms, algorithm):
+        """Find the dearest PASSWORD_HASH_METHOD this host hashes within --target-ms.
+
+        Run it on the production machine, not a laptop. Existing hashes are
+        upgraded to the new cost as their owners next log in.
+        """
+        import statistics
+
+        from werkzeug.security import generate_password_hash
+
+        if algorithm == "scrypt":
+            # N doubles; memory is 128 * N * r bytes, so stop at 256 MB.
+            candidates = [f"scrypt:{2**e}:8:1" for e in range(14, 19)]
+        else:
+            candidates = [f"pbkdf2:sha256:{100_000 * 2**e}" for e in range(0, 7)]
+
+        chosen = candidates[0]
+        for method in candidates:
+            samples = []
+            for _ in range(3):
+                started = time.perf_counter()
+                generate_password_hash("calibrate-hash", method)
+                samples.append((time.perf_counter() - started) * 1000)
+            median = statistics.median(samples)
+            click.echo(f"  {method:<24} {median:8.1f} ms")
+            if median > target_ms:
+                break
+            chosen = method
+        click.echo("")
+        click.echo(f"PASSWORD_HASH_METHOD={chosen}")
+
     # ------------------------------------------------------------ database --
 
     @app.cli.command("check-db")
@@ -208,6 +235,197 @@ def register_cli(app: Flask) -> None:
             fg="green",
         )
 
+    @app.cli.command("check-streaks")
+    @click.option("--fix", is_flag=True, help="Rebuild every row that disagrees.")
+    @with_appcontext
+    def check_streaks(fix):
+        """Compare stored streak state with the value derived from check-ins.
+
+        The stored row is what every page reads; the check-in table is the truth.
+        Any disagreement means a write path skipped the streak update.
+        """
+        from datetime import date
+
+        from .models import CheckIn, StreakState
+        from .services import streaks as streak_service
+
+        today = date.today()
+        user_ids = {
+            r[0] for r in db.session.query(CheckIn.user_id).distinct()
+        } | {r[0] for r in db.session.query(StreakState.user_id)}
+
+        mismatched = []
+        for user_id in sorted(user_ids):
+            derived = streak_service.derive(user_id, today)
+            state = db.session.get(StreakState, user_id)
+            stored = state.to_dict(today) if state is not None else None
+            if stored != derived:
+                mismatched.append(user_id)
+                click.secho(
+                    f"{WARN} user {user_id}: stored {stored} != derived {derived}", fg="yellow"
+                )
+                if fix:
+                    streak_service.rebuild(user_id)
+
+        if fix and mismatched:
+            db.session.commit()
+
+        click.echo(f"Checked {len(user_ids)} users.")
+        if not mismatched:
+            click.secho(f"{OK} streak state matches the check-in table", fg="green")
+            return
+        if fix:
+            click.secho(f"{OK} rebuilt {len(mismatched)} streak rows", fg="green")
+            return
+        click.secho(
+            f"{BAD} {len(mismatched)} users disagree. Run with --fix to rebuild them.", fg="red"
+        )
+        raise SystemExit(1)
+
+    @app.cli.command("reencrypt")
+    @click.option("--batch-size", default=500, show_default=True, help="Rows per transaction.")
+    @click.option(
+        "--rate", default=0.0, show_default=True, help="Target rows per second; 0 is unthrottled."
+    )
+    @click.option(
+        "--checkpoint",
+        type=click.Path(dir_okay=False),
+        default=None,
+        help="Progress file. Defaults to reencrypt-checkpoint.json in the instance folder.",
+    )
+    @click.option("--restart", is_flag=True, help="Ignore any checkpoint and start from the top.")
+    @with_appcontext
+    def reencrypt(batch_size, rate, checkpoint, restart):
+        """Rewrite every encrypted value under the primary ENCRYPTION_KEY.
+
+        Safe to run against a live app and safe to interrupt: each chunk
+        commits on its own and the checkpoint records the last id done, so a
+        second run picks up where the first stopped. The checkpoint never
+        moves past a chunk with unreadable values, so adding the missing key
+        and running again revisits them; a run that finishes clean deletes
+        it. Once it reports nothing unreadable, ENCRYPTION_PREVIOUS_KEYS can
+        be emptied.
+        """
+        import json
+        import os
+
+        from .crypto import get_encryptor
+        from .services import rotation
+
+        encryptor = get_encryptor()
+        if not encryptor.enabled:
+            click.secho(f"{BAD} ENCRYPTION_KEY is not set.", fg="red")
+            raise SystemExit(1)
+
+        path = checkpoint or os.path.join(app.instance_path, "reencrypt-checkpoint.json")
+        # A checkpoint only means something for the key and envelope it was
+        # written under; after another rotation every row is stale again.
+        target = {"key_id": encryptor.key_id, "write_version": encryptor.write_version}
+        progress: dict[str, int] = {}
+        if not restart and os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                saved = json.load(fh)
+            if {k: saved.get(k) for k in target} == target:
+                progress = saved.get("tables", {})
+                click.echo(f"Resuming from {path}")
+            else:
+                click.secho(f"{WARN} {path} is for a different key; starting over.", fg="yellow")
+
+        def save() -> None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({**target, "tables": progress}, fh)
+            os.replace(tmp, path)
+
+        click.echo(
+            f"Re-encrypting under key {encryptor.key_id} as enc:v{encryptor.write_version} "
+            f"({encryptor.key_count - 1} previous key(s) accepted)"
+        )
+        started = time.monotonic()
+        scanned = rewritten = unreadable = raced = 0
+        for model in rotation.ENCRYPTED_MODELS:
+            name = model.__tablename__
+            after_id = progress.get(name)
+            total = rotation.remaining_rows(model, after_id)
+            done = 0
+            held = False  # progress stops at the first chunk it could not finish
+            while True:
+                chunk = rotation.reencrypt_chunk(model, after_id=after_id, limit=batch_size)
+                if chunk.last_id is None:
+                    break
+                after_id = chunk.last_id
+                held = held or chunk.unreadable > 0
+                if not held:
+                    progress[name] = chunk.last_id
+                    save()
+                done += chunk.scanned
+                scanned += chunk.scanned
+                rewritten += chunk.rewritten
+                unreadable += chunk.unreadable
+                raced += chunk.raced
+
+                elapsed = time.monotonic() - started
+                if rate > 0 and scanned / rate > elapsed:
+                    time.sleep(scanned / rate - elapsed)
+                    elapsed = scanned / rate
+                click.echo(
+                    f"  {name}: {done}/{total} rows, {rewritten} values rewritten, "
+                    f"{scanned / max(elapsed, 1e-9):.0f} rows/s"
+                )
+
+        click.echo(
+            f"Scanned {scanned} rows in {time.monotonic() - started:.1f}s; "
+            f"rewrote {rewritten} values."
+        )
+        if raced:
+            click.echo(f"  {raced} values were rewritten by the app mid-run and left alone.")
+        if unreadable:
+            click.secho(
+                f"{BAD} {unreadable} values open under none of the configured keys. "
+                "Keep the previous keys until they are accounted for.",
+                fg="red",
+            )
+            raise SystemExit(1)
+        if os.path.exists(path):
+            os.remove(path)  # done; the next run, after another rotation, starts over
+        click.secho(f"{OK} every value is under the primary key", fg="green")
+
+    @app.cli.command("index-search")
+    @click.option("--batch-size", default=500, show_default=True, help="Messages per transaction.")
+    @click.option(
+        "--all", "rebuild", is_flag=True, help="Rebuild every message, not just unindexed ones."
+    )
+    @with_appcontext
+    def index_search(batch_size, rebuild):
+        """Build the search index for messages written before it existed.
+
+        New messages are indexed as they are stored. Re-running is safe and
+        only picks up what is missing; use --all after rotating ENCRYPTION_KEY,
+        since the index key derives from it.
+        """
+        from .crypto import get_encryptor
+        from .services import search
+
+        if not get_encryptor().enabled:
+            click.secho(f"{BAD} ENCRYPTION_KEY is not set.", fg="red")
+            raise SystemExit(1)
+
+        started = time.monotonic()
+        after_id = None
+        indexed = 0
+        while True:
+            after_id, count = search.backfill_chunk(
+                after_id=after_id, limit=batch_size, rebuild=rebuild
+            )
+            if after_id is None:
+                break
+            indexed += count
+            click.echo(f"  indexed {indexed} messages (through id {after_id})")
+        click.secho(
+            f"{OK} indexed {indexed} messages in {time.monotonic() - started:.1f}s", fg="green"
+        )
+
     # ------------------------------------------------------- hugging face --
 
     @app.cli.command("check-hf")
@@ -240,24 +458,38 @@ def register_cli(app: Flask) -> None:
             click.secho(f"{BAD} token check failed: {_explain_hf_error(exc)}", fg="red")
             raise SystemExit(1) from exc
 
-        # 2. Chat model ----------------------------------------------------
-        click.echo(f"\nGeneration model: {hf.chat_model}")
-        started = time.perf_counter()
-        try:
-            reply = hf.chat(
-                [
-                    {"role": "system", "content": "Reply with exactly one short sentence."},
-                    {"role": "user", "content": "Say hello."},
-                ],
-                max_tokens=32,
-                temperature=0.1,
-            )
-            elapsed = time.perf_counter() - started
-            click.secho(f"{OK} responded in {elapsed:.1f}s", fg="green")
-            click.echo(f"       > {reply[:100]}")
-        except Exception as exc:
-            click.secho(f"{BAD} {_explain_hf_error(exc)}", fg="red")
+        # 2. Chat models, in failover order --------------------------------
+        click.echo("\nGeneration models")
+        broken = []
+        for position, route in enumerate(hf.chat_routes):
+            role = "primary" if position == 0 else f"fallback {position}"
+            click.echo(f"  {role}: {route!r}")
+            started = time.perf_counter()
+            try:
+                reply = hf.chat(
+                    [
+                        {"role": "system", "content": "Reply with exactly one short sentence."},
+                        {"role": "user", "content": "Say hello."},
+                    ],
+                    max_tokens=32,
+                    temperature=0.1,
+                    route=route,
+                )
+                elapsed = time.perf_counter() - started
+                slow = hf.latency_slo > 0 and elapsed > hf.latency_slo
+                click.secho(
+                    f"{WARN if slow else OK} responded in {elapsed:.1f}s"
+                    + (f"  <- over LLM_LATENCY_SLO_SECONDS ({hf.latency_slo:g}s)" if slow else ""),
+                    fg="yellow" if slow else "green",
+                )
+                click.echo(f"       > {reply[:100]}")
+            except Exception as exc:
+                click.secho(f"{BAD} {_explain_hf_error(exc)}", fg="red")
+                broken.append(repr(route))
+        if broken and len(broken) == len(hf.chat_routes):
             failures.append("generation")
+        else:
+            failures.extend(f"chat model {model}" for model in broken)
 
         # 3. Classifiers ---------------------------------------------------
         click.echo("\nClassifiers")
@@ -315,6 +547,11 @@ def register_cli(app: Flask) -> None:
                 "\nWithout generation the app still runs, but every reply is a canned "
                 "fallback. Rule-based crisis detection is unaffected."
             )
+        elif broken:
+            click.echo(
+                "\nTurns will fail over to the models that answered. Fix or remove the "
+                "others in HF_CHAT_MODEL / HF_CHAT_FALLBACK_MODELS."
+            )
         if set(failures) & {"suicide risk", "emotion", "sentiment"}:
             click.echo(
                 "\nWithout classifiers, risk assessment falls back to the offline rule "
@@ -31,6 +31,10 @@ def _float(name: str, default: float) -> float:
         return default
 
 
+def _list(name: str, default: str = "") -> list[str]:
+    return [part.strip() for part in os.environ.get(name, default).split(",") if part.strip()]
+
+
 def _normalise_db_url(url: str) -> str:
     """Render and Heroku hand out ``postgres://`` URLs that SQLAlchemy 2.x
     refuses to parse. Rewrite to the dialect it expects."""
@@ -45,7 +49,20 @@ class BaseConfig:
     # --- Core ---------------------------------------------------------------
     SECRET_KEY = os.environ.get("SECRET_KEY")
     ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY")
+    # Keys being rotated out, comma-separated. Still accepted on read; never
+    # used to write. Drop them once `flask reencrypt` has finished.
+    ENCRYPTION_PREVIOUS_KEYS = _list("ENCRYPTION_PREVIOUS_KEYS")
+    # Envelope for new encrypted writes: 3 (AES-GCM, compressed when long),
+    # 2 (AES-GCM) or 1 (Fernet). All are always readable. Pin an older one only
+    # while a rolling deploy still has workers that cannot read the newer one
+    # -- they would show it as raw text.
+    ENCRYPTION_WRITE_VERSION = _int("ENCRYPTION_WRITE_VERSION", 3)
+    # v3 only: values shorter than this are never compressed.
+    ENCRYPTION_COMPRESS_MIN_BYTES = _int("ENCRYPTION_COMPRESS_MIN_BYTES", 256)
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+    # Threads used to decrypt large result sets (history, export). 0 decrypts
+    # inline; raise it only on multi-core hosts where bench_decrypt shows a gain.
+    DECRYPT_WORKERS = _int("DECRYPT_WORKERS", 0)
 
     # --- Database -----------------------------------------------------------
     SQLALCHEMY_DATABASE_URI = _normalise_db_url(
@@ -69,18 +86,47 @@ class BaseConfig:
     SESSION_COOKIE_SAMESITE = "Lax"
     SESSION_COOKIE_SECURE = _bool("SESSION_COOKIE_SECURE", False)
     PERMANENT_SESSION_LIFETIME = _int("SESSION_LIFETIME_SECONDS", 60 * 60 * 24 * 14)
+    # How long a worker trusts its cached copy of a user's auth fields. Also
+    # the longest a password change takes to log out sessions held on *other
+    # hosts*; workers on the same host hear of it through instance/auth.epoch
+    # on their next request. 0 disables.
+    AUTH_CACHE_SECONDS = _int("AUTH_CACHE_SECONDS", 30)
+    # werkzeug method string; `flask calibrate-hash` picks one for this host.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    # Processes per worker that hash passwords, and how many more logins may
+    # wait for one before the rest get a 503. 0 hashes inline.
+    PASSWORD_HASH_WORKERS = _int("PASSWORD_HASH_WORKERS", 1)
+    PASSWORD_HASH_QUEUE = _int("PASSWORD_HASH_QUEUE", 8)
+    # Audit events are queued and inserted in batches off the request path:
+    # every AUDIT_FLUSH_SECONDS, or sooner once AUDIT_BATCH_SIZE are waiting.
+    # Past AUDIT_QUEUE_SIZE pending, new events go to the log instead.
+    AUDIT_ASYNC = _bool("AUDIT_ASYNC", True)
+    AUDIT_BATCH_SIZE = _int("AUDIT_BATCH_SIZE", 100)
+    AUDIT_FLUSH_SECONDS = _float("AUDIT_FLUSH_SECONDS", 1.0)
+    AUDIT_QUEUE_SIZE = _int("AUDIT_QUEUE_SIZE", 1000)
 
     # --- CSRF ---------------------------------------------------------------
     WTF_CSRF_TIME_LIMIT = None  # tie CSRF validity to the session, not a timer
 
     # --- Rate limiting ------------------------------------------------------
+    # memory:// counts per worker. sqlite:///ratelimit.db, a file in the
+    # instance folder, is shared by every worker on the host
+    # (app/ratelimit.py); redis:// across hosts.
     RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI") or "memory://"
+    # Flask-Limiter's default. moving-window stops a client spending two
+    # windows' worth across a boundary; worth turning on with sqlite://.
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY") or "fixed-window"
     RATELIMIT_HEADERS_ENABLED = True
 
     # --- Hugging Face -------------------------------------------------------
     HF_TOKEN = os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACEHUB_API_TOKEN")
     HF_PROVIDER = os.environ.get("HF_PROVIDER") or None
     HF_CHAT_MODEL = os.environ.get("HF_CHAT_MODEL", "meta-llama/Llama-3.3-70B-Instruct")
+    # Tried in order when the chat model is failing or slower than
+    # LLM_LATENCY_SLO_SECONDS. "model:provider" pins a provider for one entry.
+    HF_CHAT_FALLBACK_MODELS = _list(
+        "HF_CHAT_FALLBACK_MODELS", "meta-llama/Llama-3.1-8B-Instruct"
+    )
     HF_SUICIDE_MODEL = os.environ.get(
         "HF_SUICIDE_MODEL", "vibhorag101/roberta-base-suicide-prediction-phr"
     )
@@ -90,16 +136,74 @@ class BaseConfig:
     HF_SENTIMENT_MODEL = os.environ.get(
         "HF_SENTIMENT_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest"
     )
+    # Attempts per call when HF answers 429 or 503 (1 = never retry), and
+    # how long a classification may take, retries included, before the rule
+    # layer takes over. Generation, retries included, ends within
+    # LLM_TIMEOUT_SECONDS; a retry is skipped when it would leave under 2s
+    # (0.5s for a classification).
+    HF_RETRY_ATTEMPTS = _int("HF_RETRY_ATTEMPTS", 3)
+    HF_CLASSIFY_BUDGET_SECONDS = _float("HF_CLASSIFY_BUDGET_SECONDS", 3.0)
 
     # --- Generation ---------------------------------------------------------
     LLM_MAX_TOKENS = _int("LLM_MAX_TOKENS", 400)
     LLM_TEMPERATURE = _float("LLM_TEMPERATURE", 0.7)
     LLM_TIMEOUT_SECONDS = _float("LLM_TIMEOUT_SECONDS", 25.0)
+    # Ask for the LLM_TOKENS_PERCENTILE of recent reply lengths at the turn's
+    # risk level, times LLM_TOKENS_MARGIN, instead of the full LLM_MAX_TOKENS.
+    # A reply cut off by the smaller budget is generated again with the full one.
+    LLM_ADAPTIVE_TOKENS = _bool("LLM_ADAPTIVE_TOKENS", True)
+    LLM_TOKENS_PERCENTILE = _float("LLM_TOKENS_PERCENTILE", 0.95)
+    LLM_TOKENS_MARGIN = _float("LLM_TOKENS_MARGIN", 1.25)
+    # A chat model whose recent (EWMA) latency is above this is passed over
+    # for the next one in the chain, and re-probed now and then in the
+    # background, after a turn has been answered, giving up after this long.
+    LLM_LATENCY_SLO_SECONDS = _float("LLM_LATENCY_SLO_SECONDS", 8.0)
+    # Share of turns that may send a second, hedging request to the next
+    # model in the chain when the first is slower than its p90. 0 disables.
+    LLM_HEDGE_RATE = _float("LLM_HEDGE_RATE", 0.1)
+    # Probe every model after this many idle seconds so the next person does
+    # not meet a cold start; one worker per host does it. 0 disables.
+    KEEPWARM_SECONDS = _float("KEEPWARM_SECONDS", 0.0)
+    # Generations one worker runs at once, and how many more may wait up to
+    # GENERATION_QUEUE_SECONDS for a slot before getting the fallback reply.
+    # Keep the first two summed below gunicorn's --threads (4 in the Procfile)
+    # so pages and /healthz always have a thread. 0 disables the limit.
+    GENERATION_CONCURRENCY = _int("GENERATION_CONCURRENCY", 2)
+    GENERATION_QUEUE = _int("GENERATION_QUEUE", 1)
+    GENERATION_QUEUE_SECONDS = _float("GENERATION_QUEUE_SECONDS", 3.0)
+    # Waiting turns are served by risk level. A waiter below HIGH moves up
+    # one level per this many seconds waited, so low-risk turns still move.
+    GENERATION_AGING_SECONDS = _float("GENERATION_AGING_SECONDS", 1.0)
+    # Longest a HIGH or IMMINENT turn waits for the model, once assessed,
+    # before the crisis fallback, resources and safety plan are sent; the
+    # model's reply follows as a separate message. 0 waits the full
+    # LLM_TIMEOUT_SECONDS. Crisis generations run on a pool the size of
+    # GENERATION_CONCURRENCY (8 when that is 0).
+    CRISIS_REPLY_SLO_SECONDS = _float("CRISIS_REPLY_SLO_SECONDS", 4.0)
+    # Degradation ladder (services/degradation.py): step down one rung when
+    # this worker's p95 turn time over the window passes DEGRADE_P95_SECONDS
+    # or the share of failed generations passes DEGRADE_ERROR_RATE; back up
+    # when both are under half. Turns shed by the gate are left out, and one
+    # past the crisis SLO counts when the model finishes. 0 seconds disables it.
+    DEGRADE_P95_SECONDS = _float("DEGRADE_P95_SECONDS", 12.0)
+    DEGRADE_ERROR_RATE = _float("DEGRADE_ERROR_RATE", 0.25)
+    DEGRADE_WINDOW_SECONDS = _float("DEGRADE_WINDOW_SECONDS", 60.0)
+    DEGRADE_COOLDOWN_SECONDS = _float("DEGRADE_COOLDOWN_SECONDS", 30.0)
+    # Reply length cap from the third rung on.
+    DEGRADED_MAX_TOKENS = _int("DEGRADED_MAX_TOKENS", 160)
+    # If set, /metrics requires "Authorization: Bearer <token>".
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
 
     # --- Memory -------------------------------------------------------------
     MEMORY_TURN_WINDOW = _int("MEMORY_TURN_WINDOW", 12)
     MEMORY_SUMMARY_TRIGGER = _int("MEMORY_SUMMARY_TRIGGER", 20)
 
+    # --- Streaks ------------------------------------------------------------
+    # How streaks are derived from the check-in table when stored state is
+    # rebuilt or checked: "python" walks the dates in process, "sql" finds the
+    # runs in the database with a window function and returns only aggregates.
+    STREAK_ENGINE = os.environ.get("STREAK_ENGINE", "python").strip().lower()
+
     # --- Data retention -----------------------------------------------------
     RETENTION_DAYS = _int("RETENTION_DAYS", 0)  # 0 disables automatic purging
 
@@ -125,6 +229,9 @@ class TestingConfig(BaseConfig):
     ENCRYPTION_KEY = "1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY="
     RATELIMIT_ENABLED = False
     HF_TOKEN = None
+    PASSWORD_HASH_WORKERS = 0
+    AUDIT_ASYNC = False
+    DEGRADE_P95_SECONDS = 0
 
 
 _CONFIGS = {
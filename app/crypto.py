@@ -7,36 +7,139 @@ somebody's disclosures about wanting to die.
 
 The key lives in ``ENCRYPTION_KEY`` and never in source control. Losing it
 means losing the plaintext forever; there is intentionally no recovery path.
+
+Reads that return hundreds of rows -- history pages, export -- can skip the
+per-row type decorator: select the column through ``ciphertext()`` and hand
+the raw values to ``Encryptor.decrypt_many``, which decrypts in chunks and,
+with ``DECRYPT_WORKERS`` set, spreads the chunks across a thread pool.
+
+Three envelopes exist. ``enc:v1:`` is a Fernet token (AES-128-CBC, then a
+separate HMAC-SHA256 pass, base64 of all of it). ``enc:v2:`` is AES-256-GCM
+-- one authenticated pass -- over ``nonce || ciphertext || tag``, base64
+once, which is about 30 bytes shorter per value and several times faster.
+``enc:v3:`` is v2 with one format byte at the start of the *sealed*
+plaintext: 0 for raw UTF-8, 1 for zlib. Values past
+``ENCRYPTION_COMPRESS_MIN_BYTES`` are compressed when that actually makes
+them smaller -- long prose, Roman Urdu included, typically halves. The flag
+sits inside the ciphertext, so nothing about it is visible in the column;
+stored length tracks compressed rather than raw size, which says no more
+about the content than raw length already did.
+
+All three are always readable; ``ENCRYPTION_WRITE_VERSION`` picks what new
+writes use. Rows move forward whenever they are next written.
+
+Search uses a blind index: ``blind_index`` turns a word into a keyed HMAC
+token, so the database can match words it never sees. Its key is derived from
+the primary ``ENCRYPTION_KEY`` too; see ``services.search``.
+
+Keys rotate the way ``MultiFernet`` does it: ``ENCRYPTION_KEY`` is the primary
+and encrypts everything new; ``ENCRYPTION_PREVIOUS_KEYS`` are still accepted on
+read. ``flask reencrypt`` then rewrites old rows under the primary, after which
+the previous keys can be dropped.
 """
 
 from __future__ import annotations
 
 import base64
+import binascii
 import hashlib
+import hmac
 import logging
+import os
+import threading
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
-from sqlalchemy import Text, TypeDecorator
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import Text, TypeDecorator, type_coerce
 
 logger = logging.getLogger(__name__)
 
 # Marks a value as produced by this module, so we can distinguish real
 # ciphertext from plaintext written by an older schema version and migrate
-# it lazily instead of raising.
-_PREFIX = "enc:v1:"
+# it lazily instead of raising. The version names the envelope format.
+_PREFIX_V1 = "enc:v1:"
+_PREFIX_V2 = "enc:v2:"
+_PREFIX_V3 = "enc:v3:"
+# The prefix is bound into every GCM tag as associated data, so a payload
+# cannot be relabelled as another version without failing authentication.
+_AAD = {_PREFIX_V2: _PREFIX_V2.encode("ascii"), _PREFIX_V3: _PREFIX_V3.encode("ascii")}
+_NONCE_BYTES = 12
+
+# v3 format byte, first byte of the sealed plaintext.
+_RAW = 0
+_ZLIB = 1
+_ZLIB_LEVEL = 6
+
+_UNREADABLE = "[unable to decrypt this message]"
 
 
 class EncryptionNotConfigured(RuntimeError):
     pass
 
 
+class DecryptionFailed(ValueError):
+    """No accepted key opens a stored value."""
+
+
+# Values per unit of work handed to the pool. Large enough that scheduling is
+# noise next to the crypto, small enough that a 200-row page still splits.
+_BULK_CHUNK = 128
+
+_pools: dict[int, ThreadPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+
+def _decrypt_pool(workers: int) -> ThreadPoolExecutor:
+    # Created on first use rather than at import: gunicorn forks workers after
+    # import, and threads do not survive a fork.
+    pool = _pools.get(workers)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(workers)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decrypt")
+                _pools[workers] = pool
+    return pool
+
+
 class Encryptor:
-    """Wraps Fernet (AES-128-CBC + HMAC-SHA256) with a stable envelope."""
+    """Reads every envelope under every accepted key; writes ``write_version``
+    under the primary key."""
 
-    def __init__(self, key: str | bytes | None):
-        self._fernet: Fernet | None = None
+    def __init__(
+        self,
+        key: str | bytes | None,
+        *,
+        previous_keys: Sequence[str | bytes] = (),
+        decrypt_workers: int = 0,
+        write_version: int = 3,
+        compress_min_bytes: int = 256,
+    ):
+        # Index 0 is the primary; the rest are only ever used to read.
+        self._fernets: list[Fernet] = []
+        self._aeads: list[AESGCM] = []
+        self._index_key: bytes | None = None
+        self.key_id: str | None = None
+        self.decrypt_workers = max(decrypt_workers, 0)
+        self.write_version = write_version if write_version in (1, 2) else 3
+        self.compress_min_bytes = compress_min_bytes
         if key:
-            self._fernet = Fernet(self._coerce_key(key))
+            for material in (key, *(k for k in previous_keys if k)):
+                fernet_key = self._coerce_key(material)
+                self._fernets.append(Fernet(fernet_key))
+                self._aeads.append(AESGCM(self._derive_key(fernet_key, b"enc:v2 aes-gcm")))
+            self._index_key = self._derive_key(self._coerce_key(key), b"blind index")
+            # Names the primary without revealing it, so a rotation checkpoint
+            # can tell which key it was written for.
+            self.key_id = hashlib.sha256(
+                b"dil-e-azaad key id" + self._coerce_key(key)
+            ).hexdigest()[:16]
 
     @staticmethod
     def _coerce_key(key: str | bytes) -> bytes:
@@ -56,43 +159,191 @@ class Encryptor:
         digest = hashlib.sha256(raw).digest()
         return base64.urlsafe_b64encode(digest)
 
+    @staticmethod
+    def _derive_key(fernet_key: bytes, purpose: bytes) -> bytes:
+        """A separate 256-bit key for ``purpose`` from the same ENCRYPTION_KEY.
+
+        Operators keep managing one secret. HKDF with a per-purpose label means
+        the GCM key and the blind-index key are never the same bytes as each
+        other or as what Fernet uses for AES and HMAC.
+        """
+        return HKDF(
+            algorithm=hashes.SHA256(), length=32, salt=None, info=b"dil-e-azaad " + purpose
+        ).derive(base64.urlsafe_b64decode(fernet_key))
+
     @property
     def enabled(self) -> bool:
-        return self._fernet is not None
+        return bool(self._fernets)
+
+    @property
+    def key_count(self) -> int:
+        return len(self._fernets)
 
     def encrypt(self, plaintext: str) -> str:
-        if self._fernet is None:
+        if not self._fernets:
             raise EncryptionNotConfigured(
                 "ENCRYPTION_KEY is not set; refusing to store sensitive data in plaintext."
             )
-        token = self._fernet.encrypt(plaintext.encode("utf-8")).decode("ascii")
-        return _PREFIX + token
+        data = plaintext.encode("utf-8")
+        if self.write_version == 1:
+            return _PREFIX_V1 + self._fernets[0].encrypt(data).decode("ascii")
+        if self.write_version == 2:
+            return self._seal(_PREFIX_V2, data)
+
+        flag = _RAW
+        if len(data) >= self.compress_min_bytes:
+            packed = zlib.compress(data, _ZLIB_LEVEL)
+            if len(packed) < len(data):
+                data, flag = packed, _ZLIB
+        return self._seal(_PREFIX_V3, bytes((flag,)) + data)
+
+    def _seal(self, prefix: str, data: bytes) -> str:
+        # A random 96-bit nonce per value. Safe for far more values than this
+        # app will ever write under one key.
+        nonce = os.urandom(_NONCE_BYTES)
+        sealed = self._aeads[0].encrypt(nonce, data, _AAD[prefix])
+        return prefix + binascii.b2a_base64(nonce + sealed, newline=False).decode("ascii")
+
+    def blind_index(self, scope: int, term: str) -> str:
+        """Keyed token for ``term``, distinct per ``scope`` (a user id).
+
+        Scoping means the same word yields unrelated tokens for two users, so
+        the index does not reveal who wrote the same thing as whom. Truncated
+        to 128 bits, which is plenty for equality lookups.
+        """
+        if self._index_key is None:
+            raise EncryptionNotConfigured("ENCRYPTION_KEY is not set; cannot build a search index.")
+        message = f"{scope}:{term}".encode()
+        return hmac.new(self._index_key, message, hashlib.sha256).hexdigest()[:32]
 
     def decrypt(self, stored: str) -> str:
-        if not stored.startswith(_PREFIX):
+        if not stored.startswith((_PREFIX_V1, _PREFIX_V2, _PREFIX_V3)):
             # Written before encryption was introduced. Return it as-is so old
             # rows stay readable; they get re-encrypted next time they're written.
             return stored
-        if self._fernet is None:
+        plaintext, _ = self._reveal(stored)
+        # Wrong or rotated key. Never crash a page render over one bad row.
+        return _UNREADABLE if plaintext is None else plaintext
+
+    def rewrap(self, stored: str) -> str | None:
+        """``stored`` re-encrypted under the primary key and current envelope.
+
+        ``None`` when the value is already current. Raises ``DecryptionFailed``
+        when no accepted key opens it, rather than hand back the placeholder
+        for someone to write over the only copy. Legacy plaintext gets
+        encrypted.
+        """
+        if not stored.startswith((_PREFIX_V1, _PREFIX_V2, _PREFIX_V3)):
+            return self.encrypt(stored)
+        plaintext, key_index = self._reveal(stored)
+        if plaintext is None:
+            raise DecryptionFailed("no accepted key opens this value")
+        current = (_PREFIX_V1, _PREFIX_V2, _PREFIX_V3)[self.write_version - 1]
+        if key_index == 0 and stored.startswith(current):
+            return None
+        return self.encrypt(plaintext)
+
+    def _reveal(self, stored: str) -> tuple[str | None, int]:
+        """Plaintext of an envelope and the index of the key that opened it.
+
+        ``(None, -1)`` if none did. Keys are tried primary first, so values
+        already under the primary cost one attempt.
+        """
+        if not self._fernets:
             raise EncryptionNotConfigured(
                 "ENCRYPTION_KEY is not set; cannot decrypt stored data."
             )
-        token = stored[len(_PREFIX) :].encode("ascii")
-        try:
-            return self._fernet.decrypt(token).decode("utf-8")
-        except InvalidToken:
-            # Wrong or rotated key. Never crash a page render over one bad row.
+        if stored.startswith(_PREFIX_V1):
+            token = stored[len(_PREFIX_V1) :].encode("ascii")
+            for index, fernet in enumerate(self._fernets):
+                try:
+                    return fernet.decrypt(token).decode("utf-8"), index
+                except InvalidToken:
+                    continue
             logger.error("Failed to decrypt a stored value: key mismatch or corruption.")
-            return "[unable to decrypt this message]"
+            return None, -1
+
+        prefix = _PREFIX_V3 if stored.startswith(_PREFIX_V3) else _PREFIX_V2
+        data, index = self._open(prefix, stored)
+        if data is None or prefix == _PREFIX_V2:
+            return (None if data is None else data.decode("utf-8")), index
+        return self._unpack_v3(data), index
+
+    @staticmethod
+    def _unpack_v3(data: bytes) -> str | None:
+        if not data:
+            return None
+        flag, body = data[0], data[1:]
+        if flag == _ZLIB:
+            # Authenticated already, so this is our own output, never attacker input.
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                logger.error("Stored value failed to decompress after authenticating.")
+                return None
+        elif flag != _RAW:
+            logger.error("Stored value has an unknown v3 format byte %s.", flag)
+            return None
+        return body.decode("utf-8")
+
+    def _open(self, prefix: str, stored: str) -> tuple[bytes | None, int]:
+        """Authenticate and decrypt an AES-GCM envelope under the first key
+        that accepts it; ``(None, -1)`` if none does."""
+        try:
+            blob = binascii.a2b_base64(stored[len(prefix) :])
+        except (binascii.Error, ValueError):
+            logger.error("Failed to decrypt a stored value: malformed envelope.")
+            return None, -1
+        nonce, sealed = blob[:_NONCE_BYTES], blob[_NONCE_BYTES:]
+        for index, aead in enumerate(self._aeads):
+            try:
+                return aead.decrypt(nonce, sealed, _AAD[prefix]), index
+            except (InvalidTag, ValueError):
+                continue
+        logger.error("Failed to decrypt a stored value: key mismatch or corruption.")
+        return None, -1
+
+    def decrypt_many(self, values: Sequence[str | None]) -> list[str | None]:
+        """Decrypt a batch of stored values, preserving order and ``None``.
+
+        Inline for small batches. Past a couple of chunks, and with
+        ``decrypt_workers`` above one, chunks run on a shared thread pool --
+        worthwhile only where the crypto backend releases the GIL and the host
+        has cores to spare, which ``benchmarks/bench_decrypt.py`` measures.
+        """
+        if self.decrypt_workers <= 1 or len(values) <= _BULK_CHUNK * 2:
+            return self._decrypt_chunk(values)
+        chunks = [values[i : i + _BULK_CHUNK] for i in range(0, len(values), _BULK_CHUNK)]
+        out: list[str | None] = []
+        for part in _decrypt_pool(self.decrypt_workers).map(self._decrypt_chunk, chunks):
+            out.extend(part)
+        return out
+
+    def _decrypt_chunk(self, values: Sequence[str | None]) -> list[str | None]:
+        decrypt = self.decrypt
+        return [None if v is None else decrypt(v) for v in values]
 
 
 # Bound during create_app(); module-level so the SQLAlchemy type can reach it.
 _encryptor = Encryptor(None)
 
 
-def init_encryption(key: str | bytes | None) -> Encryptor:
+def init_encryption(
+    key: str | bytes | None,
+    *,
+    previous_keys: Sequence[str | bytes] = (),
+    decrypt_workers: int = 0,
+    write_version: int = 3,
+    compress_min_bytes: int = 256,
+) -> Encryptor:
     global _encryptor
-    _encryptor = Encryptor(key)
+    _encryptor = Encryptor(
+        key,
+        previous_keys=previous_keys,
+        decrypt_workers=decrypt_workers,
+        write_version=write_version,
+        compress_min_bytes=compress_min_bytes,
+    )
     return _encryptor
 
 
@@ -116,3 +367,15 @@ class EncryptedText(TypeDecorator):
         if value is None:
             return None
         return _encryptor.decrypt(value)
+
+
+def ciphertext(column):
+    """Select an ``EncryptedText`` column as its stored string, undecrypted.
+
+    For bulk reads that decrypt with ``decrypt_many`` instead of row by row.
+    """
+    return type_coerce(column, Text).label(column.key)
+
+
+def decrypt_many(values: Sequence[str | None]) -> list[str | None]:
+    return _encryptor.decrypt_many(values)
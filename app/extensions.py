@@ -16,6 +16,8 @@ from flask_wtf import CSRFProtect
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
 
+from . import ratelimit  # noqa: F401  -- registers the sqlite:// limiter storage
+
 db = SQLAlchemy()
 migrate = Migrate()
 csrf = CSRFProtect()
@@ -0,0 +1,85 @@
+"""In-process metrics, served at ``/metrics`` in Prometheus text format.
+
+Deliberately tiny: counters, histograms with fixed buckets, and gauges read
+from a callable at scrape time. Each gunicorn worker keeps its own numbers,
+so every sample carries a ``pid`` label and a scraper sees whichever worker
+answered; sum across pids for the deployment.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections.abc import Callable
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._buckets: dict[str, tuple[float, ...]] = {}
+
+    def counter(self, name: str, help: str) -> None:
+        self._help[name] = ("counter", help)
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> None:
+        self._help[name] = ("gauge", help)
+        self._gauges[name] = read
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...]) -> None:
+        self._help[name] = ("histogram", help)
+        self._buckets[name] = tuple(sorted(buckets))
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        for bound in self._buckets[name]:
+            if value <= bound:
+                self.inc(f"{name}_bucket", le=f"{bound:g}", **labels)
+        self.inc(f"{name}_bucket", le="+Inf", **labels)
+        self.inc(f"{name}_sum", value, **labels)
+        self.inc(f"{name}_count", **labels)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def value(self, name: str, **labels: str) -> float:
+        if name in self._gauges:
+            return self._gauges[name]()
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self) -> str:
+        pid = str(os.getpid())
+        with self._lock:
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, help) in sorted(self._help.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "gauge":
+                samples = [(name, (), self._gauges[name]())]
+            else:
+                series = {name} if kind == "counter" else {
+                    f"{name}_bucket", f"{name}_sum", f"{name}_count"
+                }
+                samples = [(n, labels, v) for (n, labels), v in counters.items() if n in series]
+            for series_name, labels, value in sorted(samples, key=_sample_order):
+                rendered = ",".join(f'{k}="{v}"' for k, v in (*labels, ("pid", pid)))
+                lines.append(f"{series_name}{{{rendered}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample) -> tuple:
+    # Buckets in numeric order, +Inf last, as Prometheus expects.
+    name, labels, _ = sample
+    le = dict(labels).get("le")
+    bound = float("inf") if le == "+Inf" else float(le) if le is not None else 0.0
+    return name, tuple(kv for kv in labels if kv[0] != "le"), bound
+
+
+def init_metrics(app) -> Metrics:
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    return metrics
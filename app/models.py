@@ -3,6 +3,9 @@
 Two deliberate departures from the original schema:
 
 1. Message content, mood notes and conversation summaries use ``EncryptedText``.
+   Those columns are also deferred: loading a row does not decrypt them, and
+   queries that render the plaintext ask for it with ``undefer``. Most reads --
+   listings, counts, insights, risk scans -- never look at the text.
 2. Check-ins are a normalised table instead of a JSON blob in a ``streak_history``
    column. The old design required parsing JSON behind a bare ``except:`` on every
    read and could not be queried, indexed, or corrected without a rewrite.
@@ -24,13 +27,15 @@ from sqlalchemy import (
     String,
     Text,
     UniqueConstraint,
+    cast,
     func,
+    select,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from werkzeug.security import check_password_hash, generate_password_hash
 
 from .crypto import EncryptedText
 from .extensions import db
+from .passwords import hash_password, needs_rehash, verify_password
 
 
 def utcnow() -> datetime:
@@ -87,15 +92,29 @@ class User(db.Model):
     safety_plan: Mapped[SafetyPlan | None] = relationship(
         cascade="all, delete-orphan", passive_deletes=True, uselist=False
     )
+    streak_state: Mapped[StreakState | None] = relationship(
+        cascade="all, delete-orphan", passive_deletes=True, uselist=False
+    )
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         # Column defaults are applied at INSERT, so this is still None on a
         # freshly constructed User. Coalesce rather than crash on registration.
         self.session_version = (self.session_version or 0) + 1
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def upgrade_password_hash(self, password: str) -> bool:
+        """Re-hash a just-verified password if it was stored at a lower cost.
+
+        Same password, so unlike ``set_password`` this leaves existing
+        sessions alone. Returns whether anything changed.
+        """
+        if not needs_rehash(self.password_hash):
+            return False
+        self.password_hash = hash_password(password)
+        return True
 
     def __repr__(self) -> str:  # pragma: no cover - debug helper
         return f"<User {self.username}>"
@@ -110,7 +129,7 @@ class Conversation(db.Model):
     )
     title: Mapped[str | None] = mapped_column(String(200))
     # Rolling summary of turns that have aged out of the verbatim window.
-    summary: Mapped[str | None] = mapped_column(EncryptedText)
+    summary: Mapped[str | None] = mapped_column(EncryptedText, deferred=True)
     summarised_upto: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
     updated_at: Mapped[datetime] = mapped_column(
@@ -134,7 +153,7 @@ class Message(db.Model):
         ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True
     )
     role: Mapped[str] = mapped_column(String(16), nullable=False)  # user | assistant
-    content: Mapped[str] = mapped_column(EncryptedText, nullable=False)
+    content: Mapped[str] = mapped_column(EncryptedText, nullable=False, deferred=True)
     risk_level: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=utcnow, index=True
@@ -149,6 +168,23 @@ class Message(db.Model):
         return RiskLevel.from_value(self.risk_level)
 
 
+class MessageToken(db.Model):
+    """Blind index over message text, for search.
+
+    One row per distinct word per message. ``token`` is a keyed HMAC of the
+    normalised word (``Encryptor.blind_index``), never the word itself, so the
+    table can be matched against but not read. Built in ``services.search``.
+    """
+
+    __tablename__ = "message_tokens"
+
+    # Token first: a search is an index range scan per word.
+    token: Mapped[str] = mapped_column(String(32), primary_key=True)
+    message_id: Mapped[int] = mapped_column(
+        ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True, index=True
+    )
+
+
 class MoodEntry(db.Model):
     __tablename__ = "mood_entries"
 
@@ -161,7 +197,7 @@ class MoodEntry(db.Model):
     # Comma-separated top emotions, e.g. "sadness,fear,disappointment".
     emotions: Mapped[str | None] = mapped_column(String(255))
     risk_level: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
-    excerpt: Mapped[str | None] = mapped_column(EncryptedText)
+    excerpt: Mapped[str | None] = mapped_column(EncryptedText, deferred=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=utcnow, index=True
     )
@@ -180,7 +216,7 @@ class CheckIn(db.Model):
     )
     checkin_date: Mapped[date] = mapped_column(Date, nullable=False)
     mood_score: Mapped[int | None] = mapped_column(Integer)  # 1..5, optional
-    note: Mapped[str | None] = mapped_column(EncryptedText)
+    note: Mapped[str | None] = mapped_column(EncryptedText, deferred=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
 
     # The database, not application logic, is what guarantees one check-in per
@@ -190,6 +226,38 @@ class CheckIn(db.Model):
     )
 
 
+class StreakState(db.Model):
+    """Streak counters maintained alongside ``checkins``, one row per user.
+
+    ``compute_streaks`` walks every check-in a user has ever made; this row is
+    updated inside the same transaction as each new check-in so a lookup is a
+    single primary-key read. ``current_run`` is the run ending on
+    ``last_checkin`` -- whether it is still alive depends on today's date, so
+    that part is decided at read time. The check-in table stays the source of
+    truth: ``flask check-streaks`` compares the two, and
+    ``services.streaks.rebuild`` recomputes a row from scratch.
+    """
+
+    __tablename__ = "streak_states"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    current_run: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    longest_run: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_checkins: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_checkin: Mapped[date | None] = mapped_column(Date)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow
+    )
+
+    def to_dict(self, today: date | None = None) -> dict:
+        """Same shape as ``compute_streaks``."""
+        return streak_dict(
+            self.longest_run, self.current_run, self.total_checkins, self.last_checkin, today
+        )
+
+
 class SafetyPlan(db.Model):
     """A Stanley-Brown safety plan, in the user's own words.
 
@@ -285,23 +353,11 @@ class AuditEvent(db.Model):
 # ---------------------------------------------------------------------------
 
 
-def compute_streaks(user_id: int, today: date | None = None) -> dict:
-    """Derive streak stats from the check-in table.
-
-    Replaces the old ``user_streaks`` row that was mutated in place. Because
-    the numbers are derived rather than stored, they cannot drift out of sync
-    with reality, and a missed write can no longer silently reset someone's
-    progress.
-    """
-    today = today or date.today()
-    rows = (
-        db.session.query(CheckIn.checkin_date)
-        .filter(CheckIn.user_id == user_id)
-        .order_by(CheckIn.checkin_date.asc())
-        .all()
-    )
-    days = [r[0] for r in rows]
-    if not days:
+def streak_dict(
+    longest: int, trailing: int, total: int, last: date | None, today: date | None = None
+) -> dict:
+    """The public streak shape, from a run summary ending on ``last``."""
+    if last is None:
         return {
             "current_streak": 0,
             "longest_streak": 0,
@@ -309,33 +365,97 @@ def compute_streaks(user_id: int, today: date | None = None) -> dict:
             "last_checkin": None,
             "checked_in_today": False,
         }
+    today = today or date.today()
+    # A streak stays alive if the last check-in was today or yesterday; miss two
+    # days and it resets. Being mid-day on day N+1 should not break a streak.
+    return {
+        "current_streak": trailing if (today - last).days <= 1 else 0,
+        "longest_streak": longest,
+        "total_checkins": total,
+        "last_checkin": last.isoformat(),
+        "checked_in_today": last == today,
+    }
 
+
+def streak_runs(days: list[date]) -> tuple[int, int]:
+    """``(longest run, run ending on the last day)`` for ascending, distinct dates."""
+    if not days:
+        return 0, 0
     longest = run = 1
     for prev, cur in zip(days, days[1:], strict=False):
         run = run + 1 if (cur - prev).days == 1 else 1
         longest = max(longest, run)
+    return longest, run
 
-    # A streak stays alive if the last check-in was today or yesterday; miss two
-    # days and it resets. Being mid-day on day N+1 should not break a streak.
-    last = days[-1]
-    gap = (today - last).days
-    if gap > 1:
-        current = 0
+
+def streak_summary_python(user_id: int) -> tuple[int, int, int, date | None]:
+    """``(longest, trailing run, total, last date)`` by walking every check-in."""
+    rows = (
+        db.session.query(CheckIn.checkin_date)
+        .filter(CheckIn.user_id == user_id)
+        .order_by(CheckIn.checkin_date.asc())
+        .all()
+    )
+    days = [r[0] for r in rows]
+    longest, trailing = streak_runs(days)
+    return longest, trailing, len(days), (days[-1] if days else None)
+
+
+def streak_summary_sql(user_id: int) -> tuple[int, int, int, date | None]:
+    """Same as ``streak_summary_python``, computed by the database in one query.
+
+    Gaps and islands: within a run of consecutive days, ``day - ROW_NUMBER()``
+    is constant, so grouping on it yields one row per run. Only the per-run
+    aggregates cross the wire, never the dates themselves. Day arithmetic is
+    the one dialect difference -- Postgres subtracts an integer from a date
+    directly, SQLite needs ``julianday()`` -- and both have had window
+    functions for years (SQLite since 3.25).
+    """
+    position = func.row_number().over(order_by=CheckIn.checkin_date)
+    if db.session.get_bind().dialect.name == "sqlite":
+        island = func.julianday(CheckIn.checkin_date) - position
     else:
-        current = 1
-        for prev, cur in zip(reversed(days), reversed(days[:-1]), strict=False):
-            if (prev - cur).days == 1:
-                current += 1
-            else:
-                break
+        island = CheckIn.checkin_date - cast(position, Integer)
+
+    numbered = (
+        select(CheckIn.checkin_date.label("day"), island.label("island"))
+        .where(CheckIn.user_id == user_id)
+        .subquery()
+    )
+    runs = (
+        select(func.max(numbered.c.day).label("last_day"), func.count().label("length"))
+        .group_by(numbered.c.island)
+        .subquery()
+    )
+    trailing = select(runs.c.length).order_by(runs.c.last_day.desc()).limit(1).scalar_subquery()
+    longest, total, last, current = db.session.execute(
+        select(
+            func.max(runs.c.length),
+            func.coalesce(func.sum(runs.c.length), 0),
+            func.max(runs.c.last_day),
+            trailing,
+        )
+    ).one()
+    if isinstance(last, str):  # SQLite hands aggregates back untyped
+        last = date.fromisoformat(last)
+    return longest or 0, current or 0, int(total), last
 
-    return {
-        "current_streak": current,
-        "longest_streak": longest,
-        "total_checkins": len(days),
-        "last_checkin": last.isoformat(),
-        "checked_in_today": last == today,
-    }
+
+def compute_streaks(user_id: int, today: date | None = None) -> dict:
+    """Derive streak stats from the check-in table.
+
+    Replaces the old ``user_streaks`` row that was mutated in place. Because
+    the numbers are derived rather than stored, they cannot drift out of sync
+    with reality, and a missed write can no longer silently reset someone's
+    progress. Request paths read ``StreakState`` instead; this is the
+    reference it is rebuilt from and checked against.
+    """
+    return streak_dict(*streak_summary_python(user_id), today)
+
+
+def compute_streaks_sql(user_id: int, today: date | None = None) -> dict:
+    """``compute_streaks`` with the run detection pushed into the database."""
+    return streak_dict(*streak_summary_sql(user_id), today)
 
 
 def checkin_calendar(user_id: int, days: int = 30, today: date | None = None) -> list[dict]:
@@ -347,7 +467,11 @@ def checkin_calendar(user_id: int, days: int = 30, today: date | None = None) ->
         .filter(CheckIn.user_id == user_id, CheckIn.checkin_date >= start)
         .all()
     )
-    by_date = {r[0]: r[1] for r in rows}
+    return calendar_cells({r[0]: r[1] for r in rows}, start, days)
+
+
+def calendar_cells(by_date: dict[date, int | None], start: date, days: int) -> list[dict]:
+    """Calendar cells from ``{checkin_date: mood_score}`` for ``days`` days from ``start``."""
     out = []
     for offset in range(days):
         d = start + timedelta(days=offset)
@@ -367,13 +491,19 @@ __all__ = [
     "User",
     "Conversation",
     "Message",
+    "MessageToken",
     "MoodEntry",
     "CheckIn",
     "SafetyPlan",
+    "StreakState",
     "AuditEvent",
     "RiskLevel",
     "compute_streaks",
+    "compute_streaks_sql",
+    "streak_dict",
+    "streak_runs",
     "checkin_calendar",
+    "calendar_cells",
     "utcnow",
     "func",
 ]
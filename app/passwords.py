@@ -0,0 +1,164 @@
+"""Password hashing, off the request threads.
+
+scrypt is meant to be expensive -- at the default cost one hash is ~100 ms of
+CPU and 32 MB of memory. Run inline on a gunicorn thread, every login and
+registration competed with the chat requests sharing that worker, and a
+burst of logins could stack up as many concurrent hashes as there were
+threads. Here hashing runs in a small process pool per worker with a fixed
+number of slots: ``PASSWORD_HASH_WORKERS`` processes plus
+``PASSWORD_HASH_QUEUE`` waiting jobs. Past that, ``PasswordHashingBusy`` is
+raised and the caller answers 503 straight away rather than queueing
+indefinitely.
+
+The cost is ``PASSWORD_HASH_METHOD``, in werkzeug's own format
+(``scrypt:N:r:p`` or ``pbkdf2:sha256:iterations``); ``flask calibrate-hash``
+measures what this host can afford. Hashes made with a cheaper setting are
+upgraded at the next successful login -- the only moment the password is
+available to do it -- via ``needs_rehash``.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+# Longest a request waits for a hash, queue time included.
+_TIMEOUT_SECONDS = 15
+
+
+class PasswordHashingBusy(RuntimeError):
+    """Every hashing slot is taken; try again shortly."""
+
+
+def _cost(method: str) -> tuple[str, tuple[int, ...]] | None:
+    """``("scrypt", (N, r, p))`` or ``("pbkdf2:sha256", (iterations,))``.
+
+    ``None`` for anything this module does not know how to compare.
+    """
+    parts = method.split(":")
+    try:
+        if parts[0] == "scrypt":
+            n, r, p = (int(x) for x in parts[1:4]) if len(parts) == 4 else (2**15, 8, 1)
+            return "scrypt", (n, r, p)
+        if parts[0] == "pbkdf2":
+            digest = parts[1] if len(parts) > 1 else "sha256"
+            iterations = int(parts[2]) if len(parts) > 2 else 600_000
+            return f"pbkdf2:{digest}", (iterations,)
+    except ValueError:
+        return None
+    return None
+
+
+class PasswordHasher:
+    def __init__(self, method: str = DEFAULT_METHOD, *, workers: int = 1, queue: int = 8):
+        self.method = method
+        self.workers = max(workers, 0)
+        self._slots = threading.BoundedSemaphore(self.workers + max(queue, 0) or 1)
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Started on first use, not at import: gunicorn forks workers after
+        # import. forkserver children start from a clean process rather than
+        # a copy of a threaded worker.
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    method = (
+                        "forkserver"
+                        if "forkserver" in multiprocessing.get_all_start_methods()
+                        else "spawn"
+                    )
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                    )
+        return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy("all password hashing slots are in use")
+        pool = self._executor()
+        try:
+            future: Future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            return self._after_break(pool, fn, *args)
+        # Freed when the job ends, not when a caller stops waiting for it, so
+        # the slots bound the work actually outstanding in the pool.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=_TIMEOUT_SECONDS)
+        except FutureTimeout as exc:
+            raise PasswordHashingBusy("password hashing timed out") from exc
+        except BrokenProcessPool:
+            return self._after_break(pool, fn, *args)
+
+    def _after_break(self, pool: ProcessPoolExecutor, fn, *args):
+        # A child died (OOM-killed, most likely). Start a fresh pool next
+        # time and do this one inline rather than fail a login over it.
+        logger.exception("Password hashing pool broke; rebuilding it.")
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return fn(*args)
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Whether ``pwhash`` was made with a cheaper or different method."""
+        stored, wanted = _cost(pwhash.split("$", 1)[0]), _cost(self.method)
+        if stored is None or wanted is None:
+            return stored != wanted
+        return stored[0] != wanted[0] or any(
+            have < want for have, want in zip(stored[1], wanted[1], strict=True)
+        )
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+# Bound during create_app(); module-level so the User model can reach it.
+_hasher = PasswordHasher(workers=0)
+
+
+def init_passwords(method: str = DEFAULT_METHOD, *, workers: int = 1, queue: int = 8):
+    global _hasher
+    _hasher.shutdown()
+    _hasher = PasswordHasher(method, workers=workers, queue=queue)
+    return _hasher
+
+
+def get_hasher() -> PasswordHasher:
+    return _hasher
+
+
+def hash_password(password: str) -> str:
+    return _hasher.hash(password)
+
+
+def verify_password(pwhash: str, password: str) -> bool:
+    return _hasher.verify(pwhash, password)
+
+
+def needs_rehash(pwhash: str) -> bool:
+    return _hasher.needs_rehash(pwhash)
@@ -0,0 +1,201 @@
+"""Rate-limit storage shared by every worker on one host, without Redis.
+
+``memory://`` keeps counters inside each gunicorn worker, so with four
+workers a "10 per 15 minutes" login limit is really forty. Redis fixes that
+at the cost of a network round trip on every limited request, plus a server
+to run. Most deployments of this app are one box, and for one box a SQLite
+file in WAL mode does the job: every worker opens the same file, writers
+serialise on SQLite's own lock, and a limit check is a local transaction of
+a few microseconds.
+
+Selected with ``RATELIMIT_STORAGE_URI=sqlite:///ratelimit.db``. A relative
+path is taken from the instance folder, as for ``DATABASE_URL`` (see
+``resolve_uri``); four slashes give an absolute one. Importing this module
+registers the scheme with ``limits``.
+
+Supports both fixed-window counters and the moving window, which stores one
+row per hit and is what ``RATELIMIT_STRATEGY=moving-window`` uses. A fixed
+window lets a client spend two windows' worth across a boundary, so the
+moving window is worth turning on with this storage. Rows are
+kept only until they expire; the file never needs maintenance and can be
+deleted at any time, which resets every limit.
+
+Not for more than one host: a file on shared storage will not give SQLite
+the locking it relies on. Use Redis there.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from limits.storage import MovingWindowSupport, Storage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT NOT NULL,
+    at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS ix_events_key_at ON events (key, at);
+CREATE INDEX IF NOT EXISTS ix_events_expires_at ON events (expires_at);
+"""
+
+# How often one worker sweeps out rows for keys nobody has hit since.
+_SWEEP_SECONDS = 60
+
+
+def resolve_uri(uri: str, instance_path: str) -> str:
+    """``sqlite:///ratelimit.db`` -> the file in ``instance_path``, not in
+    whatever directory the server happened to start in. Other URIs, and
+    absolute paths, are returned as they are."""
+    prefix = "sqlite:///"
+    if not uri.startswith(prefix) or uri.startswith(prefix + "/"):
+        return uri
+    return prefix + os.path.join(instance_path, uri[len(prefix):])
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        path = urlparse(uri).path
+        # sqlite:///relative.db -> "/relative.db"; sqlite:////abs.db -> "//abs.db"
+        self.path = path[1:] if path.startswith("/") else path
+        if not self.path:
+            raise ValueError("sqlite:// rate-limit storage needs a file path")
+        self.timeout = float(options.get("timeout", 5.0))
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._connection().executescript(_SCHEMA)
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    # --- connections ---------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        # One per thread, and a fresh one in a forked child: a connection
+        # must not cross either boundary.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Counters are disposable; losing the last few on power loss is fine.
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _maybe_sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + _SWEEP_SECONDS
+        conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM events WHERE expires_at <= ?", (now,))
+
+    # Each check below is one statement, which SQLite runs as its own write
+    # transaction: no BEGIN/COMMIT round trip, and no gap between reading a
+    # count and acting on it for another worker to slip into.
+
+    # --- fixed window --------------------------------------------------------
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._connection()
+        self._maybe_sweep(conn, now)
+        (value,) = conn.execute(
+            """
+            INSERT INTO counters (key, value, expires_at) VALUES (:key, :amount, :expires)
+            ON CONFLICT (key) DO UPDATE SET
+                value = CASE WHEN expires_at <= :now THEN :amount ELSE value + :amount END,
+                expires_at = CASE WHEN expires_at <= :now THEN :expires ELSE expires_at END
+            RETURNING value
+            """,
+            {"key": key, "amount": amount, "expires": now + expiry, "now": now},
+        ).fetchone()
+        return value
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires_at FROM counters WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    # --- moving window -------------------------------------------------------
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        conn = self._connection()
+        self._maybe_sweep(conn, now)
+        # Hits that have slid out of the window are ignored, not deleted; the
+        # sweep gets them. Deleting on every hit would double the writes.
+        inserted = conn.execute(
+            """
+            INSERT INTO events (key, at, expires_at, amount)
+            SELECT :key, :now, :expires, :amount
+            WHERE (
+                SELECT coalesce(sum(amount), 0) FROM events WHERE key = :key AND at > :start
+            ) + :amount <= :limit
+            """,
+            {
+                "key": key,
+                "now": now,
+                "expires": now + expiry,
+                "amount": amount,
+                "start": now - expiry,
+                "limit": limit,
+            },
+        ).rowcount
+        return inserted == 1
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> tuple[float, int]:
+        now = time.time()
+        oldest, count = self._connection().execute(
+            "SELECT min(at), coalesce(sum(amount), 0) FROM events WHERE key = ? AND at > ?",
+            (key, now - expiry),
+        ).fetchone()
+        return (oldest if oldest is not None else now), count
+
+    # --- housekeeping --------------------------------------------------------
+
+    def clear(self, key: str) -> None:
+        conn = self._connection()
+        conn.execute("DELETE FROM counters WHERE key = ?", (key,))
+        conn.execute("DELETE FROM events WHERE key = ?", (key,))
+
+    def reset(self) -> int | None:
+        conn = self._connection()
+        return (
+            conn.execute("DELETE FROM counters").rowcount
+            + conn.execute("DELETE FROM events").rowcount
+        )
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
@@ -2,18 +2,184 @@
 
 from __future__ import annotations
 
+import atexit
 import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import suppress
+from dataclasses import dataclass
 from functools import wraps
+from itertools import chain
 
-from flask import current_app, flash, g, jsonify, redirect, request, session, url_for
+from flask import (
+    current_app,
+    flash,
+    g,
+    has_app_context,
+    jsonify,
+    redirect,
+    request,
+    session,
+    url_for,
+)
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 
 from .extensions import db
-from .models import AuditEvent, User
+from .models import AuditEvent, User, utcnow
+
+logger = logging.getLogger(__name__)
 
 SESSION_USER_ID = "uid"
 SESSION_VERSION = "sv"
 
 
+@dataclass(frozen=True)
+class AuthUser:
+    """What a request needs to know about whoever is logged in.
+
+    ``g.user`` holds one of these rather than a ``User`` row, so resolving it
+    can be served from ``AuthCache``. Views that need the full row -- the
+    account page, password change, deletion -- ask for
+    ``current_user_record()``.
+    """
+
+    id: int
+    username: str
+    session_version: int
+    is_active: bool
+
+
+class AuthCache:
+    """Per-worker cache of ``AuthUser`` by id, each entry good for ``ttl`` seconds.
+
+    Every logged-in request used to read the ``users`` row just to compare two
+    fields against the cookie. Now that read happens about once per TTL per
+    worker. Any commit in this process that touches a ``User`` -- password
+    change, deactivation, deletion -- drops the entry at once (see
+    ``_forget_committed_users``).
+
+    Other workers on the host hear of it through ``epoch_path``: a commit that
+    changes who may stay logged in appends a byte to it, and each lookup
+    compares its size and mtime -- a ``stat``, not a query -- with the last
+    seen, clearing the cache when they differ. Workers on other hosts still
+    find out within ``AUTH_CACHE_SECONDS``.
+    """
+
+    EPOCH_MAX_BYTES = 4096
+
+    def __init__(self, ttl: float, max_entries: int = 10_000, epoch_path: str | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.epoch_path = epoch_path
+        self._entries: dict[int, tuple[float, AuthUser]] = {}
+        self._lock = threading.Lock()
+        self._epoch = self._read_epoch()
+
+    def get(self, user_id: int) -> AuthUser | None:
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            with self._lock:
+                self._entries.clear()
+                self._epoch = epoch
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, user: AuthUser) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(user.id, None)
+            if len(self._entries) >= self.max_entries:
+                # Oldest insertion first; dicts keep order.
+                del self._entries[next(iter(self._entries))]
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+
+    def forget(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def bump_epoch(self) -> None:
+        """Tell every worker on this host to drop its cached users."""
+        if self.epoch_path is None:
+            return
+        try:
+            # Growing by a byte changes the size even when two bumps land
+            # within the filesystem's mtime resolution.
+            full = os.path.getsize(self.epoch_path) >= self.EPOCH_MAX_BYTES
+        except OSError:
+            full = False
+        try:
+            with open(self.epoch_path, "w" if full else "a") as handle:
+                handle.write(".")
+        except OSError as exc:
+            logger.warning("Could not bump the auth epoch at %s: %s", self.epoch_path, exc)
+
+    def _read_epoch(self) -> tuple[int, int] | None:
+        if self.epoch_path is None:
+            return None
+        try:
+            stat = os.stat(self.epoch_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+
+def init_auth_cache(app) -> None:
+    epoch_path = None
+    # One test process is one worker, and the suite must not write into the
+    # repo's instance folder; tests that need the file point it at tmp_path.
+    if app.config["AUTH_CACHE_SECONDS"] > 0 and not app.testing:
+        os.makedirs(app.instance_path, exist_ok=True)
+        epoch_path = os.path.join(app.instance_path, "auth.epoch")
+    app.extensions["auth_cache"] = AuthCache(
+        app.config["AUTH_CACHE_SECONDS"], epoch_path=epoch_path
+    )
+
+
+# What AuthUser is built from; logins change last_login, which does not count.
+_AUTH_FIELDS = ("username", "session_version", "is_active")
+
+
+@event.listens_for(Session, "after_flush")
+def _note_changed_users(session, flush_context):
+    changed = session.info.setdefault("auth_changed_users", set())
+    changed.update(o.id for o in chain(session.dirty, session.deleted) if isinstance(o, User))
+    if any(isinstance(o, User) for o in session.deleted) or any(
+        isinstance(o, User)
+        and any(inspect(o).attrs[f].history.has_changes() for f in _AUTH_FIELDS)
+        for o in session.dirty
+    ):
+        session.info["auth_epoch_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_users(session):
+    # After commit, not flush: dropping the entry earlier would let a request
+    # in between cache the pre-commit row again.
+    changed = session.info.pop("auth_changed_users", None)
+    stale = session.info.pop("auth_epoch_stale", False)
+    if not changed or not has_app_context():
+        return
+    cache = current_app.extensions.get("auth_cache")
+    if cache is not None:
+        for user_id in changed:
+            cache.forget(user_id)
+        if stale:
+            cache.bump_epoch()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("auth_changed_users", None)
+    session.info.pop("auth_epoch_stale", None)
+
+
 def login_user(user: User) -> None:
     session.clear()  # rotate the session id to defeat session fixation
     session[SESSION_USER_ID] = user.id
@@ -31,22 +197,45 @@ def load_current_user() -> None:
     user_id = session.get(SESSION_USER_ID)
     if not user_id:
         return
-    user = db.session.get(User, user_id)
+    cookie_version = session.get(SESSION_VERSION)
+    cache = current_app.extensions.get("auth_cache")
+    user = cache.get(user_id) if cache is not None else None
+    if user is None or user.session_version != cookie_version:
+        # A miss, or a cookie this worker's copy disagrees with -- possibly one
+        # issued by another worker after a password change. The database decides.
+        user = _load_auth_user(user_id)
+        if user is not None and cache is not None:
+            cache.put(user)
     if user is None or not user.is_active:
         session.clear()
         return
     # A password change or "log out everywhere" bumps session_version, which
     # invalidates every cookie issued before it.
-    if session.get(SESSION_VERSION) != user.session_version:
+    if cookie_version != user.session_version:
         session.clear()
         return
     g.user = user
 
 
-def current_user() -> User | None:
+def _load_auth_user(user_id: int) -> AuthUser | None:
+    row = (
+        db.session.query(User.id, User.username, User.session_version, User.is_active)
+        .filter(User.id == user_id)
+        .first()
+    )
+    return AuthUser(*row) if row is not None else None
+
+
+def current_user() -> AuthUser | None:
     return getattr(g, "user", None)
 
 
+def current_user_record() -> User | None:
+    """The logged-in user's full ``User`` row, for the few views that need it."""
+    user = current_user()
+    return db.session.get(User, user.id) if user is not None else None
+
+
 def login_required(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
@@ -72,21 +261,149 @@ def hash_ip(ip: str | None) -> str | None:
     return hashlib.sha256(f"{salt}:{ip}".encode()).hexdigest()[:64]
 
 
+_WAKE: dict = {}
+
+
+class AuditWriter:
+    """Writes audit events in batches from a background thread.
+
+    ``audit()`` used to add and commit each event itself, a second transaction
+    on every login, logout and account change. Now it only builds the row and
+    hands it here. A daemon thread inserts whatever has queued up every
+    ``interval`` seconds, or as soon as ``batch_size`` rows are waiting, in
+    one ``INSERT``. The queue is bounded: when the database cannot keep up,
+    events are dropped to the log rather than making requests wait. Anything
+    still queued is written at interpreter exit.
+
+    With ``enabled=False`` each event is written straight away, in the
+    request's session -- the old behaviour, kept for tests and one-off
+    scripts.
+    """
+
+    def __init__(
+        self,
+        app,
+        *,
+        enabled: bool = True,
+        batch_size: int = 100,
+        interval: float = 1.0,
+        max_queue: int = 1000,
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.batch_size = max(batch_size, 1)
+        self.interval = interval
+        self.dropped = 0
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=max(max_queue, 1))
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def submit(self, row: dict) -> None:
+        if not self.enabled:
+            self._write([row], db.session)
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(
+                "Audit queue full; dropped %s (user_id=%s)", row["event"], row["user_id"]
+            )
+
+    def flush(self) -> int:
+        """Write everything queued now, on the calling thread. Returns rows written."""
+        written = 0
+        while batch := self._take(block=False):
+            written += self._write_batch(batch)
+        return written
+
+    def close(self) -> None:
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            with suppress(queue.Full):
+                self._queue.put_nowait(_WAKE)  # don't sit out the rest of the interval
+            thread.join(timeout=self.interval + 5)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        # Started on first use, and again in a forked child, where the
+        # parent's thread does not exist.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _take(self, *, block: bool) -> list[dict]:
+        batch: list[dict] = []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    row = self._queue.get(timeout=timeout)
+                else:
+                    row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is _WAKE:
+                if block:
+                    break
+                continue
+            batch.append(row)
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, rows: list[dict]) -> int:
+        with self.app.app_context():
+            return self._write(rows, db.session)
+
+    def _write(self, rows: list[dict], session) -> int:
+        try:
+            session.execute(AuditEvent.__table__.insert(), rows)
+            session.commit()
+        except Exception:  # auditing must never break the request it describes
+            logger.exception("Failed to write %d audit event(s)", len(rows))
+            session.rollback()
+            return 0
+        return len(rows)
+
+
+def init_audit_writer(app) -> None:
+    app.extensions["audit_writer"] = AuditWriter(
+        app,
+        enabled=app.config["AUDIT_ASYNC"],
+        batch_size=app.config["AUDIT_BATCH_SIZE"],
+        interval=app.config["AUDIT_FLUSH_SECONDS"],
+        max_queue=app.config["AUDIT_QUEUE_SIZE"],
+    )
+
+
 def audit(event: str, *, user_id: int | None = None, detail: str | None = None) -> None:
     """Record a security event. Never stores message content."""
-    try:
-        db.session.add(
-            AuditEvent(
-                user_id=user_id,
-                event=event,
-                detail=(detail or "")[:500] or None,
-                ip_hash=hash_ip(request.remote_addr),
-            )
-        )
-        db.session.commit()
-    except Exception:  # auditing must never break the request it describes
-        current_app.logger.exception("Failed to write audit event %s", event)
-        db.session.rollback()
+    row = {
+        "user_id": user_id,
+        "event": event,
+        "detail": (detail or "")[:500] or None,
+        "ip_hash": hash_ip(request.remote_addr),
+        # Stamped now, not when the batch is written.
+        "created_at": utcnow(),
+    }
+    current_app.extensions["audit_writer"].submit(row)
 
 
 # Inline handlers and styles still live in the templates, so 'unsafe-inline' is
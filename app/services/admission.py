@@ -0,0 +1,209 @@
+"""Admission control and risk-priority scheduling for chat generation.
+
+A gunicorn worker has a handful of threads and a generation call holds one
+for many seconds. Without a limit, a burst of chat traffic takes every
+thread, and ``/healthz``, ``/resources`` and the crisis resources wait
+behind language-model calls they have nothing to do with.
+
+``GenerationGate`` caps the number of generations a worker runs at once
+(``GENERATION_CONCURRENCY``) and lets a few more wait briefly for a slot
+(``GENERATION_QUEUE`` requests, ``GENERATION_QUEUE_SECONDS`` each). Anyone
+past that is shed: ``counselor.respond`` answers at once with the same
+fallback it gives when the model fails, crisis resources included. Keep
+concurrency plus queue below gunicorn's ``--threads`` and the rest are
+always free for everything else.
+
+Waiting is not first come, first served. Each request carries its
+``RiskLevel`` and a freed slot goes to the most urgent waiter, so a "hi"
+never delays someone disclosing thoughts of suicide. HIGH and IMMINENT turns
+always go first, and when the queue is full they take the place of the
+least urgent waiter rather than being turned away. Below that, a waiter
+moves up one level for every ``GENERATION_AGING_SECONDS`` it has waited,
+so a steady stream of MODERATE turns cannot hold low-risk ones back
+indefinitely. Aging stops short of HIGH: nothing outranks a crisis.
+
+Only generation is gated. The risk classifiers are short, cached calls and
+are what decide whether a reply carries crisis resources, so they always run.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from ..metrics import Metrics
+from ..models import RiskLevel
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class _Waiter:
+    priority: int
+    seq: int
+    since: float
+    granted: bool = False
+    displaced: bool = False
+    ready: threading.Event = field(default_factory=threading.Event)
+
+
+class GenerationGate:
+    def __init__(
+        self,
+        slots: int,
+        *,
+        queue: int = 0,
+        wait_seconds: float = 0.0,
+        aging_seconds: float = 1.0,
+        metrics: Metrics | None = None,
+    ):
+        self.slots = slots
+        self.queue = max(queue, 0)
+        self.wait_seconds = wait_seconds
+        self.aging_seconds = aging_seconds
+        self.in_flight = 0
+        self._free = max(slots, 0)
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.gauge(
+                "generation_in_flight", "Generations running in this worker.",
+                lambda: self.in_flight,
+            )
+            metrics.gauge(
+                "generation_queue_depth", "Requests waiting for a generation slot.",
+                lambda: self.waiting,
+            )
+            metrics.counter("generation_admitted_total", "Generations given a slot.")
+            metrics.counter(
+                "generation_shed_total", "Requests answered with a fallback instead of queueing."
+            )
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def admit(
+        self, *, priority: int = RiskLevel.NONE, wait: bool = True, timeout: float | None = None
+    ) -> bool:
+        """Take a slot, queueing for one if allowed. ``False`` means shed.
+
+        ``timeout`` shortens the wait below ``wait_seconds`` for a caller
+        with a deadline of its own.
+        """
+        if self.slots <= 0:
+            return True
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                self.in_flight += 1
+                return self._admitted()
+            if not wait:
+                return False  # a caller that would rather skip than queue; not a shed
+            me = _Waiter(int(priority), next(self._seq), time.monotonic())
+            if len(self._waiters) >= self.queue:
+                victim = self._pick(min, displaceable=True) if self._is_urgent(me) else None
+                if victim is None:
+                    return self._shed("queue_full", priority)
+                self._waiters.remove(victim)
+                victim.displaced = True
+                victim.ready.set()
+            self._waiters.append(me)
+
+        me.ready.wait(self.wait_seconds if timeout is None else min(timeout, self.wait_seconds))
+        with self._lock:
+            if me.granted:
+                return self._admitted()
+            if not me.displaced:
+                self._waiters.remove(me)
+        return self._shed("displaced" if me.displaced else "timeout", priority)
+
+    def release(self) -> None:
+        if self.slots <= 0:
+            return
+        with self._lock:
+            self.in_flight -= 1
+            nxt = self._pick(max)
+            if nxt is None:
+                self._free += 1
+                return
+            # Hand the slot straight over, so nobody arriving in between can
+            # take it ahead of the waiter that was chosen.
+            self._waiters.remove(nxt)
+            nxt.granted = True
+            self.in_flight += 1
+        nxt.ready.set()
+
+    @contextmanager
+    def slot(self, *, priority: int = RiskLevel.NONE, wait: bool = True) -> Iterator[bool]:
+        """``with gate.slot() as admitted:`` -- released on exit if taken."""
+        admitted = self.admit(priority=priority, wait=wait)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    # --- scheduling ----------------------------------------------------------
+
+    @staticmethod
+    def _is_urgent(waiter: _Waiter) -> bool:
+        return waiter.priority >= RiskLevel.HIGH
+
+    def _rank(self, waiter: _Waiter, now: float) -> tuple[int, int]:
+        """Higher goes first; on a tie, whoever arrived first."""
+        priority = waiter.priority
+        if not self._is_urgent(waiter) and self.aging_seconds > 0:
+            aged = priority + int((now - waiter.since) / self.aging_seconds)
+            priority = min(aged, RiskLevel.HIGH - 1)
+        return priority, -waiter.seq
+
+    def _pick(self, choose, *, displaceable: bool = False) -> _Waiter | None:
+        """The most (``max``) or least (``min``) deserving waiter. With
+        ``displaceable``, only waiters a crisis turn may push out."""
+        candidates = [w for w in self._waiters if not (displaceable and self._is_urgent(w))]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        return choose(candidates, key=lambda w: self._rank(w, now))
+
+    # --- accounting ----------------------------------------------------------
+
+    def _admitted(self) -> bool:
+        self._count("generation_admitted_total")
+        return True
+
+    def _shed(self, reason: str, priority: int) -> bool:
+        logger.warning(
+            "Generation shed (%s, risk=%s): %d running, %d waiting",
+            reason, RiskLevel.from_value(priority).label, self.in_flight, self.waiting,
+        )
+        self._count("generation_shed_total", reason=reason)
+        return False
+
+    def _count(self, name: str, **labels: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc(name, **labels)
+
+
+# Admits everything; for callers with no gate configured.
+UNGATED = GenerationGate(0)
+
+
+def init_generation_gate(app) -> GenerationGate:
+    gate = GenerationGate(
+        app.config["GENERATION_CONCURRENCY"],
+        queue=app.config["GENERATION_QUEUE"],
+        wait_seconds=app.config["GENERATION_QUEUE_SECONDS"],
+        aging_seconds=app.config["GENERATION_AGING_SECONDS"],
+        metrics=app.extensions.get("metrics"),
+    )
+    app.extensions["generation_gate"] = gate
+    return gate
@@ -9,22 +9,47 @@ model errors, times out, or is not configured, they get a real, human-sounding
 fallback -- and if the assessment said crisis, they get the crisis resources
 regardless of what the model did. There is no path where someone types "I want
 to die" and receives a stack trace or silence.
+
+Nor a long wait. Once assessed, a crisis turn gives the model
+``CRISIS_REPLY_SLO_SECONDS``: if it has not answered by then, the person
+gets the crisis fallback, the
+resources and their safety plan straight away. The model keeps going in the
+background and its reply is stored as a follow-up message, which the chat
+page collects through delta sync.
+
+Under sustained load the ``degradation`` controller sheds optional work --
+affect classifiers, summaries, reply length, guest generation -- one rung at
+a time; see services/degradation.py. Crisis resources never depend on it.
 """
 
 from __future__ import annotations
 
 import logging
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from dataclasses import dataclass, field
+from functools import partial
+
+from flask import current_app
 
 from ..extensions import db
 from ..models import Conversation, Message, MoodEntry, RiskLevel, utcnow
 from . import memory as memory_service
 from . import safety
+from . import search as search_service
+from .admission import UNGATED, GenerationGate
+from .degradation import Degradation, DegradationController
 from .hf_client import GenerationError
 from .prompts import GUEST_NOTICE, build_system_prompt
+from .token_budget import TokenBudget
 
 logger = logging.getLogger(__name__)
 
+TIME_TO_FIRST_HELP = "crisis_time_to_first_help_seconds"
+FOLLOW_UPS = "crisis_follow_ups_total"
+
 
 # Used when generation fails outside a crisis. Deliberately an invitation to
 # keep talking rather than an error message.
@@ -52,8 +77,12 @@ class Reply:
     resources: list[dict] = field(default_factory=list)
     fallback_used: bool = False
     conversation_id: int | None = None
+    # Id of the stored assistant turn, so the client can delta-sync from it.
+    message_id: int | None = None
     # The user's own safety plan, surfaced at high risk. Empty otherwise.
     safety_plan: dict | None = None
+    # The model missed the crisis SLO; its reply will arrive as a new message.
+    follow_up: bool = False
     # True when risk is high and no plan exists yet, so the UI can offer one.
     offer_safety_plan: bool = False
 
@@ -64,8 +93,10 @@ class Reply:
             "resources": self.resources,
             "degraded": self.fallback_used or self.assessment.degraded,
             "conversation_id": self.conversation_id,
+            "message_id": self.message_id,
             "safety_plan": self.safety_plan,
             "offer_safety_plan": self.offer_safety_plan,
+            "follow_up": self.follow_up,
         }
 
 
@@ -76,18 +107,36 @@ def respond(
     config,
     user=None,
     guest_history: list[dict] | None = None,
+    gate: GenerationGate | None = None,
+    degradation: DegradationController | None = None,
+    token_budget: TokenBudget | None = None,
 ) -> Reply:
     """Produce one assistant turn.
 
     ``user`` set  -> conversation is loaded from and written to the database.
     ``user`` None -> guest mode; history comes from the caller and nothing is stored.
+    ``gate``      -> admission control for the generation call; when it sheds
+                     the request, the fallback reply is sent straight away.
+    ``degradation`` -> load controller; its level decides what is skipped.
+    ``token_budget`` -> sizes ``max_tokens`` from recent reply lengths.
     """
+    started = time.monotonic()
     user_input = (user_input or "").strip()
     if not user_input:
         raise ValueError("user_input must not be empty")
-
-    classifier = hf if getattr(hf, "configured", False) else None
-    assessment = safety.assess(user_input, classifier)
+    keepwarm = current_app.extensions.get("keepwarm")
+    if keepwarm is not None:
+        keepwarm.touch()  # real traffic; no keep-warm probes needed
+
+    level = degradation.current() if degradation is not None else Degradation.NORMAL
+    # At the last rung guests are served from the rule layer and canned replies,
+    # leaving the model to signed-in users. The rules still decide on resources.
+    canned = user is None and level >= Degradation.GUESTS_CANNED
+
+    classifier = hf if getattr(hf, "configured", False) and not canned else None
+    assessment = safety.assess(
+        user_input, classifier, affect=level < Degradation.NO_AFFECT
+    )
 
     conversation: Conversation | None = None
     summary: str | None = None
@@ -115,15 +164,42 @@ def respond(
         )
 
     # At imminent risk, a long reply is the wrong reply. Cap it hard.
-    max_tokens = 160 if assessment.level >= RiskLevel.IMMINENT else config["LLM_MAX_TOKENS"]
+    ceiling = 160 if assessment.level >= RiskLevel.IMMINENT else config["LLM_MAX_TOKENS"]
+    if level >= Degradation.SHORT_REPLIES:
+        ceiling = min(ceiling, config["DEGRADED_MAX_TOKENS"])
+    max_tokens = (
+        token_budget.max_tokens(assessment.level, ceiling) if token_budget else ceiling
+    )
     temperature = 0.4 if assessment.is_crisis else config["LLM_TEMPERATURE"]
 
-    fallback_used = False
-    try:
-        text = hf.chat(messages, max_tokens=max_tokens, temperature=temperature)
-    except GenerationError as exc:
-        logger.error("Generation failed (risk=%s): %s", assessment.level.label, exc)
-        fallback_used = True
+    gate = gate or UNGATED
+    slo = config.get("CRISIS_REPLY_SLO_SECONDS") or 0
+    # From here, not from ``started``: the classifiers have their own budget,
+    # and the model should not inherit whatever they left of this one.
+    deadline = time.monotonic() + slo if assessment.is_crisis and slo > 0 else None
+    text, pending, shed = None, None, False
+    if not canned:
+        text, pending, shed = _generate(
+            hf,
+            messages,
+            gate=gate,
+            level=assessment.level,
+            deadline=deadline,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            budget=token_budget,
+            ceiling=ceiling,
+            timeout=config["LLM_TIMEOUT_SECONDS"],
+        )
+        # The ladder hears how the model did. A shed turn is the gate doing
+        # its job, and counting it would feed load shedding back into itself;
+        # a turn past its SLO is counted when the model's reply comes in.
+        if degradation is not None and pending is not None:
+            pending.add_done_callback(partial(_record_late, degradation, started))
+        elif degradation is not None and not shed:
+            degradation.record(time.monotonic() - started, failed=text is None)
+    fallback_used = text is None
+    if text is None:
         text = (
             safety.CRISIS_FALLBACK_MESSAGE
             if assessment.is_crisis
@@ -152,20 +228,208 @@ def respond(
     if user is not None and conversation is not None:
         _persist(conversation, user, user_input, reply, assessment)
         reply.conversation_id = conversation.id
+    if pending is not None:
+        _follow_up(pending, reply, user, assessment.level)
+
+    # Summarising is another generation call. Never queue for it: if no slot is
+    # free right now, the next turn will catch up. Nor make someone in crisis
+    # wait on it. Under load it waits for a quieter moment altogether. Most
+    # turns have nothing to fold in, and those leave the slots alone.
+    if (
+        conversation is not None
+        and not assessment.is_crisis
+        and level < Degradation.NO_SUMMARIES
+    ):
         try:
-            memory_service.maybe_summarise(
-                conversation,
-                hf,
-                trigger=config["MEMORY_SUMMARY_TRIGGER"],
-                window=window,
+            stale = memory_service.messages_to_summarise(
+                conversation, trigger=config["MEMORY_SUMMARY_TRIGGER"], window=window
             )
+            if stale:
+                with gate.slot(wait=False) as admitted:
+                    if admitted:
+                        memory_service.summarise(conversation, hf, stale)
         except Exception:  # summarisation must never break a served reply
             logger.exception("Summarisation raised for conversation %s", conversation.id)
             db.session.rollback()
 
+    if assessment.is_crisis:
+        _observe(
+            TIME_TO_FIRST_HELP,
+            time.monotonic() - started,
+            reply="generated" if not fallback_used else "fallback",
+        )
     return reply
 
 
+def init_generations(app) -> ThreadPoolExecutor:
+    """The pool crisis turns generate on, so respond() can stop waiting at the
+    SLO while the call carries on. Each call holds a generation slot, so it
+    is sized like the gate; with the gate off, to the old fixed eight."""
+    pool = ThreadPoolExecutor(
+        max_workers=app.config["GENERATION_CONCURRENCY"] or 8,
+        thread_name_prefix="crisis-generation",
+    )
+    app.extensions["crisis_generations"] = pool
+    return pool
+
+
+def register_metrics(metrics) -> None:
+    metrics.histogram(
+        TIME_TO_FIRST_HELP,
+        "Seconds from a HIGH or IMMINENT message to the reply with crisis resources.",
+        (0.5, 1, 2, 3, 4, 5, 8, 13, 21, 30),
+    )
+    metrics.counter(FOLLOW_UPS, "Model replies to crisis turns that missed the SLO.")
+
+
+def _observe(name: str, value: float, **labels: str) -> None:
+    metrics = current_app.extensions.get("metrics")
+    if metrics is not None:
+        metrics.observe(name, value, **labels)
+
+
+def _count(name: str, **labels: str) -> None:
+    metrics = current_app.extensions.get("metrics")
+    if metrics is not None:
+        metrics.inc(name, **labels)
+
+
+def _chat(
+    hf,
+    messages: list[dict],
+    level: RiskLevel,
+    *,
+    budget: TokenBudget | None = None,
+    ceiling: int | None = None,
+    timeout: float | None = None,
+    regenerate_by: float | None = None,
+    **kwargs,
+) -> str | None:
+    """``timeout`` bounds the whole call, a regeneration included; that only
+    happens if it can finish, at the pace of the first reply, by then and by
+    ``regenerate_by`` (the crisis SLO, past which the slot is better freed)."""
+    started = time.monotonic()
+    deadline = started + timeout if timeout else None
+    try:
+        reply = hf.chat(messages, deadline=deadline, **kwargs)
+    except GenerationError as exc:
+        logger.error("Generation failed (risk=%s): %s", level.label, exc)
+        return None
+    if budget is None:
+        return reply
+    adaptive = ceiling is not None and kwargs["max_tokens"] < ceiling
+    if getattr(reply, "truncated", False):
+        # Cut off by a budget sized from other replies: this one needs more.
+        now = time.monotonic()
+        cutoff = min(d for d in (deadline, regenerate_by, math.inf) if d is not None)
+        regenerate = adaptive and cutoff - now >= now - started
+        budget.truncated(level, regenerated=regenerate)
+        if regenerate:
+            try:
+                reply = hf.chat(
+                    messages, deadline=deadline, **{**kwargs, "max_tokens": ceiling}
+                )
+            except GenerationError as exc:
+                logger.error("Regeneration failed (risk=%s): %s", level.label, exc)
+                return reply  # a cut-off reply beats the fallback
+    budget.record(level, reply, seconds=time.monotonic() - started, adaptive=adaptive)
+    return reply
+
+
+def _record_late(degradation: DegradationController, started: float, done: Future) -> None:
+    failed = done.exception() is not None or done.result() is None
+    degradation.record(time.monotonic() - started, failed=failed)
+
+
+def _chat_then_release(gate: GenerationGate, hf, messages, level, kwargs) -> str | None:
+    try:
+        return _chat(hf, messages, level, **kwargs)
+    finally:
+        gate.release()
+
+
+def _generate(
+    hf,
+    messages: list[dict],
+    *,
+    gate: GenerationGate,
+    level: RiskLevel,
+    deadline: float | None,
+    **kwargs,
+) -> tuple[str | None, Future | None, bool]:
+    """The model's reply, or ``None`` for the fallback; the call if it is
+    still running; and whether the gate shed the turn.
+
+    With a ``deadline`` the call runs on the app's crisis generation pool; if
+    it misses the deadline it is returned still running, holding its gate
+    slot until done.
+    """
+    # Waiting turns are served most urgent first; see services/admission.py.
+    remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+    if not gate.admit(priority=level, timeout=remaining):
+        return None, None, True
+    if deadline is None:
+        try:
+            return _chat(hf, messages, level, **kwargs), None, False
+        finally:
+            gate.release()
+
+    kwargs["regenerate_by"] = deadline
+    pool = current_app.extensions["crisis_generations"]
+    future = pool.submit(_chat_then_release, gate, hf, messages, level, kwargs)
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0)), None, False
+    except FutureTimeout:
+        logger.warning("Crisis reply missed its SLO (risk=%s); sent the fallback", level.label)
+        return None, future, False
+
+
+def _follow_up(pending: Future, reply: Reply, user, level: RiskLevel) -> None:
+    """Store the late reply as a new message once it arrives.
+
+    Guests have nowhere to receive it -- their history lives in a cookie that
+    has already been sent -- so theirs is dropped.
+    """
+    if user is None or reply.message_id is None:
+        _count(FOLLOW_UPS, outcome="dropped")
+        return
+    reply.follow_up = True
+    pending.add_done_callback(
+        partial(
+            _store_follow_up,
+            current_app._get_current_object(),
+            reply.conversation_id,
+            user.id,
+            level,
+        )
+    )
+
+
+def _store_follow_up(app, conversation_id: int, user_id: int, level: RiskLevel, done) -> None:
+    text = done.result() if done.exception() is None else None
+    with app.app_context():
+        if not text:
+            _count(FOLLOW_UPS, outcome="failed")
+            return
+        try:
+            message = Message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=text,
+                risk_level=int(level),
+            )
+            db.session.add(message)
+            db.session.flush()
+            search_service.index_messages(user_id, [(message.id, text)])
+            db.session.commit()
+        except Exception:  # e.g. the account was deleted in the meantime
+            logger.exception("Could not store follow-up for conversation %s", conversation_id)
+            db.session.rollback()
+            _count(FOLLOW_UPS, outcome="failed")
+            return
+        _count(FOLLOW_UPS, outcome="delivered")
+
+
 def _attach_safety_plan(reply: Reply, user) -> None:
     """Surface the user's plan, or invite them to make one.
 
@@ -196,22 +460,20 @@ def _persist(
     assessment: safety.RiskAssessment,
 ) -> None:
     try:
-        db.session.add(
-            Message(
-                conversation_id=conversation.id,
-                role="user",
-                content=user_input,
-                risk_level=int(assessment.level),
-            )
+        user_turn = Message(
+            conversation_id=conversation.id,
+            role="user",
+            content=user_input,
+            risk_level=int(assessment.level),
         )
-        db.session.add(
-            Message(
-                conversation_id=conversation.id,
-                role="assistant",
-                content=reply.text,
-                risk_level=int(assessment.level),
-            )
+        db.session.add(user_turn)
+        assistant_turn = Message(
+            conversation_id=conversation.id,
+            role="assistant",
+            content=reply.text,
+            risk_level=int(assessment.level),
         )
+        db.session.add(assistant_turn)
         db.session.add(
             MoodEntry(
                 user_id=user.id,
@@ -227,7 +489,14 @@ def _persist(
             conversation.title = user_input[:80]
         # Touch the row so "most recently active conversation" ordering is real.
         conversation.updated_at = utcnow()
+        # Ids are needed for the search index; same transaction, so a turn is
+        # never stored unsearchable.
+        db.session.flush()
+        search_service.index_messages(
+            user.id, [(user_turn.id, user_input), (assistant_turn.id, reply.text)]
+        )
         db.session.commit()
+        reply.message_id = assistant_turn.id
     except Exception:
         # Losing the transcript is bad. Failing the user's request because we
         # could not write it is worse -- they already have their answer.
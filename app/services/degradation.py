@@ -0,0 +1,158 @@
+"""Stepwise degradation under load.
+
+Until now there were two modes: every model on, or Hugging Face down. Under
+pressure -- a slow provider, a traffic spike -- everything stayed on until
+turns started timing out. ``DegradationController`` watches this worker's
+recent chat turns, rolling p95 latency and the share the model failed, and
+sheds optional work one rung at a time:
+
+    0  normal
+    1  no emotion or sentiment classifiers (the suicide classifier stays)
+    2  summarisation deferred
+    3  replies capped at ``DEGRADED_MAX_TOKENS``
+    4  guests get rules-only assessment and the canned replies
+
+Each rung includes the ones before it. The rule layer, crisis resources and
+the safety plan are untouched at every level, and signed-in crisis turns
+are always generated.
+
+The controller steps up one rung when p95 passes ``DEGRADE_P95_SECONDS`` or
+the failure rate passes ``DEGRADE_ERROR_RATE``, and down one rung when both
+are back under half of that. Fewer than ``min_samples`` turns in the window
+is never enough to step up, but unless those few were slow it is enough to
+step down, so a quiet worker drifts back to normal. At most one step per
+``DEGRADE_COOLDOWN_SECONDS`` in either direction, so it settles rather than
+oscillates. Per worker, like everything else held in memory here.
+"""
+
+from __future__ import annotations
+
+import enum
+import threading
+import time
+from collections import deque
+
+from ..metrics import Metrics
+
+
+class Degradation(enum.IntEnum):
+    NORMAL = 0
+    NO_AFFECT = 1
+    NO_SUMMARIES = 2
+    SHORT_REPLIES = 3
+    GUESTS_CANNED = 4
+
+    @property
+    def label(self) -> str:
+        return self.name.lower().replace("_", "-")
+
+
+class DegradationController:
+    def __init__(
+        self,
+        *,
+        p95_seconds: float,
+        error_rate: float,
+        window_seconds: float = 60.0,
+        cooldown_seconds: float = 30.0,
+        min_samples: int = 10,
+        metrics: Metrics | None = None,
+    ):
+        self.p95_seconds = p95_seconds
+        self.error_rate = error_rate
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.min_samples = min_samples
+        self._level = Degradation.NORMAL
+        self._turns: deque[tuple[float, float, bool]] = deque()
+        self._changed_at = float("-inf")
+        self._lock = threading.Lock()
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.gauge(
+                "degradation_level", "Current rung of the degradation ladder (0 = normal).",
+                lambda: int(self._level),
+            )
+            metrics.counter("degradation_changes_total", "Steps taken up or down the ladder.")
+
+    @property
+    def enabled(self) -> bool:
+        return self.p95_seconds > 0
+
+    def current(self) -> Degradation:
+        if not self.enabled:
+            return Degradation.NORMAL
+        with self._lock:
+            self._evaluate(time.monotonic())
+            return self._level
+
+    def record(self, seconds: float, *, failed: bool) -> None:
+        """One turn the model was asked to answer: how long it took, and
+        whether the model failed it."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._turns.append((now, seconds, failed))
+            self._evaluate(now)
+
+    def stats(self) -> dict:
+        level = self.current()
+        with self._lock:
+            p95, error_rate = self._pressure()
+        return {
+            "level": int(level),
+            "name": level.label,
+            "turns": len(self._turns),
+            "p95_seconds": round(p95, 2),
+            "error_rate": round(error_rate, 3),
+        }
+
+    def _expire(self, now: float) -> None:
+        while self._turns and self._turns[0][0] < now - self.window_seconds:
+            self._turns.popleft()
+
+    def _pressure(self) -> tuple[float, float]:
+        if not self._turns:
+            return 0.0, 0.0
+        latencies = sorted(t[1] for t in self._turns)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return p95, sum(t[2] for t in self._turns) / len(self._turns)
+
+    def _evaluate(self, now: float) -> None:
+        self._expire(now)
+        if now - self._changed_at < self.cooldown_seconds:
+            return
+        p95, error_rate = self._pressure()
+        enough = len(self._turns) >= self.min_samples
+        if p95 > self.p95_seconds or error_rate > self.error_rate:
+            if not enough:
+                return
+            step = 1
+        elif not enough or (p95 < self.p95_seconds / 2 and error_rate < self.error_rate / 2):
+            step = -1
+        else:
+            return
+        level = Degradation(min(max(self._level + step, Degradation.NORMAL), max(Degradation)))
+        if level == self._level:
+            return
+        self._level = level
+        self._changed_at = now
+        # Judge the next rung on turns served under it, not the ones that got us here.
+        self._turns.clear()
+        if self._metrics is not None:
+            self._metrics.inc(
+                "degradation_changes_total", direction="up" if step > 0 else "down"
+            )
+
+
+def init_degradation(app) -> DegradationController:
+    controller = DegradationController(
+        p95_seconds=app.config["DEGRADE_P95_SECONDS"],
+        error_rate=app.config["DEGRADE_ERROR_RATE"],
+        window_seconds=app.config["DEGRADE_WINDOW_SECONDS"],
+        cooldown_seconds=app.config["DEGRADE_COOLDOWN_SECONDS"],
+        metrics=app.extensions.get("metrics"),
+    )
+    app.extensions["degradation"] = controller
+    return controller
@@ -12,23 +12,123 @@ Two things this wrapper is responsible for, beyond making HTTP calls:
   with a safe canned response.
 * **Not re-classifying identical text.** A small LRU cache in front of the
   classifiers cuts both latency and token spend on repeated phrases.
+* **Routing generation across a chain of chat models.** ``HF_CHAT_MODEL``
+  comes first, then ``HF_CHAT_FALLBACK_MODELS``. Each keeps an EWMA of its
+  latency and error rate; a turn goes to the first model meeting the latency
+  SLO and fails over down the chain on error, so a slow or unavailable 70B
+  model means a smaller model's reply rather than canned text. A model that
+  was passed over gets one probe request every ``PROBE_SECONDS`` so it can
+  win its place back.
+* **Hedging the tail.** With ``LLM_HEDGE_RATE`` set, a turn that has had no
+  reply by the model's observed p90 (or the latency SLO, if sooner) sends a
+  second request to the next model in the chain -- list the same model
+  under another provider first to hedge like for like. Whichever answers
+  first is used and the other is abandoned; the HTTP client has no way to
+  cancel a call in flight, so it runs out on a pool thread and only its
+  latency is kept. A token bucket holds hedges to that share of turns.
+* **Retrying what is worth retrying.** ``error_class`` sorts failures the
+  way ``flask check-hf`` explains them. Rate limits and cold starts are
+  retried with jittered exponential backoff while the call's time budget
+  allows -- ``LLM_TIMEOUT_SECONDS`` for a turn, ``HF_CLASSIFY_BUDGET_SECONDS``
+  for a classification. A bad token, a gated or missing model, or a
+  provider that does not serve it will fail the same way every time, so
+  they never are.
 """
 
 from __future__ import annotations
 
 import inspect
 import logging
+import math
+import random
 import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
 
 from huggingface_hub import InferenceClient
 
 logger = logging.getLogger(__name__)
 
+# Hedged generations run here so the caller can take whichever finishes first.
+# A loser keeps its thread until its own timeout, so size for that.
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hf-hedge")
+
+CHAT_REQUESTS = "generation_requests_total"
+RETRIES = "hf_retries_total"
+HEDGES = "generation_hedges_total"
+HEDGE_SAVED = "generation_hedge_saved_seconds"
+
 
 class GenerationError(RuntimeError):
     """Raised when the chat model could not produce a response."""
 
 
+class ChatReply(str):
+    """A reply is still just text to every caller; this adds what the provider
+    said about it. ``tokens`` is ``None`` when no usage was reported, and
+    ``truncated`` means generation stopped at ``max_tokens``."""
+
+    tokens: int | None
+    truncated: bool
+
+    def __new__(cls, text: str, *, tokens: int | None = None, truncated: bool = False):
+        reply = super().__new__(cls, text)
+        reply.tokens = tokens
+        reply.truncated = truncated
+        return reply
+
+
+def error_class(exc: BaseException) -> str:
+    """What kind of failure this is: ``auth``, ``gated``, ``not_found``,
+    ``cold_start``, ``rate_limited``, ``no_provider``, ``timeout`` or ``other``.
+
+    The hub's exceptions are not typed by cause, so this reads the HTTP status
+    where there is one and the message otherwise. ``GenerationError`` is
+    looked through to the error it wraps.
+    """
+    cause = exc.__cause__ if isinstance(exc, GenerationError) and exc.__cause__ else exc
+    status = getattr(getattr(cause, "response", None), "status_code", None)
+    msg = f"{status or ''} {exc}"
+    low = msg.lower()
+    if (
+        "401" in msg
+        or "unauthorized" in low
+        or "invalid credentials" in low
+        # The wording the hub actually returns for a bad token -- verified live.
+        or "invalid user token" in low
+        or "invalid token" in low
+    ):
+        return "auth"
+    if "403" in msg or "forbidden" in low or "gated" in low or "awaiting a review" in low:
+        return "gated"
+    if "404" in msg or "not found" in low:
+        return "not_found"
+    if "503" in msg or "loading" in low or "currently loading" in low:
+        return "cold_start"
+    if "429" in msg or "rate limit" in low or "quota" in low:
+        return "rate_limited"
+    if "supported" in low and "provider" in low:
+        return "no_provider"
+    if "timed out" in low or "timeout" in low:
+        return "timeout"
+    return "other"
+
+
+# Backoff (first delay, cap) in seconds for the classes worth retrying. A
+# model loads in tens of seconds, a rate limit clears in a few.
+RETRY_BACKOFF = {
+    "rate_limited": (0.5, 4.0),
+    "cold_start": (2.0, 10.0),
+}
+# A retry is only worth sleeping for if this much time is left after it:
+# enough for a reply, or for a classification, which takes well under a
+# second once the model is up.
+RETRY_MIN_SECONDS = 2.0
+CLASSIFY_RETRY_MIN_SECONDS = 0.5
+
+
 def _build_client(token: str | None, timeout: float, provider: str | None) -> InferenceClient:
     """Construct an InferenceClient across huggingface_hub versions.
 
@@ -52,6 +152,90 @@ def _build_client(token: str | None, timeout: float, provider: str | None) -> In
     return InferenceClient(**kwargs)
 
 
+class ChatRoute:
+    """One chat model in the chain, with its recent latency and error rate."""
+
+    ALPHA = 0.3  # weight of the newest observation
+    MAX_ERROR_RATE = 0.5
+    PROBE_SECONDS = 30.0
+    # Successful latencies kept for the hedging p90, and how many it needs.
+    SAMPLES = 200
+    MIN_SAMPLES = 20
+
+    def __init__(self, model: str, provider: str | None = None):
+        self.model = model
+        self.provider = provider
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.last_used = float("-inf")
+        self._samples: deque[float] = deque(maxlen=self.SAMPLES)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, default_provider: str | None = None) -> ChatRoute:
+        """``org/model`` or ``org/model:provider``."""
+        model, _, provider = spec.partition(":")
+        return cls(model.strip(), provider.strip() or default_provider)
+
+    def __repr__(self) -> str:
+        return self.model if not self.provider else f"{self.model}:{self.provider}"
+
+    def observe(self, seconds: float, *, ok: bool, timed: bool = True) -> None:
+        """``timed=False`` moves only the error rate, for keep-warm probes: a
+        one-token reply's latency says nothing about a full one, and would
+        make a slow model look fit to route to again."""
+        with self._lock:
+            self.error_rate = self.ALPHA * (not ok) + (1 - self.ALPHA) * self.error_rate
+            if not timed:
+                return
+            self.latency = seconds if self.latency is None else (
+                self.ALPHA * seconds + (1 - self.ALPHA) * self.latency
+            )
+            if ok:
+                self._samples.append(seconds)
+
+    def p90(self) -> float | None:
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.9)]
+
+    def healthy(self, slo_seconds: float) -> bool:
+        if self.error_rate > self.MAX_ERROR_RATE:
+            return False
+        return self.latency is None or slo_seconds <= 0 or self.latency <= slo_seconds
+
+    def claim_probe(self, now: float) -> bool:
+        """True, once per ``PROBE_SECONDS``, to whichever turn asks first."""
+        with self._lock:
+            if now - self.last_used < self.PROBE_SECONDS:
+                return False
+            self.last_used = now
+            return True
+
+
+class _HedgeBudget:
+    """Every turn earns ``rate`` of a hedge, up to ``burst``; a hedge spends one."""
+
+    def __init__(self, rate: float, burst: float = 5.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.rate, self.burst)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
 class HuggingFaceService:
     """Thin, defensive wrapper over the HF Inference API."""
 
@@ -63,13 +247,38 @@ class HuggingFaceService:
         suicide_model: str,
         emotion_model: str,
         sentiment_model: str,
+        fallback_chat_models: list[str] | tuple[str, ...] = (),
         provider: str | None = None,
         timeout: float = 25.0,
+        latency_slo: float = 0.0,
+        hedge_rate: float = 0.0,
+        retry_attempts: int = 3,
+        classify_budget: float = 3.0,
         max_tokens: int = 400,
         temperature: float = 0.7,
+        metrics=None,
     ):
         self.token = token
         self.chat_model = chat_model
+        self.chat_routes = [
+            ChatRoute.parse(spec, provider) for spec in (chat_model, *fallback_chat_models)
+        ]
+        self.latency_slo = latency_slo
+        self.hedge_budget = _HedgeBudget(hedge_rate) if hedge_rate > 0 else None
+        self.retry_attempts = max(retry_attempts, 1)
+        self.classify_budget = classify_budget
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.counter(CHAT_REQUESTS, "Generation turns sent to the chat model chain.")
+            metrics.counter(RETRIES, "Hugging Face calls retried, by model and error class.")
+            metrics.counter(
+                HEDGES, "Second requests sent after the first passed its p90, by outcome."
+            )
+            metrics.histogram(
+                HEDGE_SAVED,
+                "Seconds sooner a winning hedge answered than the request it hedged.",
+                (0.5, 1, 2, 4, 8, 15, 30),
+            )
         self.suicide_model = suicide_model
         self.emotion_model = emotion_model
         self.sentiment_model = sentiment_model
@@ -77,6 +286,7 @@ class HuggingFaceService:
         self.temperature = temperature
         self._lock = threading.Lock()
         self._client: InferenceClient | None = None
+        self._clients: dict[tuple[str | None, float], InferenceClient] = {}
         self._timeout = timeout
         self._provider = provider
 
@@ -94,6 +304,26 @@ class HuggingFaceService:
                     self._client = _build_client(self.token, self._timeout, self._provider)
         return self._client
 
+    def _client_for(self, provider: str | None, timeout: float | None = None) -> InferenceClient:
+        """A client for ``provider`` that gives up after ``timeout``, both
+        fixed when it is built, so one is kept per pair. A shorter timeout is
+        rounded down to the half second: an attempt never outlives its
+        deadline, and there are at most a few dozen per provider."""
+        if timeout is None or timeout >= self._timeout:
+            timeout = self._timeout
+        else:
+            timeout = max(math.floor(timeout * 2) / 2, 0.5)
+        if provider == self._provider and timeout == self._timeout:
+            return self.client
+        client = self._clients.get((provider, timeout))
+        if client is None:
+            with self._lock:
+                client = self._clients.get((provider, timeout))
+                if client is None:
+                    client = _build_client(self.token, timeout, provider)
+                    self._clients[(provider, timeout)] = client
+        return client
+
     # -- Generation ---------------------------------------------------------
 
     def chat(
@@ -102,33 +332,234 @@ class HuggingFaceService:
         *,
         max_tokens: int | None = None,
         temperature: float | None = None,
+        route: ChatRoute | None = None,
+        deadline: float | None = None,
     ) -> str:
+        """The first reply the chain produces. ``route`` pins a single model
+        with no failover, for ``flask check-hf``. ``deadline`` (monotonic)
+        ends the call sooner than the timeout, for a second call in one turn."""
         if not self.configured:
             raise GenerationError("HF_TOKEN is not configured.")
+        # Retries, failover and hedges all come out of one timeout.
+        deadline = min(deadline or math.inf, time.monotonic() + self._timeout)
+        kwargs = {
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature if temperature is None else temperature,
+        }
+        if route is not None:
+            return self._chat_once(route, messages, deadline=deadline, **kwargs)
+        self._count(CHAT_REQUESTS)
+        if self.hedge_budget is not None:
+            self.hedge_budget.earn()
+        error: GenerationError | None = None
+        order = self._route_order()
+        tried: set[int] = set()
+        for position, candidate in enumerate(order):
+            if id(candidate) in tried:
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            tried.add(id(candidate))
+            # A model with another behind it gets half of what is left, so a
+            # hung one still leaves time to fail over.
+            if not all(id(r) in tried for r in order):
+                remaining /= 2
+            until = time.monotonic() + remaining
+            try:
+                if position == 0 and self.hedge_budget is not None and len(order) > 1:
+                    reply = self._chat_hedged(
+                        candidate, order[1], messages, tried, deadline=until, **kwargs
+                    )
+                else:
+                    reply = self._chat_once(candidate, messages, deadline=until, **kwargs)
+            except GenerationError as exc:
+                error = exc
+                continue
+            self._probe_lagging(messages, kwargs)
+            return reply
+        raise error or GenerationError("No chat model configured.")
+
+    def _probe_lagging(self, messages: list[dict], kwargs: dict) -> None:
+        """Send the turn just answered to one passed-over model that is due a
+        probe, in the background, so it can win back its place. Nobody waits
+        on it, and it gives up at the SLO it is being measured against."""
+        now = time.monotonic()
+        lagging = [r for r in self.chat_routes if not r.healthy(self.latency_slo)]
+        probe = next((r for r in lagging if r.claim_probe(now)), None)
+        if probe is None:
+            return
+        deadline = now + (self.latency_slo or self._timeout)
+        _hedge_pool.submit(self._chat_once, probe, messages, deadline=deadline, **kwargs)
+
+    def _hedge_delay(self, route: ChatRoute) -> float | None:
+        delays = [d for d in (route.p90(), self.latency_slo) if d]
+        return min(delays) if delays else None
+
+    def _chat_hedged(
+        self,
+        primary: ChatRoute,
+        alternate: ChatRoute,
+        messages: list[dict],
+        tried: set[int],
+        **kwargs,
+    ) -> str:
+        """Send to ``primary``; if it is still out at its p90 and the budget
+        allows, send to ``alternate`` too and take the first reply."""
+        delay = self._hedge_delay(primary)
+        if delay is None:
+            return self._chat_once(primary, messages, **kwargs)
+        first = _hedge_pool.submit(self._chat_once, primary, messages, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.hedge_budget.spend():
+            return first.result()
+
+        tried.add(id(alternate))
+        second = _hedge_pool.submit(self._chat_once, alternate, messages, **kwargs)
+        logger.info("Hedged %r after %.1fs with %r", primary, delay, alternate)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                won = future is second
+                self._count(HEDGES, outcome="won" if won else "lost")
+                if won and first in pending:
+                    first.add_done_callback(partial(self._record_saving, time.monotonic()))
+                return future.result()
+        self._count(HEDGES, outcome="failed")
+        return first.result()  # both failed; raise the primary's error
+
+    def _record_saving(self, won_at: float, primary: Future) -> None:
+        """Once the abandoned request finishes, how much sooner the hedge was."""
+        if primary.exception() is None and self._metrics is not None:
+            self._metrics.observe(HEDGE_SAVED, time.monotonic() - won_at)
+
+    def _count(self, name: str, **labels: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc(name, **labels)
+
+    def _route_order(self) -> list[ChatRoute]:
+        """Models meeting the SLO in chain order, then the rest; the rest are
+        re-measured by ``_probe_lagging``."""
+        healthy = [r for r in self.chat_routes if r.healthy(self.latency_slo)]
+        return healthy + [r for r in self.chat_routes if r not in healthy]
+
+    def _chat_once(
+        self,
+        route: ChatRoute,
+        messages: list[dict],
+        *,
+        timed: bool = True,
+        deadline: float | None = None,
+        **kwargs,
+    ) -> str:
+        def attempt() -> str:
+            route.last_used = started = time.monotonic()
+            try:
+                text = self._complete(route, messages, timeout=deadline - started, **kwargs)
+            except GenerationError:
+                route.observe(time.monotonic() - started, ok=False, timed=timed)
+                raise
+            route.observe(time.monotonic() - started, ok=True, timed=timed)
+            return text
+
+        if deadline is None:
+            deadline = time.monotonic() + self._timeout
+        return self._with_retries(repr(route), deadline, attempt)
+
+    def _with_retries(
+        self, model: str, deadline: float, call, *, min_attempt: float = RETRY_MIN_SECONDS
+    ):
+        """``call()``, retried on rate limits and cold starts while a retry
+        would still have ``min_attempt`` seconds before ``deadline``; ``call``
+        is expected to give up by ``deadline`` itself. Everything else, and
+        the last failure, is raised as it was."""
+        for attempt in range(1, self.retry_attempts + 1):
+            try:
+                return call()
+            except Exception as exc:
+                kind = error_class(exc)
+                if kind not in RETRY_BACKOFF or attempt == self.retry_attempts:
+                    raise
+                first, cap = RETRY_BACKOFF[kind]
+                ceiling = min(cap, first * 2 ** (attempt - 1))
+                delay = random.uniform(ceiling / 2, ceiling)  # jitter spreads the workers out
+                if deadline - (time.monotonic() + delay) < min_attempt:
+                    raise
+                logger.info(
+                    "Retrying %s in %.1fs after %s (attempt %d)", model, delay, kind, attempt
+                )
+                self._count(RETRIES, model=model, error=kind)
+                time.sleep(delay)
+
+    def _complete(
+        self, route: ChatRoute, messages: list[dict], *, timeout: float | None = None, **kwargs
+    ) -> str:
         try:
-            completion = self.client.chat_completion(
-                messages=messages,
-                model=self.chat_model,
-                max_tokens=max_tokens or self.max_tokens,
-                temperature=self.temperature if temperature is None else temperature,
+            completion = self._client_for(route.provider, timeout).chat_completion(
+                messages=messages, model=route.model, **kwargs
             )
         except Exception as exc:
-            logger.error("HF chat completion failed on %s: %s", self.chat_model, exc)
+            logger.error("HF chat completion failed on %r: %s", route, exc)
             raise GenerationError(str(exc)) from exc
 
         try:
-            content = completion.choices[0].message.content
+            choice = completion.choices[0]
+            content = choice.message.content
         except (AttributeError, IndexError, KeyError) as exc:
             raise GenerationError(f"Unexpected completion shape: {exc}") from exc
 
         if not content or not content.strip():
             raise GenerationError("Model returned an empty response.")
-        return content.strip()
+        return ChatReply(
+            content.strip(),
+            tokens=getattr(getattr(completion, "usage", None), "completion_tokens", None),
+            truncated=getattr(choice, "finish_reason", None) == "length",
+        )
+
+    # -- Keep-warm ----------------------------------------------------------
+
+    def warm_up(self) -> list[tuple[str, str, float | None]]:
+        """One tiny uncached call to every model, for ``services/keepwarm.py``.
+
+        Returns ``(kind, model, seconds)`` per model, ``seconds`` ``None`` on
+        failure. Chat probes feed each route's error rate, so routing sees a
+        cold or failing model before a person does, but not its latency or the
+        hedging p90, as a one-token reply says nothing about a full one.
+        """
+        results: list[tuple[str, str, float | None]] = []
+        for model in (self.suicide_model, self.emotion_model, self.sentiment_model):
+            started = time.monotonic()
+            try:
+                self._classify("hello", model, 1)
+                results.append(("classifier", model, time.monotonic() - started))
+            except Exception as exc:
+                logger.info("Keep-warm probe failed on %s: %s", model, exc)
+                results.append(("classifier", model, None))
+        for route in self.chat_routes:
+            started = time.monotonic()
+            try:
+                self._chat_once(
+                    route,
+                    [{"role": "user", "content": "hello"}],
+                    timed=False,
+                    max_tokens=1,
+                    temperature=0.0,
+                )
+                results.append(("chat", repr(route), time.monotonic() - started))
+            except GenerationError:
+                results.append(("chat", repr(route), None))
+        return results
 
     # -- Classification -----------------------------------------------------
 
-    def _classify(self, text: str, model: str, top_k: int = 5) -> list[tuple[str, float]]:
-        raw = self.client.text_classification(text, model=model, top_k=top_k)
+    def _classify(
+        self, text: str, model: str, top_k: int = 5, *, timeout: float | None = None
+    ) -> list[tuple[str, float]]:
+        client = self._client_for(self._provider, timeout)
+        raw = client.text_classification(text, model=model, top_k=top_k)
         out: list[tuple[str, float]] = []
         for item in raw or []:
             # The hub returns dataclasses on new versions and dicts on old ones.
@@ -200,7 +631,13 @@ def _cached_classify(
     hit = _CLASSIFY_CACHE.get(key)
     if hit is not None:
         return hit
-    result = service._classify(text, model, top_k)
+    deadline = time.monotonic() + service.classify_budget
+    result = service._with_retries(
+        model,
+        deadline,
+        lambda: service._classify(text, model, top_k, timeout=deadline - time.monotonic()),
+        min_attempt=CLASSIFY_RETRY_MIN_SECONDS,
+    )
     if len(_CLASSIFY_CACHE) >= _CACHE_LIMIT:
         _CLASSIFY_CACHE.clear()
     _CLASSIFY_CACHE[key] = result
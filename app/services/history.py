@@ -0,0 +1,146 @@
+"""Reading stored messages back out, in bulk.
+
+History pages, delta sync, search and export all return many messages at once. They
+share this module so they share one read path: the encrypted ``content``
+column is selected raw and decrypted as a batch with ``decrypt_many``, rather
+than one row at a time through the ORM's type decorator, and rows come back
+as plain ``HistoryMessage`` values rather than tracked ``Message`` entities
+nobody is going to modify.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import func
+
+from ..crypto import ciphertext, decrypt_many
+from ..extensions import db
+from ..models import Conversation, Message, RiskLevel
+
+
+@dataclass(frozen=True)
+class HistoryMessage:
+    id: int
+    conversation_id: int
+    role: str
+    content: str
+    risk_level: int
+    created_at: datetime | None
+
+    @property
+    def risk(self) -> RiskLevel:
+        return RiskLevel.from_value(self.risk_level)
+
+
+def message_columns():
+    """Columns for a ``HistoryMessage``, with the content left encrypted."""
+    return (
+        Message.id,
+        Message.conversation_id,
+        Message.role,
+        ciphertext(Message.content),
+        Message.risk_level,
+        Message.created_at,
+    )
+
+
+def materialise(rows) -> list[HistoryMessage]:
+    """Rows selected with ``message_columns``, batch-decrypted."""
+    plaintexts = decrypt_many([r[3] for r in rows])
+    return [
+        HistoryMessage(
+            id=r[0],
+            conversation_id=r[1],
+            role=r[2],
+            content=text,
+            risk_level=r[4],
+            created_at=r[5],
+        )
+        for r, text in zip(rows, plaintexts, strict=True)
+    ]
+
+
+def history_window(
+    user_id: int,
+    *,
+    limit: int,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    conversation_id: int | None = None,
+) -> tuple[list[HistoryMessage], bool]:
+    """One page of a user's messages, oldest first, plus whether more exist.
+
+    Keyset, not offset: the cursor is a message id, so every page is an index
+    range scan of ``limit + 1`` rows on ``(conversation_id, id)`` no matter how
+    far back someone has scrolled. ``OFFSET 4000`` would read and discard
+    4,000 rows -- and decrypt nothing less -- to serve the same twenty.
+
+    ``before_id`` pages backwards (older), ``after_id`` forwards (newer). With
+    neither, the newest page is returned. ``has_more`` refers to the direction
+    being paged in. ``conversation_id`` narrows it to one thread, which the
+    caller must already have checked belongs to ``user_id``.
+    """
+    query = db.session.query(*message_columns())
+    if conversation_id is not None:
+        query = query.filter(Message.conversation_id == conversation_id)
+    else:
+        conversation_ids = (
+            db.session.query(Conversation.id)
+            .filter(Conversation.user_id == user_id)
+            .scalar_subquery()
+        )
+        query = query.filter(Message.conversation_id.in_(conversation_ids))
+
+    if after_id is not None:
+        rows = query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1).all()
+        return materialise(rows[:limit]), len(rows) > limit
+
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+    # Only the rows being returned are decrypted; the probe row is not.
+    return materialise(list(reversed(rows[:limit]))), len(rows) > limit
+
+
+def messages_by_conversation(conversation_ids: list[int]) -> dict[int, list[HistoryMessage]]:
+    """Every message in the given conversations, grouped and oldest first.
+
+    One query and one batch decrypt for all of them, instead of a query per
+    conversation.
+    """
+    if not conversation_ids:
+        return {}
+    rows = (
+        db.session.query(*message_columns())
+        .filter(Message.conversation_id.in_(conversation_ids))
+        .order_by(Message.conversation_id.asc(), Message.id.asc())
+        .all()
+    )
+    grouped: dict[int, list[HistoryMessage]] = {cid: [] for cid in conversation_ids}
+    for message in materialise(rows):
+        grouped[message.conversation_id].append(message)
+    return grouped
+
+
+def latest_message_id(user_id: int) -> int | None:
+    """Id of the user's newest message, answered from the index alone."""
+    conversation_ids = (
+        db.session.query(Conversation.id).filter(Conversation.user_id == user_id).scalar_subquery()
+    )
+    return (
+        db.session.query(func.max(Message.id))
+        .filter(Message.conversation_id.in_(conversation_ids))
+        .scalar()
+    )
+
+
+def message_to_dict(m: HistoryMessage | Message) -> dict:
+    return {
+        "id": m.id,
+        "role": m.role,
+        "content": m.content,
+        "risk": m.risk.label,
+        "timestamp": m.created_at.isoformat() if m.created_at else None,
+    }
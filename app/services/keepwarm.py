@@ -0,0 +1,167 @@
+"""Keep the Hugging Face models warm through quiet spells.
+
+Serverless inference scales an idle model down, and the first person to
+write after a quiet spell pays for bringing it back: a 503 "model is
+loading" from the classifiers, so a rules-only assessment, and 30 seconds
+or more before the chat model answers.
+
+With ``KEEPWARM_SECONDS`` set, one worker per host sends a tiny probe to
+every configured model -- a one-word classification to each classifier and
+a one-token completion to each chat model in the chain -- once the host
+has had no chat turn for that long, and again every ``KEEPWARM_SECONDS``
+while it stays quiet. Real traffic keeps the models warm by itself, so a
+busy host sends no probes.
+
+Workers coordinate through two files in the instance folder. Whoever holds
+an exclusive lock on ``keepwarm.lock`` is the leader and probes; the others
+try for it on each tick, so another worker takes over when the leader
+exits. Every chat turn touches ``keepwarm.active`` (at most once a second
+per worker) and its mtime is the host's last activity.
+
+Probe failures go into the router's per-model error rates in
+``hf_client``, and latencies to ``/metrics``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows; every worker leads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PROBES = "keepwarm_probes_total"
+PROBE_SECONDS = "keepwarm_probe_seconds"
+
+
+class KeepWarm:
+    def __init__(self, app, *, interval: float, lock_path: str, activity_path: str):
+        self.app = app
+        self.interval = interval
+        self.lock_path = lock_path
+        self.activity_path = activity_path
+        self.last_probe = 0.0
+        self._touched = 0.0
+        self._lock_file = None
+        self._lock_pid: int | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._guard = threading.Lock()
+        self._stopping = threading.Event()
+        metrics = app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.counter(PROBES, "Keep-warm probes sent while the host was idle.")
+            metrics.histogram(
+                PROBE_SECONDS, "Keep-warm probe latency; a slow one is a cold start.",
+                (0.5, 1, 2, 5, 10, 20, 40),
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def touch(self) -> None:
+        """A chat turn happened: the models are in use, no probe needed."""
+        if not self.enabled:
+            return
+        now = time.time()
+        if now - self._touched < 1:
+            return
+        self._touched = now
+        try:
+            with open(self.activity_path, "a"):
+                os.utime(self.activity_path)
+        except OSError as exc:
+            logger.debug("Could not mark activity at %s: %s", self.activity_path, exc)
+
+    def ensure_running(self) -> None:
+        # Started on the first request, and again in a forked child, where
+        # the parent's thread does not exist.
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._guard:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="keep-warm", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def run_once(self) -> bool:
+        """Probe if this worker leads and the host has been idle. True if it did."""
+        if not self.is_leader():
+            return False
+        now = time.time()
+        if now - max(self._last_activity(), self.last_probe) < self.interval:
+            return False
+        hf = self.app.extensions.get("huggingface")
+        if not getattr(hf, "configured", False):
+            return False
+        self.last_probe = now
+        for kind, model, seconds in hf.warm_up():
+            self._record(kind, model, seconds)
+        return True
+
+    def is_leader(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_file is not None and self._lock_pid == os.getpid():
+            return True
+        handle = open(self.lock_path, "a")  # held, and so locked, for the process lifetime
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_file, self._lock_pid = handle, os.getpid()
+        logger.info("Keep-warm leader for this host is pid %s", os.getpid())
+        return True
+
+    def _last_activity(self) -> float:
+        try:
+            return os.path.getmtime(self.activity_path)
+        except OSError:
+            return 0.0
+
+    def _run(self) -> None:
+        tick = max(min(self.interval / 4, 30.0), 1.0)
+        while not self._stopping.wait(tick):
+            try:
+                self.run_once()
+            except Exception:  # the probe loop must outlive any one bad probe
+                logger.exception("Keep-warm probe round failed")
+
+    def _record(self, kind: str, model: str, seconds: float | None) -> None:
+        if seconds is None:
+            logger.warning("Keep-warm probe to %s failed", model)
+        elif seconds > 5:
+            logger.info("Keep-warm probe to %s took %.1fs (cold start)", model, seconds)
+        metrics = self.app.extensions.get("metrics")
+        if metrics is None:
+            return
+        metrics.inc(PROBES, kind=kind, outcome="ok" if seconds is not None else "failed")
+        if seconds is not None:
+            metrics.observe(PROBE_SECONDS, seconds, kind=kind)
+
+
+def init_keepwarm(app) -> KeepWarm:
+    keepwarm = KeepWarm(
+        app,
+        interval=app.config["KEEPWARM_SECONDS"],
+        lock_path=os.path.join(app.instance_path, "keepwarm.lock"),
+        activity_path=os.path.join(app.instance_path, "keepwarm.active"),
+    )
+    if keepwarm.enabled:
+        os.makedirs(app.instance_path, exist_ok=True)
+        app.before_request(keepwarm.ensure_running)
+    app.extensions["keepwarm"] = keepwarm
+    return keepwarm
@@ -14,6 +14,8 @@ from __future__ import annotations
 
 import logging
 
+from sqlalchemy.orm import undefer
+
 from ..extensions import db
 from ..models import Conversation, Message
 from .hf_client import GenerationError
@@ -26,6 +28,7 @@ def recent_messages(conversation: Conversation, window: int) -> list[Message]:
     """The last ``window`` messages, oldest first."""
     rows = (
         db.session.query(Message)
+        .options(undefer(Message.content))
         .filter(Message.conversation_id == conversation.id)
         .order_by(Message.id.desc())
         .limit(window)
@@ -80,6 +83,19 @@ def maybe_summarise(
     the user nothing. Silent on error by design -- degraded memory is a far
     better outcome than a failed request.
     """
+    stale = messages_to_summarise(conversation, trigger=trigger, window=window)
+    if stale:
+        summarise(conversation, hf, stale)
+
+
+def messages_to_summarise(
+    conversation: Conversation, *, trigger: int, window: int
+) -> list[Message]:
+    """The messages the next summary would fold in; empty if none is due.
+
+    Database reads only, so a caller can check before committing a model
+    call (and a generation slot) to it.
+    """
     total = (
         db.session.query(db.func.count(Message.id))
         .filter(Message.conversation_id == conversation.id)
@@ -87,7 +103,7 @@ def maybe_summarise(
         or 0
     )
     if total < trigger:
-        return
+        return []
 
     # Everything older than the verbatim window that has not yet been folded in.
     cutoff_ids = [
@@ -100,8 +116,9 @@ def maybe_summarise(
     ]
     oldest_kept = min(cutoff_ids) if cutoff_ids else 0
 
-    stale = (
+    return (
         db.session.query(Message)
+        .options(undefer(Message.content))
         .filter(
             Message.conversation_id == conversation.id,
             Message.id < oldest_kept,
@@ -110,9 +127,10 @@ def maybe_summarise(
         .order_by(Message.id.asc())
         .all()
     )
-    if not stale:
-        return
 
+
+def summarise(conversation: Conversation, hf, stale: list[Message]) -> None:
+    """Fold ``stale``, from ``messages_to_summarise``, into the summary."""
     transcript = "\n".join(
         f"{'User' if m.role == 'user' else 'Assistant'}: {m.content}" for m in stale
     )
@@ -146,6 +164,8 @@ def get_or_create_conversation(user_id: int) -> Conversation:
     # "start a new conversation" silently keep serving the old one.
     conversation = (
         db.session.query(Conversation)
+        # The summary goes into every system prompt built from this.
+        .options(undefer(Conversation.summary))
         .filter(Conversation.user_id == user_id)
         .order_by(Conversation.id.desc())
         .first()
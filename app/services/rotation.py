@@ -0,0 +1,96 @@
+"""Re-encrypting stored rows under the current key and envelope.
+
+Rotating ``ENCRYPTION_KEY`` is three steps: deploy with the new key as primary
+and the old one in ``ENCRYPTION_PREVIOUS_KEYS``, run ``flask reencrypt``, then
+drop the old key. This module is the middle step. It walks each table holding
+``EncryptedText`` columns in id order, a chunk at a time, and rewrites only
+values that are not already under the primary key and current envelope.
+
+The app keeps serving throughout. Each chunk is its own short transaction,
+and every update is conditional on the column still holding the ciphertext
+that was read: a row the app rewrote in the meantime is already current and
+is left alone rather than overwritten with a stale value.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from sqlalchemy import Text, bindparam, func, select, type_coerce, update
+
+from ..crypto import DecryptionFailed, EncryptedText, ciphertext, get_encryptor
+from ..extensions import db
+from ..models import CheckIn, Conversation, Message, MoodEntry, SafetyPlan
+
+# Walk order. Small tables first, so a first run shows progress quickly.
+ENCRYPTED_MODELS = (SafetyPlan, CheckIn, MoodEntry, Conversation, Message)
+
+
+@dataclass
+class ChunkResult:
+    last_id: int | None
+    # Rows examined; the other counts are of column values.
+    scanned: int = 0
+    rewritten: int = 0
+    unreadable: int = 0
+    # Rows changed by the app between our read and our write.
+    raced: int = 0
+
+
+def encrypted_columns(model) -> list:
+    return [c for c in model.__table__.columns if isinstance(c.type, EncryptedText)]
+
+
+def remaining_rows(model, after_id: int | None) -> int:
+    query = select(func.count()).select_from(model.__table__)
+    if after_id is not None:
+        query = query.where(model.__table__.c.id > after_id)
+    return db.session.execute(query).scalar_one()
+
+
+def reencrypt_chunk(model, *, after_id: int | None, limit: int) -> ChunkResult:
+    """Rewrite up to ``limit`` rows of ``model`` with ids above ``after_id``.
+
+    Commits before returning. ``last_id`` is the highest id examined, or
+    ``None`` once there is nothing left.
+    """
+    table = model.__table__
+    columns = encrypted_columns(model)
+    query = select(table.c.id, *(ciphertext(c) for c in columns)).order_by(table.c.id).limit(limit)
+    if after_id is not None:
+        query = query.where(table.c.id > after_id)
+    rows = db.session.execute(query).all()
+    if not rows:
+        return ChunkResult(last_id=None)
+
+    encryptor = get_encryptor()
+    result = ChunkResult(last_id=rows[-1][0], scanned=len(rows))
+    for offset, column in enumerate(columns, start=1):
+        params = []
+        for row in rows:
+            stored = row[offset]
+            if stored is None:
+                continue
+            try:
+                fresh = encryptor.rewrap(stored)
+            except DecryptionFailed:
+                # Left exactly as it is; a key may still turn up.
+                result.unreadable += 1
+                continue
+            if fresh is not None:
+                params.append({"row_id": row[0], "old": stored, "new": fresh})
+        if not params:
+            continue
+        # Compare-and-set on the exact ciphertext read above. Both sides are
+        # coerced to Text so EncryptedText does not encrypt them again.
+        raw = type_coerce(column, Text)
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("row_id"), raw == bindparam("old", type_=Text))
+            .values({column.key: bindparam("new", type_=Text)})
+        )
+        updated = db.session.execute(statement, params).rowcount
+        result.rewritten += updated
+        result.raced += len(params) - updated
+    db.session.commit()
+    return result
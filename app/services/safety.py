@@ -274,12 +274,14 @@ def _model_level_from_score(score: float) -> RiskLevel:
 _CONCERNING_EMOTIONS = {"grief", "sadness", "fear", "nervousness", "remorse", "disappointment"}
 
 
-def assess(text: str, classifier=None) -> RiskAssessment:
+def assess(text: str, classifier=None, *, affect: bool = True) -> RiskAssessment:
     """Full pipeline: rules fused with Hugging Face classifiers.
 
     ``classifier`` is any object exposing ``suicide_score``, ``emotions`` and
     ``sentiment``. Passing ``None`` yields a rules-only assessment flagged as
     ``degraded`` -- which is exactly what happens when HF is unreachable.
+    ``affect=False`` skips the emotion and sentiment calls under load; the
+    suicide classifier still runs, so the risk level is unaffected.
     """
     assessment = assess_with_rules(text)
 
@@ -289,8 +291,10 @@ def assess(text: str, classifier=None) -> RiskAssessment:
 
     try:
         score = classifier.suicide_score(text)
-        emotions = classifier.emotions(text)
-        sentiment, sentiment_score = classifier.sentiment(text)
+        emotions = classifier.emotions(text) if affect else []
+        sentiment, sentiment_score = (
+            classifier.sentiment(text) if affect else (assessment.sentiment, 0.0)
+        )
     except Exception as exc:  # network, rate limit, cold start, bad model id
         logger.warning("Classifier layer unavailable, falling back to rules: %s", exc)
         assessment.degraded = True
@@ -0,0 +1,131 @@
+"""Keyword search over encrypted messages, via a blind index.
+
+Message text is encrypted, so the database cannot search it, and decrypting
+someone's whole history to scan it gets slower with every message they send.
+Instead each message's distinct words are normalised, turned into keyed HMAC
+tokens (``Encryptor.blind_index``) and stored in ``message_tokens`` when the
+message is written. A search hashes the query words the same way, finds the
+messages holding all of them with an indexed lookup, and decrypts only those.
+
+What the index gives away: which of a user's messages share a word, and how
+many distinct words each has. Not the words -- tokens are keyed, and scoped
+per user so identical words in two accounts do not match.
+
+Whole words only, case- and accent-insensitive; no prefixes or stemming. The
+index key derives from the primary ``ENCRYPTION_KEY``, so after a rotation run
+``flask index-search --all``.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections.abc import Iterable
+
+from sqlalchemy import exists, func, select
+
+from ..crypto import ciphertext, decrypt_many, get_encryptor
+from ..extensions import db
+from ..models import Conversation, Message, MessageToken
+from .history import HistoryMessage, materialise, message_columns
+
+_WORD = re.compile(r"\w+")
+MIN_TERM_LENGTH = 2
+# Each term is one more index probe; a sentence pasted into the box is not a
+# keyword search.
+MAX_QUERY_TERMS = 8
+
+
+def terms(text: str) -> set[str]:
+    """Distinct searchable words in ``text``: casefolded, accents stripped."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    bare = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    words = _WORD.findall(unicodedata.normalize("NFKC", bare))
+    return {w for w in words if len(w) >= MIN_TERM_LENGTH}
+
+
+def index_messages(user_id: int, messages: Iterable[tuple[int, str]]) -> int:
+    """Add index rows for ``(message_id, plaintext)`` pairs owned by ``user_id``.
+
+    Joins the caller's transaction; nothing is committed here. Returns the
+    number of rows added.
+    """
+    blind_index = get_encryptor().blind_index
+    rows = [
+        {"token": blind_index(user_id, term), "message_id": message_id}
+        for message_id, text in messages
+        for term in terms(text)
+    ]
+    if rows:
+        db.session.execute(MessageToken.__table__.insert(), rows)
+    return len(rows)
+
+
+def search_messages(
+    user_id: int, query: str, *, limit: int
+) -> tuple[list[HistoryMessage], bool]:
+    """The user's newest messages containing every word of ``query``.
+
+    Newest first, plus whether more matched than ``limit``.
+    """
+    wanted = sorted(terms(query))[:MAX_QUERY_TERMS]
+    if not wanted:
+        return [], False
+    blind_index = get_encryptor().blind_index
+    tokens = [blind_index(user_id, term) for term in wanted]
+
+    matching = (
+        select(MessageToken.message_id)
+        .where(MessageToken.token.in_(tokens))
+        .group_by(MessageToken.message_id)
+        .having(func.count() == len(tokens))
+    )
+    conversation_ids = select(Conversation.id).where(Conversation.user_id == user_id)
+    rows = (
+        db.session.query(*message_columns())
+        .filter(Message.id.in_(matching), Message.conversation_id.in_(conversation_ids))
+        .order_by(Message.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    hits = materialise(rows[:limit])
+    # Tokens are truncated HMACs; confirm against the plaintext now that we
+    # have it, so a collision can never surface an unrelated message.
+    return [m for m in hits if set(wanted) <= terms(m.content)], len(rows) > limit
+
+
+def backfill_chunk(
+    *, after_id: int | None, limit: int, rebuild: bool = False
+) -> tuple[int | None, int]:
+    """Index up to ``limit`` messages with ids above ``after_id`` and commit.
+
+    Without ``rebuild`` only messages with no index rows are touched, so the
+    command can be re-run safely. Returns the last id examined (``None`` when
+    there is nothing left) and the number of messages indexed.
+    """
+    query = (
+        select(Message.id, Conversation.user_id, ciphertext(Message.content))
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .order_by(Message.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+    if not rebuild:
+        query = query.where(~exists().where(MessageToken.message_id == Message.id))
+    rows = db.session.execute(query).all()
+    if not rows:
+        return None, 0
+
+    ids = [r[0] for r in rows]
+    if rebuild:
+        stale = MessageToken.__table__.delete().where(MessageToken.message_id.in_(ids))
+        db.session.execute(stale)
+    by_user: dict[int, list[tuple[int, str]]] = {}
+    plaintexts = decrypt_many([r[2] for r in rows])
+    for (message_id, user_id, _), text in zip(rows, plaintexts, strict=True):
+        by_user.setdefault(user_id, []).append((message_id, text))
+    for user_id, messages in by_user.items():
+        index_messages(user_id, messages)
+    db.session.commit()
+    return ids[-1], len(rows)
@@ -0,0 +1,170 @@
+"""Streak state, maintained incrementally.
+
+``models.compute_streaks`` reads every check-in a user has ever made and
+walks them in Python. It ran on every streak view, insights request and
+check-in -- twice on a conflicting one -- so its cost grew with every day
+someone kept showing up. This module keeps a ``StreakState`` row per user up
+to date inside the check-in transaction instead, and reads are one
+primary-key lookup regardless of history length.
+
+The check-in table is still the source of truth. A missing or suspect row is
+rebuilt from it, and ``flask check-streaks`` compares the two. How the
+derived value is computed is ``STREAK_ENGINE``: ``python`` walks the dates in
+process, ``sql`` has the database find the runs with a window function.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import (
+    CheckIn,
+    StreakState,
+    calendar_cells,
+    streak_dict,
+    streak_summary_python,
+    streak_summary_sql,
+)
+
+logger = logging.getLogger(__name__)
+
+
+CALENDAR_DAYS = 30
+
+
+@dataclass(frozen=True)
+class CheckinSummary:
+    streak: dict
+    calendar: list[dict]
+
+
+def checkin_summary(
+    user_id: int, *, days: int = CALENDAR_DAYS, today: date | None = None
+) -> CheckinSummary:
+    """Streak stats and the recent calendar together, from one query.
+
+    The streak page, its API and the check-in response all want both, and
+    used to fetch them separately: a full walk of every check-in for the
+    streak, then a second scan of the same rows for the calendar. Here the
+    stored streak row is outer-joined to the calendar window, so one round
+    trip returns both. The result is memoised for the rest of the request,
+    so insights and templates rendered in the same request reuse it.
+    """
+    today = today or date.today()
+    key = (user_id, days, today)
+    memo = g.setdefault("_checkin_summaries", {}) if has_request_context() else {}
+    if key in memo:
+        return memo[key]
+
+    start = today - timedelta(days=days - 1)
+    rows = (
+        db.session.query(StreakState, CheckIn.checkin_date, CheckIn.mood_score)
+        .outerjoin(
+            CheckIn,
+            and_(CheckIn.user_id == StreakState.user_id, CheckIn.checkin_date >= start),
+        )
+        .filter(StreakState.user_id == user_id)
+        .all()
+    )
+    if rows:
+        state = rows[0][0]
+        by_date = {day: mood for _, day, mood in rows if day is not None}
+        summary = CheckinSummary(state.to_dict(today), calendar_cells(by_date, start, days))
+    else:
+        # No stored row yet. Build it, then take the calendar on its own; this
+        # happens once per user.
+        streak = get_streaks(user_id, today)
+        cal_rows = (
+            db.session.query(CheckIn.checkin_date, CheckIn.mood_score)
+            .filter(CheckIn.user_id == user_id, CheckIn.checkin_date >= start)
+            .all()
+        )
+        summary = CheckinSummary(streak, calendar_cells(dict(cal_rows), start, days))
+
+    memo[key] = summary
+    return summary
+
+
+def forget(user_id: int) -> None:
+    """Drop this request's memoised summaries after a check-in changes them."""
+    if has_request_context():
+        memo = g.get("_checkin_summaries") or {}
+        for key in [k for k in memo if k[0] == user_id]:
+            del memo[key]
+
+
+def get_streaks(user_id: int, today: date | None = None) -> dict:
+    """Streak stats in the ``compute_streaks`` shape, from the stored row."""
+    state = db.session.get(StreakState, user_id)
+    if state is None:
+        # First read since this table was introduced. Build it once and keep it.
+        state = rebuild(user_id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request built the same row first; theirs is as good.
+            db.session.rollback()
+            state = db.session.get(StreakState, user_id) or state
+    return state.to_dict(today)
+
+
+def apply_checkin(user_id: int, day: date) -> StreakState:
+    """Fold one new check-in into the user's streak state.
+
+    Call after the ``CheckIn`` is added and before the commit, so both land
+    or neither does. The unique constraint still decides whether the
+    check-in is a duplicate; a rejected one rolls this update back with it.
+    """
+    forget(user_id)
+    state = db.session.get(StreakState, user_id, with_for_update=True)
+    if state is None or state.last_checkin is None:
+        return rebuild(user_id)
+
+    if day <= state.last_checkin:
+        # Backfilled or out-of-order date: it may join or split runs anywhere in
+        # the history, which the incremental arithmetic cannot see.
+        return rebuild(user_id)
+
+    gap = (day - state.last_checkin).days
+    state.current_run = state.current_run + 1 if gap == 1 else 1
+    state.longest_run = max(state.longest_run, state.current_run)
+    state.total_checkins += 1
+    state.last_checkin = day
+    return state
+
+
+def summarise(user_id: int) -> tuple[int, int, int, date | None]:
+    """``(longest, trailing run, total, last date)`` via the configured engine."""
+    if current_app.config.get("STREAK_ENGINE") == "sql":
+        return streak_summary_sql(user_id)
+    return streak_summary_python(user_id)
+
+
+def derive(user_id: int, today: date | None = None) -> dict:
+    """Streak stats straight from the check-in table, bypassing stored state."""
+    return streak_dict(*summarise(user_id), today)
+
+
+def rebuild(user_id: int) -> StreakState:
+    """Recompute a user's streak state from the check-in table.
+
+    Adds or updates the row in the session; the caller commits.
+    """
+    longest, trailing, total, last = summarise(user_id)
+
+    state = db.session.get(StreakState, user_id)
+    if state is None:
+        state = StreakState(user_id=user_id)
+        db.session.add(state)
+    state.current_run = trailing
+    state.longest_run = longest
+    state.total_checkins = total
+    state.last_checkin = last
+    return state
@@ -0,0 +1,108 @@
+"""Generation budgets sized from the replies the model actually writes.
+
+The system prompt asks for two to five sentences, yet every turn used to
+ask for ``LLM_MAX_TOKENS`` (400), or 160 at IMMINENT. Some providers
+schedule by ``max_tokens``, so an oversized budget costs queueing time even
+when the reply is short. ``TokenBudget`` keeps the recent completion
+lengths for each risk level and asks for their ``LLM_TOKENS_PERCENTILE``
+times ``LLM_TOKENS_MARGIN`` instead, never more than the fixed cap that
+applied before (which is also what is used until a level has enough
+replies to go on).
+
+A reply that still hits the smaller budget is generated again with the
+full one, and its length is what gets recorded, so a level whose replies
+grow earns its budget back. The second call shares the first one's
+``LLM_TIMEOUT_SECONDS``, and on a crisis turn must fit before the reply
+SLO; when it would not, the cut-off reply is kept.
+
+``generation_seconds`` is labelled ``budget="adaptive"`` or ``"fixed"``,
+and ``LLM_ADAPTIVE_TOKENS=0`` turns this off, so time-to-completion can be
+compared before and after on the same deployment.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+from ..metrics import Metrics
+from ..models import RiskLevel
+
+GENERATION_SECONDS = "generation_seconds"
+TRUNCATED = "generation_truncated_total"
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        percentile: float = 0.95,
+        margin: float = 1.25,
+        floor: int = 64,
+        min_samples: int = 20,
+        window: int = 200,
+        metrics: Metrics | None = None,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.margin = margin
+        self.floor = floor
+        self.min_samples = min_samples
+        self.window = window
+        self._lengths: dict[int, deque[int]] = {}
+        self._lock = threading.Lock()
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.histogram(
+                GENERATION_SECONDS,
+                "Seconds for a chat completion, by risk level and budget kind.",
+                (0.5, 1, 2, 3, 5, 8, 13, 21, 30),
+            )
+            metrics.counter(
+                TRUNCATED, "Replies that hit max_tokens, and whether they were regenerated."
+            )
+
+    def max_tokens(self, level: RiskLevel, ceiling: int) -> int:
+        """The budget for a turn at ``level``; ``ceiling`` is the fixed cap."""
+        if not self.enabled:
+            return ceiling
+        with self._lock:
+            lengths = sorted(self._lengths.get(int(level), ()))
+        if len(lengths) < self.min_samples:
+            return ceiling
+        observed = lengths[min(len(lengths) - 1, int(len(lengths) * self.percentile))]
+        return min(ceiling, max(self.floor, int(observed * self.margin)))
+
+    def record(self, level: RiskLevel, reply: str, *, seconds: float, adaptive: bool) -> None:
+        tokens = getattr(reply, "tokens", None)
+        if tokens is None:
+            tokens = max(len(reply) // 4, 1)  # ~4 characters a token in English
+        with self._lock:
+            self._lengths.setdefault(int(level), deque(maxlen=self.window)).append(tokens)
+        if self._metrics is not None:
+            self._metrics.observe(
+                GENERATION_SECONDS,
+                seconds,
+                risk=RiskLevel.from_value(level).label,
+                budget="adaptive" if adaptive else "fixed",
+            )
+
+    def truncated(self, level: RiskLevel, *, regenerated: bool) -> None:
+        if self._metrics is not None:
+            self._metrics.inc(
+                TRUNCATED,
+                risk=RiskLevel.from_value(level).label,
+                regenerated="yes" if regenerated else "no",
+            )
+
+
+def init_token_budget(app) -> TokenBudget:
+    budget = TokenBudget(
+        enabled=app.config["LLM_ADAPTIVE_TOKENS"],
+        percentile=app.config["LLM_TOKENS_PERCENTILE"],
+        margin=app.config["LLM_TOKENS_MARGIN"],
+        metrics=app.extensions.get("metrics"),
+    )
+    app.extensions["token_budget"] = budget
+    return budget
@@ -0,0 +1,58 @@
+"""Shared setup for the benchmark scripts.
+
+Each benchmark builds a throwaway testing app on an in-memory SQLite
+database, seeds what it needs, and prints a small table. Numbers from here
+are for comparing two implementations on the same machine, not for quoting.
+"""
+
+from __future__ import annotations
+
+import statistics
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+
+@contextmanager
+def bench_app(**config) -> Iterator:
+    """An app context with a fresh schema and one user, torn down afterwards."""
+    app = create_app("testing")
+    app.config.update(config)
+    with app.app_context():
+        db.create_all()
+        user = User(username="bench", email="bench@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        app.config["BENCH_USER_ID"] = user.id
+        try:
+            yield app
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+def timeit(fn: Callable[[], object], *, repeat: int = 20, warmup: int = 2) -> dict:
+    """Median and p95 wall time of ``fn`` in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def table(title: str, header: list[str], rows: list[list]) -> None:
+    print(f"\n{title}\n" + "=" * len(title))
+    widths = [max(len(str(c)) for c in col) for col in zip(header, *rows, strict=False)]
+    for row in [header, *rows]:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths, strict=False)))
@@ -0,0 +1,90 @@
+"""History decryption: per-row ORM vs raw select + bulk decrypt.
+
+    python -m benchmarks.bench_decrypt
+
+Seeds 200, 2,000 and 20,000 messages of realistic length and reports
+rows/sec for three read paths:
+
+* ``orm``      -- ``query(Message)`` with content undeferred; ``EncryptedText``
+  decrypts per row
+* ``bulk``     -- ``ciphertext()`` select + ``decrypt_many`` inline
+* ``bulk/N``   -- the same with an N-thread pool
+
+Threads only help where the crypto backend releases the GIL *and* the host
+has spare cores; on a one-core container they cost a little. The printed
+core count is there so the numbers are read in that light.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+
+from sqlalchemy.orm import undefer
+
+from app.crypto import ciphertext, get_encryptor, init_encryption
+from app.extensions import db
+from app.models import Conversation, Message
+
+from ._harness import bench_app, table, timeit
+
+SIZES = (200, 2_000, 20_000)
+WORKERS = (2, 4)
+WORDS = "main bohat thaka hua hoon aaj kuch theek nahi lag raha I feel tired and alone".split()
+
+
+def seed(user_id: int, n: int) -> None:
+    rng = random.Random(n)
+    convo = Conversation(user_id=user_id, title="bench")
+    db.session.add(convo)
+    db.session.commit()
+    rows = [
+        {
+            "conversation_id": convo.id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            # Plaintext: a Core insert still goes through EncryptedText.
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(8, 120))),
+            "risk_level": 0,
+        }
+        for i in range(n)
+    ]
+    db.session.execute(Message.__table__.insert(), rows)
+    db.session.commit()
+
+
+def orm_read() -> int:
+    db.session.expire_all()
+    query = db.session.query(Message).options(undefer(Message.content))
+    return len([m.content for m in query.all()])
+
+
+def bulk_read() -> int:
+    raw = [r[0] for r in db.session.query(ciphertext(Message.content)).all()]
+    return len(get_encryptor().decrypt_many(raw))
+
+
+def measure(n: int) -> list:
+    with bench_app() as app:
+        seed(app.config["BENCH_USER_ID"], n)
+        repeat = 5 if n >= 20_000 else 15
+        key = app.config["ENCRYPTION_KEY"]
+        cells = [n]
+        for read in (orm_read, bulk_read):
+            cells.append(f"{n / (timeit(read, repeat=repeat)['median_ms'] / 1000):,.0f}")
+        for workers in WORKERS:
+            init_encryption(key, decrypt_workers=workers)
+            cells.append(f"{n / (timeit(bulk_read, repeat=repeat)['median_ms'] / 1000):,.0f}")
+        init_encryption(key)
+        return cells
+
+
+def main() -> None:
+    table(
+        f"Decryption throughput (rows/sec, {os.cpu_count()} cores)",
+        ["rows", "orm", "bulk", *(f"bulk/{w}" for w in WORKERS)],
+        [measure(n) for n in SIZES],
+    )
+
+
+if __name__ == "__main__":
+    main()
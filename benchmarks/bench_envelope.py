@@ -0,0 +1,88 @@
+"""Encryption envelopes: enc:v1 (Fernet), enc:v2 (AES-GCM), enc:v3 (+zlib).
+
+    python -m benchmarks.bench_envelope
+
+Stored size and per-value encrypt/decrypt time for a short chat line, a
+typical message, and a message at the 4,000-character limit; then the size of
+a ``messages`` table holding the same 2,000 messages under each envelope.
+"""
+
+from __future__ import annotations
+
+import random
+
+from sqlalchemy import text as sql_text
+
+from app.crypto import Encryptor, init_encryption
+from app.extensions import db
+from app.models import Conversation, Message
+
+from ._harness import bench_app, table, timeit
+
+KEY = "1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY="
+WORDS = (
+    "main bohat thaka hua hoon aaj kuch theek nahi lag raha ghar walon ko samajh nahi "
+    "aata I feel tired and alone my exams are coming and everyone expects so much of me "
+    "I don't know who to talk to sometimes it gets really heavy at night"
+).split()
+SAMPLES = {
+    "short (40)": "ji theek hoon, bas thora sa thaka hua hoon"[:40],
+    "typical (400)": " ".join(random.Random(4).choices(WORDS, k=90))[:400],
+    "limit (4000)": " ".join(random.Random(40).choices(WORDS, k=900))[:4000],
+}
+VERSIONS = (1, 2, 3)
+LOOPS = 200
+TABLE_ROWS = 2_000
+
+
+def per_value(fn) -> str:
+    return f"{timeit(lambda: [fn() for _ in range(LOOPS)])['median_ms'] * 1000 / LOOPS:.1f}"
+
+
+def measure(label: str, text: str) -> list:
+    encs = {v: Encryptor(KEY, write_version=v) for v in VERSIONS}
+    blobs = {v: e.encrypt(text) for v, e in encs.items()}
+    row = [label]
+    row += [len(blobs[v]) for v in VERSIONS]
+    row += [per_value(lambda e=e: e.encrypt(text)) for e in encs.values()]
+    row += [per_value(lambda v=v, e=e: e.decrypt(blobs[v])) for v, e in encs.items()]
+    return row
+
+
+def table_bytes(version: int) -> list:
+    rng = random.Random(7)
+    bodies = [" ".join(rng.choices(WORDS, k=rng.randint(5, 600))) for _ in range(TABLE_ROWS)]
+    with bench_app() as app:
+        # The factory has already installed the configured encryptor.
+        init_encryption(app.config["ENCRYPTION_KEY"], write_version=version)
+        convo = Conversation(user_id=app.config["BENCH_USER_ID"], title="bench")
+        db.session.add(convo)
+        db.session.commit()
+        db.session.add_all(
+            Message(conversation_id=convo.id, role="user", content=b) for b in bodies
+        )
+        db.session.commit()
+        content = db.session.execute(sql_text("SELECT SUM(LENGTH(content)) FROM messages")).scalar()
+        pages = db.session.execute(sql_text("PRAGMA page_count")).scalar()
+        size = db.session.execute(sql_text("PRAGMA page_size")).scalar()
+        return [f"v{version}", f"{sum(len(b) for b in bodies):,}", f"{content:,}", f"{pages * size:,}"]
+
+
+def main() -> None:
+    table(
+        "Envelope size (chars) and cost (us per value)",
+        ["sample"]
+        + [f"v{v} size" for v in VERSIONS]
+        + [f"v{v} enc" for v in VERSIONS]
+        + [f"v{v} dec" for v in VERSIONS],
+        [measure(label, text) for label, text in SAMPLES.items()],
+    )
+    table(
+        f"messages table, {TABLE_ROWS:,} rows (bytes)",
+        ["envelope", "plaintext", "content column", "database file"],
+        [table_bytes(v) for v in VERSIONS],
+    )
+
+
+if __name__ == "__main__":
+    main()
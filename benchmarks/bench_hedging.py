@@ -0,0 +1,105 @@
+"""Tail latency with and without hedged generation requests.
+
+    python -m benchmarks.bench_hedging
+
+Replaces only the HTTP call of a real ``HuggingFaceService``. The primary
+model usually answers in ~30 ms, but one call in twenty lands on a slow
+provider and takes ten to twenty times that -- the shape of the HF router's
+tail, scaled from seconds down to milliseconds. The fallback model is
+steady at ~25 ms. Turns are sent one after another, after a warm-up that
+gives the primary a p90 to hedge against.
+
+The numbers to watch are p95/p99 falling while the hedge rate stays under
+the ``LLM_HEDGE_RATE`` cap. Set ``SLOW_SHARE`` above 0.1 to see the limit of
+a p90 trigger: once slow calls are more than a tenth of the total, the p90
+is itself slow and hedging comes too late to help. Sleep-based, so it
+measures waiting, not CPU.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+from app.metrics import Metrics
+from app.services import hf_client
+from app.services.hf_client import HuggingFaceService
+
+from ._harness import table
+
+TURNS = 300
+WARMUP = 40
+SLOW_SHARE = 1 / 20
+
+
+class Simulated(HuggingFaceService):
+    def __init__(self, seed: int, **kwargs):
+        super().__init__(
+            "bench-token",
+            chat_model="big",
+            fallback_chat_models=["small"],
+            suicide_model="s",
+            emotion_model="e",
+            sentiment_model="t",
+            latency_slo=1.0,
+            **kwargs,
+        )
+        self.rng = random.Random(seed)
+
+    def _complete(self, route, messages, **kwargs) -> str:
+        if route.model == "big":
+            slow = self.rng.random() < SLOW_SHARE
+            seconds = self.rng.uniform(0.3, 0.6) if slow else self.rng.uniform(0.02, 0.04)
+        else:
+            seconds = self.rng.uniform(0.02, 0.03)
+        time.sleep(seconds)
+        return route.model
+
+
+def run(hedge_rate: float) -> dict:
+    metrics = Metrics()
+    svc = Simulated(7, hedge_rate=hedge_rate, metrics=metrics)
+    for _ in range(WARMUP):
+        svc._chat_once(svc.chat_routes[0], [])
+    samples = []
+    for _ in range(TURNS):
+        started = time.perf_counter()
+        svc.chat([])
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    hedges = sum(
+        metrics.value(hf_client.HEDGES, outcome=o) for o in ("won", "lost", "failed")
+    )
+    return {
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95)],
+        "p99": samples[int(len(samples) * 0.99)],
+        "hedged": 100 * hedges / TURNS,
+        "won": metrics.value(hf_client.HEDGES, outcome="won"),
+    }
+
+
+def main() -> None:
+    rows = []
+    for rate in (0.0, 0.05, 0.1, 0.2):
+        r = run(rate)
+        rows.append(
+            [
+                "off" if rate == 0 else f"{rate:.0%}",
+                f"{r['p50']:.0f}",
+                f"{r['p95']:.0f}",
+                f"{r['p99']:.0f}",
+                f"{r['hedged']:.1f}%",
+                f"{r['won']:.0f}",
+            ]
+        )
+    hf_client._hedge_pool.shutdown(wait=True)
+    table(
+        f"chat latency (ms) over {TURNS} turns, {SLOW_SHARE:.0%} of primary calls slow",
+        ["LLM_HEDGE_RATE", "p50", "p95", "p99", "hedged", "hedges won"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Load test: crisis-turn latency under rising load, FIFO vs risk priority.
+
+    python -m benchmarks.bench_priority
+
+Drives a ``GenerationGate`` the way a busy worker would: open-loop Poisson
+arrivals, one thread per turn, a "generation" that sleeps ~40 ms, and two
+slots -- about 50 turns a second of capacity. The mix is 70% NONE, 15% LOW,
+10% MODERATE and 5% HIGH/IMMINENT. Load rises from half of capacity to
+one and a half times it; past 1.0 the queue is always full and something
+has to be shed.
+
+``fifo`` gives every turn the same priority, which is how the gate behaved
+before; ``priority`` passes the turn's risk level. The numbers to watch are
+the crisis column staying flat, and who gets shed once the load is more than
+the slots can serve. Sleep-based, so it measures scheduling, not CPU.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+
+from app.models import RiskLevel
+from app.services.admission import GenerationGate
+
+from ._harness import table
+
+SLOTS = 2
+SERVICE_SECONDS = 0.040
+CAPACITY = SLOTS / SERVICE_SECONDS
+LOADS = (0.5, 0.9, 1.2, 1.5)
+DURATION = 4.0
+MIX = (
+    [RiskLevel.NONE] * 70
+    + [RiskLevel.LOW] * 15
+    + [RiskLevel.MODERATE] * 10
+    + [RiskLevel.HIGH] * 3
+    + [RiskLevel.IMMINENT] * 2
+)
+
+
+def run(load: float, *, prioritise: bool) -> dict:
+    gate = GenerationGate(SLOTS, queue=32, wait_seconds=2.0, aging_seconds=1.0)
+    rng = random.Random(int(load * 100))
+    results: list[tuple[bool, bool, float]] = []  # (crisis, served, seconds)
+    lock = threading.Lock()
+
+    def turn(level: RiskLevel, arrived: float, service: float) -> None:
+        admitted = gate.admit(priority=level if prioritise else RiskLevel.NONE)
+        if admitted:
+            time.sleep(service)
+            gate.release()
+        with lock:
+            results.append((level >= RiskLevel.HIGH, admitted, time.perf_counter() - arrived))
+
+    threads = []
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        level = rng.choice(MIX)
+        service = rng.uniform(0.5, 1.5) * SERVICE_SECONDS
+        t = threading.Thread(target=turn, args=(level, time.perf_counter(), service))
+        t.start()
+        threads.append(t)
+        time.sleep(rng.expovariate(CAPACITY * load))
+    for t in threads:
+        t.join()
+
+    def summary(crisis: bool) -> tuple[float, float]:
+        group = [r for r in results if r[0] == crisis]
+        served = sorted(r[2] for r in group if r[1])
+        p95 = served[int(len(served) * 0.95)] * 1000 if served else float("nan")
+        shed = 100 * (len(group) - len(served)) / len(group) if group else 0.0
+        return p95, shed
+
+    return {"crisis": summary(True), "other": summary(False)}
+
+
+def main() -> None:
+    logging.getLogger("app.services.admission").setLevel(logging.ERROR)  # one line per shed
+    rows = []
+    for load in LOADS:
+        for mode in ("fifo", "priority"):
+            r = run(load, prioritise=mode == "priority")
+            rows.append(
+                [
+                    f"{load:.1f}x",
+                    mode,
+                    f"{r['crisis'][0]:.0f}",
+                    f"{r['crisis'][1]:.0f}%",
+                    f"{r['other'][0]:.0f}",
+                    f"{r['other'][1]:.0f}%",
+                ]
+            )
+    table(
+        f"p95 latency (ms) and shed rate, {SLOTS} slots, ~{CAPACITY:.0f} turns/s capacity",
+        ["load", "mode", "crisis p95", "crisis shed", "other p95", "other shed"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
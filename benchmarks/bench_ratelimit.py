@@ -0,0 +1,134 @@
+"""Rate-limit storage: per-request overhead, and whether workers share counts.
+
+    python -m benchmarks.bench_ratelimit
+
+Times the limiter work one ``/api/chat`` request does -- a moving-window
+hit on "30 per minute" and on "400 per day", plus the window stats for the
+response headers -- against three storages:
+
+* ``memory://``   -- in-process, what the app defaults to
+* ``sqlite://``   -- ``app/ratelimit.py``, a WAL file in a temp directory
+* ``redis (sim)`` -- no Redis server here, so ``memory://`` plus one loopback
+  TCP round trip per storage call, the way each Redis command costs one. A
+  real Redis adds its own processing on top; on another host, the network.
+
+Then forks four "workers" that each try 50 logins against "100 per minute"
+for the same client, and counts how many got through in total.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import socket
+import tempfile
+import threading
+import time
+
+from limits import parse_many
+from limits.storage import MemoryStorage, storage_from_string
+from limits.strategies import MovingWindowRateLimiter
+
+from app.ratelimit import SQLiteStorage
+
+from ._harness import table
+
+CHAT_LIMITS = parse_many("30 per minute; 400 per day")
+CLIENTS = [f"10.0.{i // 250}.{i % 250}" for i in range(500)]
+REQUESTS = 5_000
+
+
+class LoopbackStorage(MemoryStorage):
+    """``memory://`` with a loopback round trip in front of every call."""
+
+    STORAGE_SCHEME = ["bench-loopback"]
+
+    def __init__(self, uri: str | None = None, **options):
+        super().__init__(uri, **options)
+        server = socket.create_server(("127.0.0.1", 0))
+        threading.Thread(target=self._echo, args=(server,), daemon=True).start()
+        self._sock = socket.create_connection(server.getsockname())
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    @staticmethod
+    def _echo(server: socket.socket) -> None:
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while data := conn.recv(64):
+            conn.sendall(data)
+
+    def _round_trip(self) -> None:
+        self._sock.sendall(b"x")
+        self._sock.recv(64)
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        self._round_trip()
+        return super().acquire_entry(key, limit, expiry, amount)
+
+    def get_moving_window(self, key, limit, expiry):
+        self._round_trip()
+        return super().get_moving_window(key, limit, expiry)
+
+
+def per_request_us(storage) -> tuple[float, float]:
+    """Median and p95 microseconds of one request's limiter work."""
+    limiter = MovingWindowRateLimiter(storage)
+    samples = []
+    for i in range(REQUESTS):
+        client = CLIENTS[i % len(CLIENTS)]
+        started = time.perf_counter()
+        for item in CHAT_LIMITS:
+            limiter.hit(item, client)
+        limiter.get_window_stats(CHAT_LIMITS[0], client)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def _worker(uri: str, results) -> None:
+    limiter = MovingWindowRateLimiter(storage_from_string(uri))
+    item = parse_many("100 per minute")[0]
+    results.put(sum(limiter.hit(item, "203.0.113.7") for _ in range(50)))
+
+
+def shared_count(uri: str) -> int:
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(uri, results)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return sum(results.get() for _ in workers)
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_uri = f"sqlite:///{tmp}/ratelimit.db"
+        storages = {
+            "memory://": MemoryStorage(),
+            "sqlite://": SQLiteStorage(sqlite_uri),
+            "redis (sim)": LoopbackStorage(),
+        }
+        rows = []
+        for name, storage in storages.items():
+            median, p95 = per_request_us(storage)
+            rows.append([name, f"{median:.1f}", f"{p95:.1f}"])
+        table(
+            f"Limiter work per /api/chat request, {REQUESTS:,} requests over "
+            f"{len(CLIENTS)} clients (us)",
+            ["storage", "median", "p95"],
+            rows,
+        )
+
+        table(
+            "4 workers x 50 logins, limit 100 per minute: how many got through",
+            ["storage", "allowed", "should be"],
+            [
+                ["memory://", shared_count("memory://"), 100],
+                ["sqlite://", shared_count(f"sqlite:///{tmp}/shared.db"), 100],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    main()
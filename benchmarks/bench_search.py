@@ -0,0 +1,96 @@
+"""History search: decrypt-and-scan vs the blind index.
+
+    python -m benchmarks.bench_search
+
+Seeds one user with 500, 5,000 and 20,000 messages, indexes them, and times
+a one-word search that matches about 1% of them, two ways:
+
+* ``scan``   -- select every message raw, ``decrypt_many``, filter by word
+* ``index``  -- ``services.search.search_messages``: token lookup, then
+  decrypt only the hits (capped at 50, as the endpoint does)
+
+Also reports index rows per message, which is the storage cost.
+"""
+
+from __future__ import annotations
+
+import random
+
+from sqlalchemy import select
+
+from app.crypto import ciphertext, decrypt_many
+from app.extensions import db
+from app.models import Conversation, Message, MessageToken
+from app.services.search import index_messages, search_messages, terms
+
+from ._harness import bench_app, table, timeit
+
+SIZES = (500, 5_000, 20_000)
+WORDS = (
+    "main bohat thaka hua hoon aaj kuch theek nahi lag raha ghar walon ko samajh nahi "
+    "aata I feel tired and alone my exams are coming and everyone expects so much of me "
+    "I don't know who to talk to sometimes it gets really heavy at night"
+).split()
+NEEDLE = "lanterns"
+LIMIT = 50
+
+
+def seed(user_id: int, n: int) -> None:
+    rng = random.Random(n)
+    convo = Conversation(user_id=user_id, title="bench")
+    db.session.add(convo)
+    db.session.commit()
+    texts = []
+    for i in range(n):
+        words = rng.choices(WORDS, k=rng.randint(8, 120))
+        if i % 100 == 0:
+            words.insert(rng.randrange(len(words)), NEEDLE)
+        texts.append(" ".join(words))
+    # Plaintext: a Core insert still goes through EncryptedText.
+    db.session.execute(
+        Message.__table__.insert(),
+        [{"conversation_id": convo.id, "role": "user", "content": t, "risk_level": 0}
+         for t in texts],
+    )
+    ids = db.session.execute(select(Message.id).order_by(Message.id)).scalars().all()
+    index_messages(user_id, zip(ids, texts, strict=True))
+    db.session.commit()
+
+
+def scan(user_id: int) -> int:
+    rows = db.session.execute(
+        select(ciphertext(Message.content))
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.user_id == user_id)
+    ).scalars().all()
+    return sum(1 for text in decrypt_many(rows) if NEEDLE in terms(text))
+
+
+def measure(n: int) -> list:
+    with bench_app() as app:
+        user_id = app.config["BENCH_USER_ID"]
+        seed(user_id, n)
+        tokens = db.session.query(MessageToken).count()
+        scanned = timeit(lambda: scan(user_id), repeat=5, warmup=1)
+        indexed = timeit(lambda: search_messages(user_id, NEEDLE, limit=LIMIT), repeat=20)
+        hits = len(search_messages(user_id, NEEDLE, limit=n)[0])
+        return [
+            f"{n:,}",
+            hits,
+            f"{tokens / n:.1f}",
+            f"{scanned['median_ms']:.1f}",
+            f"{indexed['median_ms']:.2f}",
+            f"{scanned['median_ms'] / indexed['median_ms']:.0f}x",
+        ]
+
+
+def main() -> None:
+    table(
+        f"Search for one word in ~1% of messages (median ms, index capped at {LIMIT} hits)",
+        ["messages", "hits", "tokens/msg", "scan ms", "index ms", "speedup"],
+        [measure(n) for n in SIZES],
+    )
+
+
+if __name__ == "__main__":
+    main()
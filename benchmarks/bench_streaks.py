@@ -0,0 +1,64 @@
+"""Streak derivation: Python date walk vs SQL gaps-and-islands.
+
+    python -m benchmarks.bench_streaks
+
+Seeds one user with several years of near-daily check-ins (a missed day
+every few weeks, so there are many runs) and times both derivations, plus
+the stored-state lookup that request paths actually use.
+"""
+
+from __future__ import annotations
+
+import random
+from datetime import date, timedelta
+
+from app.extensions import db
+from app.models import CheckIn, compute_streaks, compute_streaks_sql
+from app.services import streaks
+
+from ._harness import bench_app, table, timeit
+
+YEARS = (1, 5, 10)
+
+
+def seed(user_id: int, years: int) -> None:
+    rng = random.Random(years)
+    today = date.today()
+    rows = [
+        {"user_id": user_id, "checkin_date": today - timedelta(days=off)}
+        for off in range(365 * years)
+        if rng.random() > 0.04
+    ]
+    db.session.execute(CheckIn.__table__.insert(), rows)
+    db.session.commit()
+
+
+def measure(years: int) -> list:
+    with bench_app() as app:
+        user_id = app.config["BENCH_USER_ID"]
+        seed(user_id, years)
+        assert compute_streaks(user_id) == compute_streaks_sql(user_id)
+        streaks.get_streaks(user_id)  # materialise the stored row
+
+        py = timeit(lambda: compute_streaks(user_id))
+        sql = timeit(lambda: compute_streaks_sql(user_id))
+        stored = timeit(lambda: (db.session.expire_all(), streaks.get_streaks(user_id)))
+        return [
+            years,
+            compute_streaks(user_id)["total_checkins"],
+            f"{py['median_ms']:.2f}",
+            f"{sql['median_ms']:.2f}",
+            f"{stored['median_ms']:.2f}",
+        ]
+
+
+def main() -> None:
+    table(
+        "Streak derivation (median ms, SQLite in-memory)",
+        ["years", "checkins", "python", "sql", "stored"],
+        [measure(years) for years in YEARS],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import pytest
+
 from app.extensions import db
 from app.models import CheckIn, Conversation, Message, User
 
@@ -132,3 +134,272 @@ def test_deletion_requires_the_correct_password(auth_client, user):
         "/account/delete", data={"password": "wrong-password-1!", "confirm_text": "DELETE"}
     )
     assert db.session.query(User).count() == 1
+
+
+# --- auth cache --------------------------------------------------------------
+
+def _count_user_reads(app):
+    from sqlalchemy import event
+
+    reads = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            reads.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    return reads, lambda: event.remove(db.engine, "before_cursor_execute", record)
+
+
+def test_logged_in_requests_skip_the_users_table(app, auth_client):
+    reads, stop = _count_user_reads(app)
+    try:
+        for _ in range(5):
+            assert auth_client.get("/api/streak").status_code == 200
+    finally:
+        stop()
+    assert len(reads) <= 1
+
+
+def test_deactivation_logs_out_at_once(auth_client, user):
+    assert auth_client.get("/chat").status_code == 200
+    user.is_active = False
+    db.session.commit()
+    assert auth_client.get("/chat").status_code == 302
+
+
+def test_changes_behind_the_workers_back_apply_after_the_ttl(app, auth_client, user, monkeypatch):
+    """Another worker's commit cannot reach this cache; the TTL bounds it."""
+    from sqlalchemy import text
+
+    from app import security
+
+    assert auth_client.get("/chat").status_code == 200
+    db.session.execute(text("UPDATE users SET is_active = 0 WHERE id = :id"), {"id": user.id})
+    db.session.commit()
+    assert auth_client.get("/chat").status_code == 200  # still cached
+
+    later = security.time.monotonic() + app.config["AUTH_CACHE_SECONDS"] + 1
+    monkeypatch.setattr(security.time, "monotonic", lambda: later)
+    assert auth_client.get("/chat").status_code == 302
+
+
+def test_other_workers_drop_their_copy_when_a_session_is_revoked(app, client, user, tmp_path):
+    """Workers on a host share the epoch file; no query per request needed."""
+    from app.security import AuthCache, AuthUser
+
+    epoch_path = str(tmp_path / "auth.epoch")
+    app.extensions["auth_cache"].epoch_path = epoch_path
+    other_worker = AuthCache(30, epoch_path=epoch_path)
+    other_worker.put(AuthUser(user.id, user.username, user.session_version, True))
+
+    client.post("/login", data={"username": user.username, "password": PASSWORD})
+    assert other_worker.get(user.id) is not None  # last_login changes nothing it holds
+
+    user.set_password("An0ther-Passphrase!99")
+    db.session.commit()
+    assert other_worker.get(user.id) is None
+
+
+def test_a_cookie_newer_than_the_cached_copy_is_checked_not_rejected(auth_client, user):
+    """A login on another worker after a password change carries a version
+    this worker has not seen yet."""
+    from sqlalchemy import text
+
+    from app.security import SESSION_VERSION
+
+    assert auth_client.get("/chat").status_code == 200
+    db.session.execute(
+        text("UPDATE users SET session_version = session_version + 1 WHERE id = :id"),
+        {"id": user.id},
+    )
+    db.session.commit()
+    with auth_client.session_transaction() as sess:
+        sess[SESSION_VERSION] += 1
+    assert auth_client.get("/chat").status_code == 200
+
+
+# --- password hashing --------------------------------------------------------
+
+def test_needs_rehash_compares_against_the_configured_cost():
+    from app.passwords import PasswordHasher
+
+    hasher = PasswordHasher("scrypt:32768:8:1", workers=0)
+    assert not hasher.needs_rehash("scrypt:32768:8:1$salt$hash")
+    assert not hasher.needs_rehash("scrypt:65536:8:1$salt$hash")
+    assert hasher.needs_rehash("scrypt:16384:8:1$salt$hash")
+    assert hasher.needs_rehash("pbkdf2:sha256:600000$salt$hash")
+
+
+def test_login_upgrades_a_cheaper_hash_without_logging_anyone_out(client, user):
+    from werkzeug.security import generate_password_hash
+
+    from app.security import SESSION_VERSION
+
+    user.password_hash = generate_password_hash(PASSWORD, "pbkdf2:sha256:1000")
+    db.session.commit()
+    version = user.session_version
+
+    res = client.post("/login", data={"username": "amina", "password": PASSWORD})
+    assert res.status_code == 302
+    db.session.refresh(user)
+    assert user.password_hash.startswith("scrypt:")
+    assert user.session_version == version
+    with client.session_transaction() as sess:
+        assert sess[SESSION_VERSION] == version
+    assert client.get("/chat").status_code == 200
+
+
+def test_hashing_in_a_worker_process(user):
+    from app.passwords import PasswordHasher
+
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1)
+    try:
+        pwhash = hasher.hash(PASSWORD)
+        assert hasher.verify(pwhash, PASSWORD)
+        assert not hasher.verify(pwhash, "wrong")
+    finally:
+        hasher.shutdown()
+
+
+class _FakePool:
+    """Stands in for the process pool; each job's future is settled by the test."""
+
+    def __init__(self):
+        from concurrent.futures import Future
+
+        self.make_future = Future
+        self.futures = []
+        self.shut_down = None
+
+    def submit(self, fn, *args):
+        future = self.make_future()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, **kwargs):
+        self.shut_down = kwargs
+
+
+def _settled(value):
+    from concurrent.futures import Future
+
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_a_hash_given_up_on_keeps_its_slot_until_it_finishes(monkeypatch):
+    from app import passwords
+
+    hasher = passwords.PasswordHasher(workers=1, queue=0)  # one slot in all
+    hasher._pool = pool = _FakePool()
+    monkeypatch.setattr(passwords, "_TIMEOUT_SECONDS", 0.01)
+
+    with pytest.raises(passwords.PasswordHashingBusy, match="timed out"):
+        hasher.hash("x")
+    with pytest.raises(passwords.PasswordHashingBusy, match="slots are in use"):
+        hasher.hash("x")  # the abandoned job is still running
+    pool.futures[0].set_result("done")
+    pool.submit = lambda fn, *args: _settled(fn(*args))
+    assert hasher.verify(passwords.generate_password_hash("x", "pbkdf2:sha256:1000"), "x")
+
+
+def test_a_broken_hashing_pool_is_shut_down_and_replaced(monkeypatch):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    from app import passwords
+
+    broken = Future()
+    broken.set_exception(BrokenProcessPool("a child was killed"))
+    hasher = passwords.PasswordHasher("pbkdf2:sha256:1000", workers=1, queue=0)
+    hasher._pool = pool = _FakePool()
+    pool.submit = lambda fn, *args: broken
+
+    pwhash = hasher.hash(PASSWORD)  # done inline instead
+    assert passwords.check_password_hash(pwhash, PASSWORD)
+    assert pool.shut_down == {"wait": False, "cancel_futures": True}
+    assert hasher._pool is None
+    assert hasher._slots.acquire(blocking=False)  # and the slot came back
+
+
+def test_login_answers_503_when_every_hashing_slot_is_taken(client, user, monkeypatch):
+    from app import passwords
+
+    def busy(*args):
+        raise passwords.PasswordHashingBusy("all password hashing slots are in use")
+
+    monkeypatch.setattr(passwords.get_hasher(), "_run", busy)
+    res = client.post("/login", data={"username": "amina", "password": PASSWORD})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"]
+    assert "try again" in res.get_data(as_text=True)
+
+
+# --- audit log ---------------------------------------------------------------
+
+def _audit_events():
+    from app.models import AuditEvent
+
+    return [e.event for e in db.session.query(AuditEvent).order_by(AuditEvent.id)]
+
+
+def test_login_is_audited(client, user):
+    client.post("/login", data={"username": "amina", "password": "wrong-password"})
+    client.post("/login", data={"username": "amina", "password": PASSWORD})
+    assert _audit_events() == ["auth.login.failure", "auth.login.success"]
+
+
+def test_audit_writes_leave_the_request_path(app, client, user):
+    from app.security import AuditWriter
+
+    writer = AuditWriter(app, interval=60)
+    app.extensions["audit_writer"] = writer
+    res = client.post("/login", data={"username": "amina", "password": PASSWORD})
+    assert res.status_code == 302
+    assert _audit_events() == []
+
+    writer.close()
+    assert _audit_events() == ["auth.login.success"]
+
+
+def test_audit_events_are_inserted_in_batches(app):
+    from sqlalchemy import event
+
+    from app.models import utcnow
+    from app.security import AuditWriter
+
+    writer = AuditWriter(app, batch_size=4)
+    writer._ensure_thread = lambda: None  # drain by hand
+    for i in range(10):
+        writer.submit({"user_id": i, "event": "test", "detail": None, "ip_hash": None,
+                       "created_at": utcnow()})
+
+    inserts = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO audit_events"):
+            inserts.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        assert writer.flush() == 10
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert len(inserts) == 3
+    assert len(_audit_events()) == 10
+
+
+def test_a_full_audit_queue_drops_to_the_log(app, caplog):
+    from app.models import utcnow
+    from app.security import AuditWriter
+
+    writer = AuditWriter(app, max_queue=2)
+    writer._ensure_thread = lambda: None
+    for i in range(3):
+        writer.submit({"user_id": i, "event": "test", "detail": None, "ip_hash": None,
+                       "created_at": utcnow()})
+    assert writer.dropped == 1
+    assert "dropped test (user_id=2)" in caplog.text
+    assert writer.flush() == 2
@@ -161,3 +161,705 @@ def test_guest_reset_clears_the_session(client, app):
     client.post("/api/guest/chat", json={"message": "new topic"})
     contents = " ".join(m["content"] for m in hf.calls[-1]["messages"])
     assert "remember this" not in contents
+
+
+# --- History pagination -----------------------------------------------------
+
+def _seed_messages(user, n):
+    convo = Conversation(user_id=user.id, title="t")
+    db.session.add(convo)
+    db.session.commit()
+    for i in range(n):
+        db.session.add(Message(conversation_id=convo.id, role="user", content=f"m{i}"))
+    db.session.commit()
+    return convo
+
+
+def test_history_pages_backwards_with_a_cursor(auth_client, user):
+    _seed_messages(user, 25)
+    first = auth_client.get("/api/history?limit=10").get_json()
+    assert [m["content"] for m in first["messages"]] == [f"m{i}" for i in range(15, 25)]
+    assert first["has_more"] is True
+
+    second = auth_client.get(f"/api/history?limit=10&before_id={first['oldest_id']}").get_json()
+    assert [m["content"] for m in second["messages"]] == [f"m{i}" for i in range(5, 15)]
+
+    last = auth_client.get(f"/api/history?limit=10&before_id={second['oldest_id']}").get_json()
+    assert [m["content"] for m in last["messages"]] == [f"m{i}" for i in range(5)]
+    assert last["has_more"] is False
+
+
+def test_history_pages_forwards_with_after_id(auth_client, user):
+    _seed_messages(user, 6)
+    ids = [m["id"] for m in auth_client.get("/api/history").get_json()["messages"]]
+    data = auth_client.get(f"/api/history?after_id={ids[1]}&limit=3").get_json()
+    assert [m["id"] for m in data["messages"]] == ids[2:5]
+    assert data["has_more"] is True
+    assert data["newest_id"] == ids[4]
+
+
+def test_history_refuses_both_cursors(auth_client, user):
+    _seed_messages(user, 3)
+    res = auth_client.get("/api/history?before_id=3&after_id=1")
+    assert res.status_code == 400
+    assert res.get_json()["error"] == "bad_request"
+
+
+def test_history_page_renders_one_page_and_a_cursor(auth_client, user):
+    from app.blueprints.chat import HISTORY_PAGE_SIZE
+
+    _seed_messages(user, HISTORY_PAGE_SIZE + 5)
+    body = auth_client.get("/history").get_data(as_text=True)
+    assert body.count('class="bubble"') == HISTORY_PAGE_SIZE
+    assert 'id="older"' in body
+    assert "m4<" not in body and f"m{HISTORY_PAGE_SIZE + 4}<" in body
+
+    older = auth_client.get("/history?before_id=1000000").get_data(as_text=True)
+    assert older.count('class="bubble"') == HISTORY_PAGE_SIZE
+
+
+# --- Delta sync ---------------------------------------------------------------
+
+def test_since_returns_only_newer_messages(auth_client, hf):
+    first = auth_client.post("/api/chat", json={"message": "one"}).get_json()
+    auth_client.post("/api/chat", json={"message": "two"})
+    data = auth_client.get(f"/api/history/since?after_id={first['message_id']}").get_json()
+    assert [m["content"] for m in data["messages"]] == ["two", hf.reply]
+    assert data["newest_id"] == data["messages"][-1]["id"]
+
+
+def test_since_short_circuits_without_decrypting(auth_client, hf, monkeypatch):
+    from app import crypto
+
+    reply = auth_client.post("/api/chat", json={"message": "hello"}).get_json()
+    calls = []
+    real = crypto.Encryptor.decrypt
+    monkeypatch.setattr(
+        crypto.Encryptor, "decrypt", lambda self, v: calls.append(v) or real(self, v)
+    )
+    data = auth_client.get(f"/api/history/since?after_id={reply['message_id']}").get_json()
+    assert data == {"messages": [], "has_more": False, "newest_id": reply["message_id"]}
+    assert calls == []
+
+
+def test_since_requires_a_cursor(auth_client):
+    assert auth_client.get("/api/history/since").status_code == 400
+    assert auth_client.get("/api/history/since?after_id=abc").status_code == 400
+
+
+# --- Conversation listing -----------------------------------------------------
+
+def test_conversation_list_aggregates_without_decrypting(auth_client, hf, monkeypatch):
+    from app import crypto
+
+    auth_client.post("/api/chat", json={"message": "first thread"})
+    auth_client.post("/api/conversation/reset")
+    auth_client.post("/api/chat", json={"message": "I want to kill myself"})
+    auth_client.post("/api/chat", json={"message": "still here"})
+
+    calls = []
+    real = crypto.Encryptor.decrypt
+    monkeypatch.setattr(
+        crypto.Encryptor, "decrypt", lambda self, v: calls.append(v) or real(self, v)
+    )
+    data = auth_client.get("/api/conversations").get_json()
+    assert calls == []
+
+    newest, oldest = data["conversations"]
+    assert newest["message_count"] == 4
+    assert newest["peak_risk"] in ("high", "imminent")
+    assert oldest["title"] == "first thread"
+    assert oldest["message_count"] == 2
+    assert oldest["peak_risk"] == "none"
+    assert data["has_more"] is False
+
+
+def test_conversation_messages_are_paged_per_thread(auth_client, hf):
+    first = auth_client.post("/api/chat", json={"message": "old thread"}).get_json()
+    auth_client.post("/api/conversation/reset")
+    auth_client.post("/api/chat", json={"message": "new thread"})
+
+    cid = first["conversation_id"]
+    data = auth_client.get(f"/api/conversations/{cid}/messages?limit=1").get_json()
+    assert [m["content"] for m in data["messages"]] == [hf.reply]
+    assert data["has_more"] is True
+    older = auth_client.get(
+        f"/api/conversations/{cid}/messages?before_id={data['oldest_id']}"
+    ).get_json()
+    assert [m["content"] for m in older["messages"]] == ["old thread"]
+
+
+def test_conversation_messages_refuse_both_cursors(auth_client, hf):
+    cid = auth_client.post("/api/chat", json={"message": "hi"}).get_json()["conversation_id"]
+    res = auth_client.get(f"/api/conversations/{cid}/messages?before_id=3&after_id=1")
+    assert res.status_code == 400
+
+
+def test_another_users_conversation_is_not_found(auth_client, hf, app):
+    from app.models import User
+
+    cid = auth_client.post("/api/chat", json={"message": "mine"}).get_json()["conversation_id"]
+    other = User(username="other", email="other@example.com")
+    other.set_password("Str0ng-Passphrase!42")
+    db.session.add(other)
+    db.session.commit()
+
+    c = app.test_client()
+    c.post("/login", data={"username": "other", "password": "Str0ng-Passphrase!42"})
+    assert c.get(f"/api/conversations/{cid}/messages").status_code == 404
+    assert c.get("/api/conversations").get_json()["conversations"] == []
+
+
+# --- Search -------------------------------------------------------------------
+
+def test_search_finds_messages_by_whole_word(auth_client, hf):
+    auth_client.post("/api/chat", json={"message": "My exams start on Monday"})
+    auth_client.post("/api/conversation/reset")
+    auth_client.post("/api/chat", json={"message": "Ammi ko exam ka pata nahi"})
+    auth_client.post("/api/chat", json={"message": "Café was closed again"})
+
+    data = auth_client.get("/api/search?q=EXAMS").get_json()
+    assert [m["content"] for m in data["messages"]] == ["My exams start on Monday"]
+    assert data["messages"][0]["conversation_id"]
+
+    # Case and accents do not matter; every word has to be present.
+    assert len(auth_client.get("/api/search?q=cafe").get_json()["messages"]) == 1
+    assert auth_client.get("/api/search?q=exams+ammi").get_json()["messages"] == []
+    hits = auth_client.get("/api/search?q=pata+exam").get_json()["messages"]
+    assert [m["content"] for m in hits] == ["Ammi ko exam ka pata nahi"]
+
+
+def test_search_decrypts_only_the_matches(auth_client, hf, monkeypatch):
+    from app import crypto
+
+    for i in range(10):
+        auth_client.post("/api/chat", json={"message": f"ordinary day number {i}"})
+    auth_client.post("/api/chat", json={"message": "I feel hopeless"})
+
+    calls = []
+    real = crypto.Encryptor.decrypt
+    monkeypatch.setattr(
+        crypto.Encryptor, "decrypt", lambda self, v: calls.append(v) or real(self, v)
+    )
+    data = auth_client.get("/api/search?q=hopeless").get_json()
+    assert [m["content"] for m in data["messages"]] == ["I feel hopeless"]
+    assert len(calls) == 1
+
+
+def test_search_index_holds_no_plaintext(auth_client, hf):
+    from app.models import MessageToken
+
+    auth_client.post("/api/chat", json={"message": "hopeless"})
+    tokens = [t.token for t in db.session.query(MessageToken)]
+    assert tokens and all("hopeless" not in t for t in tokens)
+
+
+def test_search_never_crosses_accounts(app, auth_client, hf):
+    from app.models import User
+    from app.services.search import search_messages
+
+    auth_client.post("/api/chat", json={"message": "a private word: lanterns"})
+    other = User(username="bilal", email="bilal@example.com")
+    other.set_password("An0ther-Passphrase!42")
+    db.session.add(other)
+    db.session.commit()
+    assert search_messages(other.id, "lanterns", limit=10) == ([], False)
+
+
+def test_search_requires_a_query(auth_client):
+    assert auth_client.get("/api/search").status_code == 400
+    assert auth_client.get("/api/search?q=+").status_code == 400
+
+
+def test_history_page_shows_search_results(auth_client, hf):
+    auth_client.post("/api/chat", json={"message": "talked to my sister"})
+    auth_client.post("/api/chat", json={"message": "slept badly"})
+    page = auth_client.get("/history?q=sister").get_data(as_text=True)
+    assert "talked to my sister" in page
+    assert "slept badly" not in page
+    assert "No messages match" in auth_client.get("/history?q=zebra").get_data(as_text=True)
+
+
+# --- Admission control --------------------------------------------------------
+
+def test_generation_gate_sheds_past_its_queue():
+    from app.metrics import Metrics
+    from app.services.admission import GenerationGate
+
+    metrics = Metrics()
+    gate = GenerationGate(1, queue=1, wait_seconds=0.01, metrics=metrics)
+    assert gate.admit()
+    assert not gate.admit()  # waited its turn in the queue, then gave up
+    gate.queue = 0
+    assert not gate.admit()  # no queue at all
+    gate.release()
+    assert gate.admit()
+
+    assert metrics.value("generation_admitted_total") == 2
+    assert metrics.value("generation_shed_total", reason="timeout") == 1
+    assert metrics.value("generation_shed_total", reason="queue_full") == 1
+    assert metrics.value("generation_in_flight") == 1
+
+
+def test_a_queued_request_gets_the_next_free_slot():
+    import threading
+
+    from app.services.admission import GenerationGate
+
+    gate = GenerationGate(1, queue=1, wait_seconds=5)
+    assert gate.admit()
+    threading.Timer(0.05, gate.release).start()
+    assert gate.admit()
+    assert gate.waiting == 0
+
+
+def test_saturated_worker_answers_a_crisis_at_once(app, auth_client, hf):
+    from app.services.admission import GenerationGate
+    from app.services.safety import CRISIS_FALLBACK_MESSAGE
+
+    gate = GenerationGate(1, metrics=app.extensions["metrics"])
+    app.extensions["generation_gate"] = gate
+    assert gate.admit()  # another request is mid-generation
+
+    res = auth_client.post("/api/chat", json={"message": "I am going to kill myself tonight"})
+    data = res.get_json()
+    assert res.status_code == 200
+    assert data["response"] == CRISIS_FALLBACK_MESSAGE
+    assert data["resources"] and data["degraded"] is True
+    assert hf.calls == []  # never reached the model
+    # The turn is still stored, like any other fallback reply.
+    assert db.session.query(Message).count() == 2
+
+    body = auth_client.get("/metrics").get_data(as_text=True)
+    assert 'generation_shed_total{reason="queue_full",' in body
+    assert "generation_in_flight{" in body
+
+
+def test_metrics_can_require_a_token(app, client):
+    app.config["METRICS_TOKEN"] = "s3cret"
+    assert client.get("/metrics").status_code == 404
+    res = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert res.status_code == 200
+    assert "# TYPE generation_queue_depth gauge" in res.get_data(as_text=True)
+
+
+def _queue_behind(gate, level, order):
+    """Start a thread that waits for a slot at ``level``; returns once it is queued."""
+    import threading
+    import time
+
+    def wait():
+        admitted = gate.admit(priority=level)
+        order.append((level, admitted))
+        if admitted:
+            gate.release()
+
+    before = sum(w.priority == level for w in gate._waiters)
+    thread = threading.Thread(target=wait)
+    thread.start()
+    while sum(w.priority == level for w in gate._waiters) == before and thread.is_alive():
+        time.sleep(0.001)
+    return thread
+
+
+def test_a_crisis_turn_gets_the_next_free_slot():
+    from app.models import RiskLevel
+    from app.services.admission import GenerationGate
+
+    gate = GenerationGate(1, queue=4, wait_seconds=5, aging_seconds=60)
+    assert gate.admit()
+    order = []
+    threads = [
+        _queue_behind(gate, RiskLevel.NONE, order),
+        _queue_behind(gate, RiskLevel.MODERATE, order),
+        _queue_behind(gate, RiskLevel.IMMINENT, order),
+    ]
+    gate.release()
+    for t in threads:
+        t.join()
+    assert [level for level, _ in order] == [
+        RiskLevel.IMMINENT, RiskLevel.MODERATE, RiskLevel.NONE
+    ]
+
+
+def test_a_crisis_turn_displaces_a_low_risk_waiter_from_a_full_queue():
+    from app.models import RiskLevel
+    from app.services.admission import GenerationGate
+
+    gate = GenerationGate(1, queue=1, wait_seconds=5)
+    assert gate.admit()
+    order = []
+    low = _queue_behind(gate, RiskLevel.LOW, order)
+    crisis = _queue_behind(gate, RiskLevel.HIGH, order)
+    low.join()
+    assert order == [(RiskLevel.LOW, False)]
+    gate.release()
+    crisis.join()
+    assert order[-1] == (RiskLevel.HIGH, True)
+    # Two crisis turns: the second is not allowed to push out the first.
+    assert gate.admit()
+    first = _queue_behind(gate, RiskLevel.HIGH, order)
+    assert not gate.admit(priority=RiskLevel.IMMINENT)
+    gate.release()
+    first.join()
+    assert order[-1] == (RiskLevel.HIGH, True)
+
+
+def test_waiting_low_risk_turns_age_upwards_but_never_past_a_crisis():
+    from app.models import RiskLevel
+    from app.services.admission import GenerationGate, _Waiter
+
+    gate = GenerationGate(1, aging_seconds=1.0)
+    old_none = _Waiter(RiskLevel.NONE, seq=1, since=100.0)
+    new_moderate = _Waiter(RiskLevel.MODERATE, seq=2, since=109.5)
+    crisis = _Waiter(RiskLevel.HIGH, seq=3, since=109.9)
+    now = 110.0
+    assert gate._rank(old_none, now) > gate._rank(new_moderate, now)
+    assert gate._rank(crisis, now) > gate._rank(old_none, now)
+
+
+# --- Crisis reply SLO ---------------------------------------------------------
+
+class SlowHF(FakeHF):
+    """Generation that does not finish until the test says so."""
+
+    def __init__(self, **kwargs):
+        import threading
+
+        super().__init__(**kwargs)
+        self.finish = threading.Event()
+
+    def chat(self, messages, **kwargs):
+        self.finish.wait(5)
+        return super().chat(messages, **kwargs)
+
+
+def _wait_for(read, *, timeout=5.0):
+    import time
+
+    deadline = time.monotonic() + timeout
+    while not read() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return read()
+
+
+def test_a_slow_model_does_not_hold_back_crisis_help(app, auth_client):
+    from app.services.counselor import FOLLOW_UPS, TIME_TO_FIRST_HELP
+    from app.services.safety import CRISIS_FALLBACK_MESSAGE
+
+    app.config["CRISIS_REPLY_SLO_SECONDS"] = 0.05
+    slow = SlowHF(reply="I'm here, and I'm listening.")
+    app.extensions["huggingface"] = slow
+    metrics = app.extensions["metrics"]
+
+    res = auth_client.post("/api/chat", json={"message": "I am going to kill myself tonight"})
+    data = res.get_json()
+    assert data["response"] == CRISIS_FALLBACK_MESSAGE
+    assert data["resources"] and data["follow_up"] is True
+    assert metrics.value(f"{TIME_TO_FIRST_HELP}_count", reply="fallback") == 1
+
+    slow.finish.set()
+    assert _wait_for(lambda: metrics.value(FOLLOW_UPS, outcome="delivered"))
+    later = auth_client.get(f"/api/history/since?after_id={data['message_id']}").get_json()
+    assert [(m["role"], m["content"]) for m in later["messages"]] == [
+        ("assistant", "I'm here, and I'm listening.")
+    ]
+
+
+def test_a_crisis_reply_inside_the_slo_is_the_model_s_own(app, auth_client, hf):
+    from app.services.counselor import TIME_TO_FIRST_HELP
+
+    res = auth_client.post("/api/chat", json={"message": "I want to end my life"})
+    data = res.get_json()
+    assert data["response"] == hf.reply
+    assert data["follow_up"] is False
+    metrics = app.extensions["metrics"]
+    assert metrics.value(f"{TIME_TO_FIRST_HELP}_count", reply="generated") == 1
+    assert 'crisis_time_to_first_help_seconds_bucket{le="+Inf",reply="generated"' in (
+        auth_client.get("/metrics").get_data(as_text=True)
+    )
+
+
+def test_a_guest_in_crisis_gets_help_at_the_slo_too(app, client):
+    from app.services.counselor import FOLLOW_UPS
+    from app.services.safety import CRISIS_FALLBACK_MESSAGE
+
+    app.config["CRISIS_REPLY_SLO_SECONDS"] = 0.05
+    slow = SlowHF()
+    app.extensions["huggingface"] = slow
+    data = client.post(
+        "/api/guest/chat", json={"message": "I am going to kill myself tonight"}
+    ).get_json()
+    slow.finish.set()
+    assert data["response"] == CRISIS_FALLBACK_MESSAGE
+    assert data["follow_up"] is False  # nowhere to deliver it
+    assert app.extensions["metrics"].value(FOLLOW_UPS, outcome="dropped") == 1
+
+
+def test_the_crisis_slo_starts_once_the_message_is_assessed(app, auth_client):
+    import time
+
+    class SlowClassifier(FakeHF):
+        def suicide_score(self, text):
+            time.sleep(0.1)  # longer than the whole SLO
+            return 0.9
+
+    app.config["CRISIS_REPLY_SLO_SECONDS"] = 0.05
+    app.extensions["huggingface"] = SlowClassifier(reply="I'm here with you.")
+    data = auth_client.post(
+        "/api/chat", json={"message": "I am going to kill myself tonight"}
+    ).get_json()
+    assert data["response"] == "I'm here with you."
+    assert data["follow_up"] is False
+
+
+def test_crisis_generations_run_on_a_pool_sized_like_the_gate(app):
+    pool = app.extensions["crisis_generations"]
+    assert pool._max_workers == app.config["GENERATION_CONCURRENCY"]
+
+
+# --- Degradation ladder -------------------------------------------------------
+
+def _degrade(app, level):
+    from app.services.degradation import DegradationController
+
+    controller = DegradationController(
+        p95_seconds=10.0, error_rate=0.25, min_samples=1, cooldown_seconds=3600,
+        metrics=app.extensions["metrics"],
+    )
+    controller._level = level
+    controller._changed_at = float("inf")  # hold the level for the test
+    app.extensions["degradation"] = controller
+    return controller
+
+
+def test_the_ladder_steps_one_rung_at_a_time_and_back(monkeypatch):
+    from app.metrics import Metrics
+    from app.services import degradation as mod
+    from app.services.degradation import Degradation, DegradationController
+
+    clock = [1000.0]
+    monkeypatch.setattr(mod.time, "monotonic", lambda: clock[0])
+    metrics = Metrics()
+    controller = DegradationController(
+        p95_seconds=2.0, error_rate=0.25, window_seconds=20, cooldown_seconds=30,
+        min_samples=3, metrics=metrics,
+    )
+    controller.record(5.0, failed=False)
+    controller.record(5.0, failed=False)
+    assert controller.current() is Degradation.NORMAL  # too few to act on
+    controller.record(5.0, failed=False)
+    assert controller.current() is Degradation.NO_AFFECT
+    for _ in range(3):
+        controller.record(5.0, failed=False)
+    assert controller.current() is Degradation.NO_AFFECT  # cooling down
+
+    clock[0] += 31
+    for _ in range(3):
+        controller.record(0.1, failed=True)  # fast, but falling back
+    assert controller.current() is Degradation.NO_SUMMARIES
+
+    clock[0] += 31
+    controller.record(0.1, failed=False)
+    assert controller.current() is Degradation.NO_AFFECT
+    clock[0] += 31  # then quiet: nothing says there is pressure, so keep recovering
+    assert controller.current() is Degradation.NORMAL
+    assert metrics.value("degradation_changes_total", direction="up") == 2
+    assert metrics.value("degradation_changes_total", direction="down") == 2
+
+
+def test_sheds_are_not_counted_and_slo_misses_count_when_the_model_finishes(app, auth_client):
+    from app.services.admission import GenerationGate
+    from app.services.degradation import Degradation
+
+    controller = _degrade(app, Degradation.NORMAL)
+    gate = GenerationGate(1)
+    app.extensions["generation_gate"] = gate
+    assert gate.admit()  # another request is mid-generation
+    auth_client.post("/api/chat", json={"message": "I am going to kill myself tonight"})
+    assert len(controller._turns) == 0  # the gate's own shedding is not model trouble
+    gate.release()
+
+    app.config["CRISIS_REPLY_SLO_SECONDS"] = 0.05
+    slow = SlowHF()
+    app.extensions["huggingface"] = slow
+    auth_client.post("/api/chat", json={"message": "I am going to kill myself tonight"})
+    assert len(controller._turns) == 0
+    slow.finish.set()
+    assert _wait_for(lambda: len(controller._turns) == 1)
+    assert controller._turns[0][2] is False  # late, but the model did answer
+
+
+def test_level_one_drops_the_affect_classifiers_but_not_suicide_risk(app, auth_client):
+    from app.services.degradation import Degradation
+
+    class CountingHF(FakeHF):
+        affect_calls = 0
+
+        def emotions(self, text, **kwargs):
+            self.affect_calls += 1
+            return super().emotions(text, **kwargs)
+
+        def sentiment(self, text):
+            self.affect_calls += 1
+            return super().sentiment(text)
+
+    counting = CountingHF(suicide=0.97, emotions=["sadness"])
+    app.extensions["huggingface"] = counting
+    _degrade(app, Degradation.NO_AFFECT)
+
+    data = auth_client.post("/api/chat", json={"message": "everything feels pointless"}).get_json()
+    assert counting.affect_calls == 0
+    assert data["risk"]["emotions"] == []
+    assert data["risk"]["is_crisis"] and data["resources"]  # the suicide model still ran
+
+
+def test_level_two_defers_summarisation(app, auth_client, hf, monkeypatch):
+    from app.services import memory
+    from app.services.degradation import Degradation
+
+    calls = []
+    monkeypatch.setattr(
+        memory, "messages_to_summarise", lambda *a, **k: calls.append(a) or []
+    )
+    auth_client.post("/api/chat", json={"message": "hello"})
+    assert len(calls) == 1
+
+    _degrade(app, Degradation.NO_SUMMARIES)
+    auth_client.post("/api/chat", json={"message": "hello again"})
+    assert len(calls) == 1
+
+
+def test_summarisation_takes_a_slot_only_when_a_summary_is_due(app, auth_client, hf, monkeypatch):
+    gate = app.extensions["generation_gate"]
+    slots = []
+    real_slot = gate.slot
+    monkeypatch.setattr(gate, "slot", lambda **k: slots.append(k) or real_slot(**k))
+
+    auth_client.post("/api/chat", json={"message": "hello"})
+    assert slots == [] and len(hf.calls) == 1  # two messages; nothing to fold in
+
+    app.config.update(MEMORY_SUMMARY_TRIGGER=2, MEMORY_TURN_WINDOW=2)
+    auth_client.post("/api/chat", json={"message": "hello again"})
+    assert slots == [{"wait": False}]
+    assert len(hf.calls) == 3  # the reply, then the summary
+
+
+def test_level_three_shortens_replies(app, auth_client, hf):
+    from app.services.degradation import Degradation
+
+    app.config["DEGRADED_MAX_TOKENS"] = 120
+    _degrade(app, Degradation.SHORT_REPLIES)
+    auth_client.post("/api/chat", json={"message": "tell me about sleep"})
+    assert hf.calls[-1]["kwargs"]["max_tokens"] == 120
+
+
+def test_level_four_serves_guests_from_the_rules_with_resources(app, client, auth_client, hf):
+    from app.services.degradation import Degradation
+    from app.services.safety import CRISIS_FALLBACK_MESSAGE
+
+    _degrade(app, Degradation.GUESTS_CANNED)
+    data = client.post(
+        "/api/guest/chat", json={"message": "I am going to kill myself tonight"}
+    ).get_json()
+    assert hf.calls == []
+    assert data["response"] == CRISIS_FALLBACK_MESSAGE
+    assert data["resources"] and data["degraded"] is True
+
+    # Signed-in users are still answered by the model.
+    auth_client.post("/api/chat", json={"message": "I had a hard day"})
+    assert len(hf.calls) == 1
+
+
+def test_the_level_is_reported_in_healthz_and_metrics(app, client):
+    from app.services.degradation import Degradation
+
+    _degrade(app, Degradation.SHORT_REPLIES)
+    checks = client.get("/healthz").get_json()["checks"]
+    assert checks["degradation"]["level"] == 3
+    assert checks["degradation"]["name"] == "short-replies"
+    assert "degradation_level{" in client.get("/metrics").get_data(as_text=True)
+
+
+# --- Adaptive reply budget ------------------------------------------------------
+
+def _fill_budget(app, level, tokens, n=20):
+    from app.services.hf_client import ChatReply
+
+    budget = app.extensions["token_budget"]
+    for _ in range(n):
+        budget.record(level, ChatReply("x", tokens=tokens), seconds=1.0, adaptive=False)
+    return budget
+
+
+def test_max_tokens_follows_the_replies_actually_written(app, auth_client, hf):
+    from app.models import RiskLevel
+
+    auth_client.post("/api/chat", json={"message": "what's a good book"})
+    assert hf.calls[-1]["kwargs"]["max_tokens"] == 400  # nothing observed yet
+
+    _fill_budget(app, RiskLevel.NONE, 100)
+    auth_client.post("/api/chat", json={"message": "what's a good film"})
+    assert hf.calls[-1]["kwargs"]["max_tokens"] == 125  # p95 plus a quarter
+
+    _fill_budget(app, RiskLevel.IMMINENT, 300)
+    auth_client.post("/api/chat", json={"message": "I am going to kill myself tonight"})
+    assert hf.calls[-1]["kwargs"]["max_tokens"] == 160  # never past the fixed cap
+
+
+def test_a_reply_cut_off_by_the_smaller_budget_is_regenerated_in_full(app, auth_client):
+    from app.models import RiskLevel
+    from app.services.hf_client import ChatReply
+    from app.services.token_budget import GENERATION_SECONDS, TRUNCATED
+
+    class CutOffOnce(FakeHF):
+        def chat(self, messages, **kwargs):
+            text = super().chat(messages, **kwargs)
+            return ChatReply(text, tokens=kwargs["max_tokens"], truncated=len(self.calls) == 1)
+
+    cut = CutOffOnce(reply="A longer reply than usual.")
+    app.extensions["huggingface"] = cut
+    _fill_budget(app, RiskLevel.NONE, 80)
+
+    data = auth_client.post("/api/chat", json={"message": "tell me everything"}).get_json()
+    assert [c["kwargs"]["max_tokens"] for c in cut.calls] == [100, 400]
+    first, second = (c["kwargs"]["deadline"] for c in cut.calls)
+    assert first == second  # one LLM_TIMEOUT_SECONDS for both calls
+    assert data["response"] == "A longer reply than usual."
+    metrics = app.extensions["metrics"]
+    assert metrics.value(TRUNCATED, risk="none", regenerated="yes") == 1
+    assert metrics.value(f"{GENERATION_SECONDS}_count", risk="none", budget="adaptive") == 1
+
+
+def test_a_cut_off_reply_is_kept_when_there_is_no_time_to_regenerate(app, auth_client):
+    import time
+
+    from app.models import RiskLevel
+    from app.services.hf_client import ChatReply
+    from app.services.token_budget import TRUNCATED
+
+    class SlowCutOff(FakeHF):
+        def chat(self, messages, **kwargs):
+            time.sleep(0.06)
+            text = super().chat(messages, **kwargs)
+            return ChatReply(text, tokens=kwargs["max_tokens"], truncated=True)
+
+    slow = SlowCutOff(reply="A reply that stops mid")
+    app.extensions["huggingface"] = slow
+    app.config["LLM_TIMEOUT_SECONDS"] = 0.1  # another 0.06s call would not fit
+    _fill_budget(app, RiskLevel.NONE, 80)
+
+    data = auth_client.post("/api/chat", json={"message": "tell me everything"}).get_json()
+    assert len(slow.calls) == 1
+    assert data["response"] == "A reply that stops mid"
+    metrics = app.extensions["metrics"]
+    assert metrics.value(TRUNCATED, risk="none", regenerated="no") == 1
+
+
+def test_adaptive_budgets_can_be_switched_off(app, auth_client, hf):
+    from app.models import RiskLevel
+
+    app.extensions["token_budget"].enabled = False
+    _fill_budget(app, RiskLevel.NONE, 100)
+    auth_client.post("/api/chat", json={"message": "what's a good book"})
+    assert hf.calls[-1]["kwargs"]["max_tokens"] == 400
@@ -10,7 +10,7 @@ import pytest
 
 from app.cli import _explain_hf_error
 from app.extensions import db
-from app.services.hf_client import GenerationError
+from app.services.hf_client import ChatRoute, GenerationError
 
 from .conftest import FakeHF
 
@@ -92,6 +92,8 @@ def test_check_hf_reports_generation_failure_without_crashing(app, monkeypatch):
     fake = FakeHF(fail=True)
     fake.token = "hf_fake"
     fake.chat_model = "some/model"
+    fake.chat_routes = [ChatRoute("some/model")]
+    fake.latency_slo = 0
     fake.suicide_model = "s"
     fake.emotion_model = "e"
     fake.sentiment_model = "t"
@@ -109,6 +111,30 @@ def test_check_hf_reports_generation_failure_without_crashing(app, monkeypatch):
            "Rule-based crisis detection" in result.output
 
 
+def test_check_hf_reports_every_model_in_the_chain(app, monkeypatch):
+    class ChainHF(FakeHF):
+        token = "hf_fake"
+        suicide_model = emotion_model = sentiment_model = "m"
+        latency_slo = 8.0
+        chat_routes = [ChatRoute("big/model"), ChatRoute("small/model", "together")]
+
+        def chat(self, messages, *, route=None, **kwargs):
+            if route.model == "small/model":
+                raise GenerationError("404 Not Found")
+            return super().chat(messages, **kwargs)
+
+    app.extensions["huggingface"] = ChainHF(suicide=0.9, emotions=["fear"])
+    monkeypatch.setattr(
+        "huggingface_hub.HfApi.whoami", lambda self, *a, **k: {"name": "tester"}
+    )
+    result = _run(app, "check-hf")
+    assert "primary: big/model" in result.output
+    assert "fallback 1: small/model:together" in result.output
+    assert result.exit_code == 1
+    assert "Failed: chat model small/model:together" in result.output
+    assert "fail over to the models that answered" in result.output
+
+
 # --- error explanations ----------------------------------------------------
 
 @pytest.mark.parametrize(
@@ -182,3 +208,198 @@ def test_purge_deletes_content_past_the_retention_window(app, user):
     _run(app, "purge-old-data")
     remaining = db.session.query(Message).all()
     assert [m.content for m in remaining] == ["recent"]
+
+
+# --- reencrypt -------------------------------------------------------------
+
+OLD_KEY = "an-old-key-being-rotated-out"
+
+
+def _seed_under_old_key(app, user):
+    """Rows written before a rotation, then the app restarted with the new key."""
+    from datetime import date
+
+    from app.crypto import init_encryption
+    from app.models import CheckIn, Conversation, Message, SafetyPlan
+
+    init_encryption(OLD_KEY)
+    convo = Conversation(user_id=user.id, title="t", summary="a summary")
+    db.session.add(convo)
+    db.session.commit()
+    db.session.add_all(
+        [Message(conversation_id=convo.id, role="user", content=f"message {i}") for i in range(5)]
+    )
+    db.session.add(CheckIn(user_id=user.id, checkin_date=date(2026, 1, 1), note="a note"))
+    db.session.add(SafetyPlan(user_id=user.id, warning_signs="signs", reasons_for_living="why"))
+    db.session.commit()
+    db.session.expunge_all()
+    init_encryption(app.config["ENCRYPTION_KEY"], previous_keys=[OLD_KEY])
+
+
+def _raw_values():
+    from sqlalchemy import select
+
+    from app.crypto import ciphertext
+    from app.services.rotation import ENCRYPTED_MODELS, encrypted_columns
+
+    values = []
+    for model in ENCRYPTED_MODELS:
+        for column in encrypted_columns(model):
+            query = select(ciphertext(column)).where(column.isnot(None))
+            values += db.session.execute(query).scalars().all()
+    return values
+
+
+def test_reencrypt_moves_every_table_to_the_primary_key(app, user, tmp_path):
+    from app.crypto import Encryptor
+
+    _seed_under_old_key(app, user)
+    result = _run(
+        app, "reencrypt", ["--batch-size", "2", "--checkpoint", str(tmp_path / "cp.json")]
+    )
+    assert result.exit_code == 0, result.output
+
+    primary_only = Encryptor(app.config["ENCRYPTION_KEY"])
+    plaintexts = {primary_only.decrypt(v) for v in _raw_values()}
+    assert "[unable to decrypt this message]" not in plaintexts
+    assert {"message 0", "message 4", "a summary", "a note", "signs", "why"} <= plaintexts
+
+    # A finished run leaves no checkpoint; a second pass rescans and finds nothing to do.
+    assert not (tmp_path / "cp.json").exists()
+    again = _run(app, "reencrypt", ["--checkpoint", str(tmp_path / "cp.json")])
+    assert "Scanned 0 rows" not in again.output
+    assert "rewrote 0 values" in again.output
+
+
+def test_reencrypt_resumes_from_its_checkpoint(app, user, tmp_path):
+    import json
+
+    from app.crypto import Encryptor, get_encryptor
+    from app.models import Message
+
+    _seed_under_old_key(app, user)
+    ids = sorted(m.id for m in db.session.query(Message))
+    enc = get_encryptor()
+    checkpoint = tmp_path / "cp.json"
+    checkpoint.write_text(json.dumps({
+        "key_id": enc.key_id, "write_version": enc.write_version, "tables": {"messages": ids[2]},
+    }))
+
+    assert _run(app, "reencrypt", ["--checkpoint", str(checkpoint)]).exit_code == 0
+
+    primary_only = Encryptor(app.config["ENCRYPTION_KEY"])
+    contents = [primary_only.decrypt(m.content) for m in _raw_messages()]
+    assert "unable to decrypt" in contents[0]  # before the checkpoint: untouched
+    assert contents[3:] == ["message 3", "message 4"]
+    assert not checkpoint.exists()  # finished clean
+
+
+def _raw_messages():
+    from sqlalchemy import select
+
+    from app.crypto import ciphertext
+    from app.models import Message
+
+    query = select(ciphertext(Message.content).label("content")).order_by(Message.id)
+    return db.session.execute(query).all()
+
+
+def test_reencrypt_ignores_a_checkpoint_from_another_key(app, user, tmp_path):
+    import json
+
+    _seed_under_old_key(app, user)
+    checkpoint = tmp_path / "cp.json"
+    checkpoint.write_text(json.dumps({"key_id": "elsewhere", "write_version": 3,
+                                      "tables": {"messages": 10**9}}))
+    result = _run(app, "reencrypt", ["--checkpoint", str(checkpoint)])
+    assert "different key" in result.output
+    assert "rewrote 0 values" not in result.output
+
+
+def test_reencrypt_keeps_and_reports_values_no_key_opens(app, user, tmp_path):
+    from app.crypto import init_encryption
+
+    _seed_under_old_key(app, user)
+    init_encryption(app.config["ENCRYPTION_KEY"])  # old key dropped too early
+    before = _raw_values()
+
+    result = _run(app, "reencrypt", ["--checkpoint", str(tmp_path / "cp.json")])
+    assert result.exit_code == 1
+    assert "none of the configured keys" in result.output
+    assert _raw_values() == before
+
+
+def test_reencrypt_revisits_unreadable_values_once_their_key_is_added(app, user, tmp_path):
+    """The DEPLOY.md recovery path, with the default checkpoint location."""
+    from app.crypto import Encryptor, init_encryption
+
+    app.instance_path = str(tmp_path)
+    _seed_under_old_key(app, user)
+    init_encryption(app.config["ENCRYPTION_KEY"])  # old key dropped too early
+    assert _run(app, "reencrypt", ["--batch-size", "2"]).exit_code == 1
+
+    init_encryption(app.config["ENCRYPTION_KEY"], previous_keys=[OLD_KEY])
+    result = _run(app, "reencrypt", ["--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+    assert "rewrote 0 values" not in result.output
+
+    primary_only = Encryptor(app.config["ENCRYPTION_KEY"])
+    assert "[unable to decrypt this message]" not in {
+        primary_only.decrypt(v) for v in _raw_values()
+    }
+
+
+# --- index-search ----------------------------------------------------------
+
+def test_index_search_backfills_messages_stored_before_the_index(app, user):
+    from app.models import Conversation, Message, MessageToken
+    from app.services.search import search_messages
+
+    convo = Conversation(user_id=user.id, title="t")
+    db.session.add(convo)
+    db.session.commit()
+    db.session.add_all(
+        Message(conversation_id=convo.id, role="user", content=f"old message {i}")
+        for i in range(7)
+    )
+    db.session.commit()
+    assert search_messages(user.id, "old", limit=10) == ([], False)
+
+    result = _run(app, "index-search", ["--batch-size", "3"])
+    assert result.exit_code == 0, result.output
+    assert "indexed 7 messages" in result.output
+    hits, _ = search_messages(user.id, "old message", limit=10)
+    assert len(hits) == 7
+
+    # Re-running only picks up what is missing; --all rebuilds in place.
+    tokens = db.session.query(MessageToken).count()
+    assert "indexed 0 messages" in _run(app, "index-search").output
+    assert "indexed 7 messages" in _run(app, "index-search", ["--all"]).output
+    assert db.session.query(MessageToken).count() == tokens
+
+
+def test_search_index_rows_go_with_their_messages(app, user):
+    from app.models import Conversation, Message, MessageToken
+
+    convo = Conversation(user_id=user.id, title="t")
+    db.session.add(convo)
+    db.session.commit()
+    db.session.add(Message(conversation_id=convo.id, role="user", content="gone soon"))
+    db.session.commit()
+    _run(app, "index-search")
+    assert db.session.query(MessageToken).count() == 2
+
+    db.session.query(Message).delete()
+    db.session.commit()
+    assert db.session.query(MessageToken).count() == 0
+
+
+def test_calibrate_hash_prints_a_usable_method(app):
+    from app.passwords import PasswordHasher
+
+    result = _run(app, "calibrate-hash", ["--method", "pbkdf2", "--target-ms", "1"])
+    assert result.exit_code == 0
+    method = result.output.strip().splitlines()[-1].removeprefix("PASSWORD_HASH_METHOD=")
+    assert method.startswith("pbkdf2:sha256:")
+    hasher = PasswordHasher(method, workers=0)
+    assert hasher.verify(hasher.hash("x"), "x")
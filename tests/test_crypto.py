@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import pytest
 from sqlalchemy import text as sql_text
 
 from app.crypto import Encryptor, get_encryptor
@@ -19,7 +20,7 @@ def test_ciphertext_does_not_contain_plaintext():
     enc = Encryptor("1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY=")
     blob = enc.encrypt("suicidal thoughts")
     assert "suicidal" not in blob
-    assert blob.startswith("enc:v1:")
+    assert blob.startswith("enc:v3:")
 
 
 def test_arbitrary_key_material_is_accepted():
@@ -57,7 +58,7 @@ def test_message_content_is_encrypted_in_the_database(app):
     # Read the raw column, bypassing the SQLAlchemy type decorator entirely.
     raw = db.session.execute(sql_text("SELECT content FROM messages")).scalar()
     assert secret not in raw
-    assert raw.startswith("enc:v1:")
+    assert raw.startswith("enc:v3:")
 
     # And it comes back intact through the ORM.
     assert db.session.query(Message).first().content == secret
@@ -65,3 +66,202 @@ def test_message_content_is_encrypted_in_the_database(app):
 
 def test_encryptor_is_wired_up_by_the_factory(app):
     assert get_encryptor().enabled is True
+
+
+def test_bulk_decrypt_preserves_order_and_nulls():
+    enc = Encryptor("1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY=")
+    values = [enc.encrypt(f"m{i}") for i in range(5)] + [None, "legacy plaintext"]
+    assert enc.decrypt_many(values) == ["m0", "m1", "m2", "m3", "m4", None, "legacy plaintext"]
+
+
+def test_threaded_bulk_decrypt_matches_inline():
+    inline = Encryptor("1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY=")
+    pooled = Encryptor("1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY=", decrypt_workers=3)
+    values = [inline.encrypt(f"message {i}") for i in range(1000)]
+    assert pooled.decrypt_many(values) == inline.decrypt_many(values)
+
+
+def test_ciphertext_column_skips_the_type_decorator(app, user):
+    from app.crypto import ciphertext
+
+    convo = Conversation(user_id=user.id, title="t")
+    db.session.add(convo)
+    db.session.commit()
+    db.session.add(Message(conversation_id=convo.id, role="user", content="quiet words"))
+    db.session.commit()
+
+    raw = db.session.query(ciphertext(Message.content)).scalar()
+    assert raw.startswith("enc:v3:")
+    assert get_encryptor().decrypt_many([raw]) == ["quiet words"]
+
+
+# --- Envelope versions ---------------------------------------------------------
+
+KEY = "1EDoBsdzKcSC7Ib7c1p9nQnrLBHXNVOBc1CBBmvBIeY="
+
+
+def test_v1_values_stay_readable_after_switching_to_v2():
+    old = Encryptor(KEY, write_version=1).encrypt("written last year")
+    assert old.startswith("enc:v1:")
+    assert Encryptor(KEY).decrypt(old) == "written last year"
+
+
+def test_v2_is_smaller_than_v1():
+    text = "I have not slept properly in weeks and I do not know who to tell."
+    v1 = Encryptor(KEY, write_version=1).encrypt(text)
+    v2 = Encryptor(KEY, write_version=2).encrypt(text)
+    assert v2.startswith("enc:v2:")
+    assert len(v2) < len(v1)
+    assert Encryptor(KEY).decrypt(v2) == text
+
+
+@pytest.mark.parametrize("prefix", ["enc:v2:", "enc:v3:"])
+def test_tampered_aead_value_is_rejected_not_returned(prefix):
+    import base64
+
+    blob = Encryptor(KEY, write_version=int(prefix[5])).encrypt("private")
+    raw = bytearray(base64.b64decode(blob[len(prefix):]))
+    raw[-1] ^= 1
+    tampered = prefix + base64.b64encode(bytes(raw)).decode()
+    assert "unable to decrypt" in Encryptor(KEY).decrypt(tampered)
+
+
+def test_envelope_version_cannot_be_relabelled():
+    blob = Encryptor(KEY, write_version=2).encrypt("private")
+    assert "unable to decrypt" in Encryptor(KEY).decrypt("enc:v3:" + blob[len("enc:v2:"):])
+
+
+def test_long_values_are_compressed_inside_the_ciphertext():
+    text = "Mujhe samajh nahi aa raha ke main kya karoon, everything feels heavy. " * 20
+    compressed = Encryptor(KEY).encrypt(text)
+    plain = Encryptor(KEY, compress_min_bytes=10**9).encrypt(text)
+    assert len(compressed) < len(plain) // 2
+    assert Encryptor(KEY).decrypt(compressed) == text
+
+
+def test_short_and_incompressible_values_are_stored_raw():
+    import base64
+    import os
+
+    enc = Encryptor(KEY)
+    noise = base64.b64encode(os.urandom(600)).decode()
+    for text in ["hi", noise]:
+        blob = enc.encrypt(text)
+        assert enc.decrypt(blob) == text
+        assert len(blob) <= len(Encryptor(KEY, compress_min_bytes=10**9).encrypt(text))
+
+
+def test_v2_wrong_key_does_not_crash_the_page():
+    blob = Encryptor(KEY).encrypt("private")
+    assert "unable to decrypt" in Encryptor("a-completely-different-key").decrypt(blob)
+
+
+def test_v2_nonces_are_unique():
+    enc = Encryptor(KEY)
+    assert enc.encrypt("same") != enc.encrypt("same")
+
+
+# --- key rotation -----------------------------------------------------------
+
+OLD_KEY = "an-old-key-being-rotated-out"
+
+
+@pytest.mark.parametrize("version", [1, 2, 3])
+def test_previous_keys_are_accepted_on_read(version):
+    blob = Encryptor(OLD_KEY, write_version=version).encrypt("private")
+    rotated = Encryptor(KEY, previous_keys=[OLD_KEY])
+    assert rotated.decrypt(blob) == "private"
+    # ...but new writes only ever use the primary.
+    assert Encryptor(KEY).decrypt(rotated.encrypt("new")) == "new"
+
+
+def test_rewrap_moves_values_to_the_primary_key():
+    rotated = Encryptor(KEY, previous_keys=[OLD_KEY])
+    fresh = rotated.rewrap(Encryptor(OLD_KEY).encrypt("private"))
+    assert Encryptor(KEY).decrypt(fresh) == "private"
+
+
+def test_rewrap_leaves_current_values_alone():
+    enc = Encryptor(KEY, previous_keys=[OLD_KEY])
+    assert enc.rewrap(enc.encrypt("private")) is None
+    # An older envelope under the right key still gets upgraded.
+    assert enc.rewrap(Encryptor(KEY, write_version=1).encrypt("private")).startswith("enc:v3:")
+
+
+def test_rewrap_refuses_values_no_key_opens():
+    from app.crypto import DecryptionFailed
+
+    with pytest.raises(DecryptionFailed):
+        Encryptor(KEY).rewrap(Encryptor(OLD_KEY).encrypt("private"))
+
+
+def test_rewrap_encrypts_legacy_plaintext():
+    enc = Encryptor(KEY)
+    assert enc.decrypt(enc.rewrap("an old plaintext message")) == "an old plaintext message"
+
+
+# --- decrypt budgets --------------------------------------------------------
+#
+# Encrypted columns are deferred, so an endpoint only pays for the plaintext it
+# actually returns. Each budget is the most decrypts the endpoint may make for
+# a user with 40 messages, 40 mood entries and 10 check-ins.
+
+SEEDED_MESSAGES = 40
+
+
+@pytest.fixture
+def seeded(app, user):
+    from datetime import date, timedelta
+
+    from app.models import CheckIn, MoodEntry
+
+    convo = Conversation(user_id=user.id, title="t", summary="notes so far")
+    db.session.add(convo)
+    db.session.commit()
+    db.session.add_all(
+        Message(conversation_id=convo.id, role="user", content=f"message {i}")
+        for i in range(SEEDED_MESSAGES)
+    )
+    db.session.add_all(
+        MoodEntry(user_id=user.id, sentiment="neutral", excerpt=f"excerpt {i}")
+        for i in range(SEEDED_MESSAGES)
+    )
+    db.session.add_all(
+        CheckIn(user_id=user.id, checkin_date=date.today() - timedelta(days=d), note="note")
+        for d in range(1, 11)
+    )
+    db.session.commit()
+    # Everything is already folded into the summary, so a new turn does not
+    # trigger summarisation and the chat budget is the prompt alone.
+    convo.summarised_upto = db.session.query(db.func.max(Message.id)).scalar()
+    db.session.commit()
+    db.session.expunge_all()
+
+
+@pytest.mark.parametrize(
+    "method,url,body,budget",
+    [
+        # Summary plus the verbatim window (MEMORY_TURN_WINDOW).
+        ("post", "/api/chat", {"message": "hello"}, 1 + 12),
+        ("post", "/api/conversation/reset", None, 0),
+        ("get", "/api/conversations", None, 0),
+        ("get", "/api/history?limit=20", None, 20),
+        ("get", "/history", None, SEEDED_MESSAGES),
+        ("get", "/api/insights", None, 0),
+        ("get", "/api/streak", None, 0),
+        ("post", "/api/checkin", {"mood_score": 3}, 0),
+        # Everything: messages, the summary, excerpts and notes, once each.
+        ("get", "/api/export", None, SEEDED_MESSAGES + 1 + SEEDED_MESSAGES + 10),
+    ],
+)
+def test_endpoint_decrypt_budget(auth_client, hf, seeded, monkeypatch, method, url, body, budget):
+    from app import crypto
+
+    calls = []
+    real = crypto.Encryptor.decrypt
+    monkeypatch.setattr(
+        crypto.Encryptor, "decrypt", lambda self, v: calls.append(v) or real(self, v)
+    )
+    response = getattr(auth_client, method)(url, json=body)
+    assert response.status_code == 200
+    assert len(calls) <= budget
@@ -7,6 +7,8 @@ would look like "no crises detected" rather than like a bug.
 
 from __future__ import annotations
 
+import time
+
 import pytest
 
 from app.services import hf_client
@@ -38,7 +40,7 @@ class Service(HuggingFaceService):
         self.results = results
         self.classify_calls = 0
 
-    def _classify(self, text, model, top_k=5):
+    def _classify(self, text, model, top_k=5, **kwargs):
         self.classify_calls += 1
         return self.results
 
@@ -151,3 +153,426 @@ def test_unconfigured_service_never_generates():
     assert svc.configured is False
     with pytest.raises(GenerationError, match="HF_TOKEN"):
         svc.chat([{"role": "user", "content": "hi"}])
+
+
+# --- Chat model chain --------------------------------------------------------
+
+class Chain(HuggingFaceService):
+    """Real routing, with each model's behaviour scripted."""
+
+    def __init__(self, behaviour, *, latency_slo=5.0, hedge_rate=0.0, metrics=None):
+        super().__init__(
+            "fake-token",
+            chat_model="big",
+            fallback_chat_models=["small", "tiny:together"],
+            suicide_model="s",
+            emotion_model="e",
+            sentiment_model="t",
+            latency_slo=latency_slo,
+            hedge_rate=hedge_rate,
+            metrics=metrics,
+        )
+        self.behaviour = behaviour
+        self.tried = []
+        self.timeouts = []
+
+    def _complete(self, route, messages, *, timeout=None, **kwargs):
+        self.tried.append(route.model)
+        self.timeouts.append(timeout)
+        outcome = self.behaviour.get(route.model, "ok")
+        if isinstance(outcome, list):  # one outcome per call, then "ok"
+            outcome = outcome.pop(0) if outcome else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == "fail":
+            raise GenerationError(f"{route.model} is down")
+        if outcome == "hang":
+            time.sleep(timeout)
+            raise GenerationError("Read timed out")
+        if isinstance(outcome, float):
+            time.sleep(outcome)
+        return f"reply from {route.model}"
+
+
+def test_chain_is_parsed_in_order_with_providers():
+    svc = Chain({})
+    assert [repr(r) for r in svc.chat_routes] == ["big", "small", "tiny:together"]
+
+
+def test_a_healthy_primary_gets_the_turn():
+    svc = Chain({})
+    assert svc.chat([]) == "reply from big"
+    assert svc.tried == ["big"]
+
+
+def test_an_unavailable_primary_fails_over_to_the_next_model():
+    svc = Chain({"big": "fail"})
+    assert svc.chat([]) == "reply from small"
+    assert svc.tried == ["big", "small"]
+
+
+def test_every_model_failing_is_a_generation_error():
+    svc = Chain({"big": "fail", "small": "fail", "tiny": "fail"})
+    with pytest.raises(GenerationError, match="tiny is down"):
+        svc.chat([])
+
+
+def _until(condition, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_primary_slower_than_the_slo_is_passed_over_until_its_probe(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(hf_client.time, "monotonic", lambda: clock[0])
+    svc = Chain({})
+    big = svc.chat_routes[0]
+    big.observe(12.0, ok=True)  # recent turns took 12s against a 5s SLO
+    big.last_used = clock[0]
+
+    assert svc.chat([]) == "reply from small"
+    assert svc.tried == ["small"]
+    clock[0] += hf_client.ChatRoute.PROBE_SECONDS
+    assert svc.chat([]) == "reply from small"  # the probe never holds up a turn
+    assert _until(lambda: "big" in svc.tried)
+    assert svc.tried == ["small", "small", "big"]
+    for _ in range(5):
+        big.observe(1.0, ok=True)
+    assert big.healthy(svc.latency_slo)
+    assert svc.chat([]) == "reply from big"
+
+
+def test_a_hung_primary_still_leaves_time_for_the_next_model():
+    svc = Chain({"big": "hang"})
+    svc._timeout = 0.4
+    started = time.monotonic()
+    assert svc.chat([]) == "reply from small"
+    assert time.monotonic() - started < 0.4
+    assert svc.timeouts[0] == pytest.approx(0.2, abs=0.05)
+
+
+def test_a_probe_that_hangs_costs_the_turn_nothing_and_stops_at_the_slo():
+    svc = Chain({"big": "hang"}, latency_slo=0.1)
+    svc.chat_routes[0].observe(12.0, ok=True)
+
+    started = time.monotonic()
+    assert svc.chat([]) == "reply from small"
+    assert time.monotonic() - started < 0.1
+    assert _until(lambda: len(svc.timeouts) == 2)
+    assert svc.tried == ["small", "big"]
+    assert svc.timeouts[1] == pytest.approx(0.1, abs=0.05)
+
+
+def test_repeated_errors_take_a_model_out_of_rotation():
+    svc = Chain({"big": "fail"})
+    svc.chat([])
+    svc.chat([])
+    assert not svc.chat_routes[0].healthy(svc.latency_slo)
+    svc.tried.clear()
+    svc.chat([])
+    assert svc.tried == ["small"]
+
+
+def test_a_pinned_route_does_not_fail_over():
+    svc = Chain({"big": "fail"})
+    with pytest.raises(GenerationError):
+        svc.chat([], route=svc.chat_routes[0])
+    assert svc.tried == ["big"]
+
+
+# --- Hedging -------------------------------------------------------------------
+
+def _warm(route, seconds, n=20):
+    for _ in range(n):
+        route.observe(seconds, ok=True)
+
+
+def test_a_request_past_its_p90_is_hedged_and_the_faster_reply_wins():
+    from app.metrics import Metrics
+
+    metrics = Metrics()
+    svc = Chain({"big": 0.5, "small": 0.01}, hedge_rate=1.0, metrics=metrics)
+    _warm(svc.chat_routes[0], 0.05)
+    _warm(svc.chat_routes[1], 0.01)
+
+    started = time.monotonic()
+    assert svc.chat([]) == "reply from small"
+    assert time.monotonic() - started < 0.4
+    assert metrics.value(hf_client.HEDGES, outcome="won") == 1
+    assert metrics.value(hf_client.CHAT_REQUESTS) == 1
+
+    deadline = time.monotonic() + 2
+    while not metrics.value(f"{hf_client.HEDGE_SAVED}_count") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert 0.2 < metrics.value(f"{hf_client.HEDGE_SAVED}_sum") < 0.6
+
+
+def test_a_reply_inside_the_p90_is_never_hedged():
+    svc = Chain({"big": 0.01}, hedge_rate=1.0)
+    _warm(svc.chat_routes[0], 0.2)
+    assert svc.chat([]) == "reply from big"
+    assert svc.tried == ["big"]
+
+
+def test_no_hedging_until_the_model_has_a_p90_or_an_slo():
+    svc = Chain({"big": 0.1}, latency_slo=0, hedge_rate=1.0)
+    assert svc.chat([]) == "reply from big"
+    assert svc.tried == ["big"]
+
+
+def test_the_budget_caps_the_share_of_hedged_turns():
+    budget = hf_client._HedgeBudget(0.25)
+    granted = 0
+    for _ in range(100):
+        budget.earn()
+        granted += budget.spend()
+    assert granted == 25
+
+
+def test_a_failed_hedge_leaves_the_primary_to_answer():
+    svc = Chain({"big": 0.2, "small": "fail"}, hedge_rate=1.0)
+    _warm(svc.chat_routes[0], 0.02)
+    assert svc.chat([]) == "reply from big"
+    assert svc.tried == ["big", "small"]
+
+
+# --- Keep-warm -----------------------------------------------------------------
+
+class Warmable(Chain):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.classified = []
+
+    def _classify(self, text, model, top_k=5, **kwargs):
+        self.classified.append(model)
+        return [("neutral", 1.0)]
+
+
+def _keepwarm(app, tmp_path, svc, interval=60.0):
+    from app.services.keepwarm import KeepWarm
+
+    app.extensions["huggingface"] = svc
+    return KeepWarm(
+        app,
+        interval=interval,
+        lock_path=str(tmp_path / "keepwarm.lock"),
+        activity_path=str(tmp_path / "keepwarm.active"),
+    )
+
+
+def test_an_idle_host_probes_every_model_once_per_interval(app, tmp_path):
+    from app.services.keepwarm import PROBE_SECONDS, PROBES
+
+    svc = Warmable({})
+    keepwarm = _keepwarm(app, tmp_path, svc)
+    assert keepwarm.run_once() is True
+    assert svc.classified == ["s", "e", "t"]
+    assert svc.tried == ["big", "small", "tiny"]
+    assert keepwarm.run_once() is False  # probed moments ago
+
+    metrics = app.extensions["metrics"]
+    assert metrics.value(PROBES, kind="chat", outcome="ok") == 3
+    assert metrics.value(f"{PROBE_SECONDS}_count", kind="classifier") == 3
+
+
+def test_recent_chat_traffic_means_no_probes(app, tmp_path):
+    svc = Warmable({})
+    keepwarm = _keepwarm(app, tmp_path, svc)
+    keepwarm.touch()
+    assert keepwarm.run_once() is False
+    assert svc.tried == [] and svc.classified == []
+
+
+def test_only_one_worker_per_host_probes(app, tmp_path):
+    leader = _keepwarm(app, tmp_path, Warmable({}))
+    follower = _keepwarm(app, tmp_path, Warmable({}))
+    assert leader.is_leader()
+    assert not follower.is_leader()
+    assert follower.run_once() is False
+
+
+def test_probes_feed_routing_errors_but_not_latency(app, tmp_path):
+    svc = Warmable({"big": "fail"})
+    keepwarm = _keepwarm(app, tmp_path, svc)
+    keepwarm.run_once()
+    big, small = svc.chat_routes[:2]
+    assert big.error_rate > 0  # a cold 503 is seen before a person meets it
+    assert small.latency is None
+    assert small.p90() is None and len(small._samples) == 0
+
+
+def test_a_quick_probe_does_not_make_a_slow_model_look_healthy(app, tmp_path):
+    svc = Warmable({})
+    big = svc.chat_routes[0]
+    big.observe(12.0, ok=True)  # real turns take 12s against a 5s SLO
+    _keepwarm(app, tmp_path, svc).run_once()
+    assert big.latency == 12.0
+    assert not big.healthy(svc.latency_slo)
+
+
+# --- Retries -------------------------------------------------------------------
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(hf_client.time, "sleep", slept.append)
+    return slept
+
+
+@pytest.mark.parametrize(
+    "message,expected",
+    [
+        ("401 Client Error: Unauthorized", "auth"),
+        ("403 Forbidden: gated repo", "gated"),
+        ("404 Not Found", "not_found"),
+        ("503 Service Unavailable: model is currently loading", "cold_start"),
+        ("429 Too Many Requests", "rate_limited"),
+        ("Model is not supported by provider together", "no_provider"),
+        ("Read timed out", "timeout"),
+        ("Connection reset by peer", "other"),
+    ],
+)
+def test_errors_are_classed_like_check_hf_explains_them(message, expected):
+    assert hf_client.error_class(GenerationError(message)) == expected
+
+
+def test_the_http_status_of_a_wrapped_error_is_used():
+    class Response:
+        status_code = 429
+
+    class HubError(Exception):
+        response = Response()
+
+    try:
+        raise GenerationError("Too Many Requests") from HubError("boom")
+    except GenerationError as exc:
+        assert hf_client.error_class(exc) == "rate_limited"
+
+
+def test_a_cold_start_is_retried_with_backoff_on_the_same_model(sleeps):
+    from app.metrics import Metrics
+
+    metrics = Metrics()
+    svc = Chain({"big": [GenerationError("503 model is loading")]}, metrics=metrics)
+    assert svc.chat([]) == "reply from big"
+    assert svc.tried == ["big", "big"]
+    assert len(sleeps) == 1 and 1.0 <= sleeps[0] <= 2.0
+    assert metrics.value(hf_client.RETRIES, model="big", error="cold_start") == 1
+
+
+def test_backoff_grows_and_stops_at_the_attempt_limit(sleeps):
+    limited = GenerationError("429 rate limit")
+    svc = Chain({"big": [limited] * 3, "small": "fail", "tiny": "fail"})
+    with pytest.raises(GenerationError):
+        svc.chat([])
+    assert svc.tried[:3] == ["big", "big", "big"]
+    assert len(sleeps) == 2 and 0.25 <= sleeps[0] <= 0.5 and 0.5 <= sleeps[1] <= 1.0
+
+
+@pytest.mark.parametrize("message", ["401 Unauthorized", "404 Not Found", "403 gated repo"])
+def test_permanent_errors_fail_over_without_a_retry(sleeps, message):
+    svc = Chain({"big": [GenerationError(message)]})
+    assert svc.chat([]) == "reply from small"
+    assert svc.tried == ["big", "small"]
+    assert sleeps == []
+
+
+def test_no_retry_that_would_overrun_the_time_budget(sleeps):
+    svc = Chain({"big": [GenerationError("503 loading")]})
+    svc._timeout = 0.5  # less than the shortest cold-start backoff
+    assert svc.chat([]) == "reply from small"
+    assert sleeps == []
+
+
+def test_no_retry_without_time_for_a_useful_attempt_after_it(sleeps):
+    svc = Chain({"big": [GenerationError("429 rate limit")]})
+    svc._timeout = 3.0  # big's half is 1.5s; after the backoff, under RETRY_MIN_SECONDS
+    assert svc.chat([]) == "reply from small"
+    assert svc.tried == ["big", "small"]
+    assert sleeps == []
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock that only moves when something sleeps."""
+    now = [100.0]
+    monkeypatch.setattr(hf_client.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(hf_client.time, "sleep", lambda s: now.__setitem__(0, now[0] + s))
+    return now
+
+
+def test_a_retried_chat_attempt_only_gets_what_is_left_of_the_turn(clock):
+    svc = Chain({"big": [GenerationError("503 model is loading")]})
+    svc.chat([])
+    assert svc.timeouts[0] == 12.5  # half of 25, with small behind it
+    assert 10.5 <= svc.timeouts[1] <= 11.5  # less the 1-2s backoff
+
+
+def test_a_rate_limited_classification_is_retried(clock):
+    class Flaky(Service):
+        def _classify(self, text, model, top_k=5, *, timeout=None):
+            self.classify_calls += 1
+            self.timeouts.append(timeout)
+            if self.classify_calls == 1:
+                raise RuntimeError("429 Too Many Requests")
+            return self.results
+
+    svc = Flaky([("suicide", 0.9)])
+    svc.timeouts = []
+    assert svc.suicide_score("x") == pytest.approx(0.9)
+    assert svc.classify_calls == 2
+    assert svc.timeouts[0] == svc.classify_budget
+    assert svc.classify_budget - 0.5 <= svc.timeouts[1] <= svc.classify_budget - 0.25
+
+
+def test_a_cold_classifier_is_retried_within_the_default_budget(app, clock):
+    class Cold(Service):
+        def _classify(self, text, model, top_k=5, *, timeout=None):
+            self.classify_calls += 1
+            clock[0] += 0.3  # the 503 takes a moment to come back
+            if self.classify_calls == 1:
+                raise RuntimeError("503 Service Unavailable: model is loading")
+            return self.results
+
+    svc = Cold([("suicide", 0.8)])
+    svc.classify_budget = app.config["HF_CLASSIFY_BUDGET_SECONDS"]
+    for _ in range(20):  # the backoff is random; every draw must leave room
+        svc.classify_calls = 0
+        hf_client._CLASSIFY_CACHE.clear()
+        assert svc.suicide_score("still loading") == pytest.approx(0.8)
+        assert svc.classify_calls == 2
+
+
+def test_clients_are_kept_per_provider_and_rounded_timeout(monkeypatch):
+    built = []
+    monkeypatch.setattr(
+        hf_client, "_build_client", lambda token, timeout, provider: built.append(timeout) or object()
+    )
+    svc = Service([])
+    assert svc._client_for(None, 12.3) is svc._client_for(None, 12.4)
+    assert svc._client_for(None, 12.6) is not svc._client_for(None, 12.3)
+    assert svc._client_for(None, 0.1) is svc._client_for(None, 0.4)
+    assert svc._client_for(None, 99) is svc._client_for(None)
+    assert built == [12.0, 12.5, 0.5, 25.0]
+
+
+def test_completion_length_and_truncation_are_read_from_the_response():
+    from types import SimpleNamespace
+
+    completion = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=" Hi. "), finish_reason="length")],
+        usage=SimpleNamespace(completion_tokens=42),
+    )
+
+    class Stub(HuggingFaceService):
+        def _client_for(self, provider, timeout=None):
+            return SimpleNamespace(chat_completion=lambda **kwargs: completion)
+
+    svc = Stub("fake-token", chat_model="m", suicide_model="s",
+               emotion_model="e", sentiment_model="t")
+    reply = svc.chat([])
+    assert reply == "Hi."
+    assert reply.tokens == 42 and reply.truncated is True
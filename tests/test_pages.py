@@ -38,13 +38,16 @@ def test_pages_carry_a_csrf_token(auth_client):
     assert 'name="csrf-token"' in auth_client.get("/chat").get_data(as_text=True)
 
 
-def test_forms_include_a_csrf_field():
+def test_forms_include_a_csrf_field(monkeypatch):
     """The testing config turns CSRF off, so this needs an app with it on."""
     from app import create_app
+    from app.config import DevelopmentConfig
     from app.extensions import db
 
+    # Before create_app, which builds the engine from it.
+    monkeypatch.setattr(DevelopmentConfig, "SQLALCHEMY_DATABASE_URI", "sqlite:///:memory:")
     app = create_app("development")
-    app.config.update(WTF_CSRF_ENABLED=True, SQLALCHEMY_DATABASE_URI="sqlite:///:memory:")
+    app.config["WTF_CSRF_ENABLED"] = True
     with app.app_context():
         db.create_all()
         c = app.test_client()
@@ -82,7 +82,7 @@ def test_plan_is_encrypted_at_rest(auth_client, user):
     auth_client.post("/api/safety-plan", json={"reasons_for_living": "my sister Ayesha"})
     raw = db.session.execute(sql_text("SELECT reasons_for_living FROM safety_plans")).scalar()
     assert "Ayesha" not in raw
-    assert raw.startswith("enc:v1:")
+    assert raw.startswith("enc:v3:")
 
 
 def test_clear_wipes_everything(auth_client, user):
@@ -5,7 +5,7 @@ from __future__ import annotations
 import pytest
 
 from app import ConfigurationError, create_app
-from app.config import ProductionConfig
+from app.config import DevelopmentConfig, ProductionConfig
 
 
 def test_security_headers_are_present(client):
@@ -46,11 +46,13 @@ def test_model_output_is_never_returned_as_html(auth_client, app):
     assert data["response"].startswith("<img")
 
 
-def test_csrf_is_enforced_on_forms():
+def test_csrf_is_enforced_on_forms(monkeypatch):
     """The testing config disables CSRF, so assert it against a real config."""
+    # Before create_app: the engine is built from it there, and the default
+    # would leave a database file in the instance folder.
+    monkeypatch.setattr(DevelopmentConfig, "SQLALCHEMY_DATABASE_URI", "sqlite:///:memory:")
     app = create_app("development")
     app.config["WTF_CSRF_ENABLED"] = True
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
     with app.app_context():
         from app.extensions import db
 
@@ -129,3 +131,65 @@ def test_404_renders_without_leaking(client):
     res = client.get("/definitely-not-a-page")
     assert res.status_code == 404
     assert "Traceback" not in res.get_data(as_text=True)
+
+
+# --- shared rate-limit storage -----------------------------------------------
+
+def test_sqlite_limiter_storage_is_shared_between_workers(tmp_path):
+    """Two storages on one file stand in for two gunicorn workers."""
+    from limits import RateLimitItemPerMinute
+    from limits.storage import storage_from_string
+    from limits.strategies import MovingWindowRateLimiter
+
+    from app.ratelimit import SQLiteStorage
+
+    uri = f"sqlite:///{tmp_path}/ratelimit.db"
+    workers = [MovingWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    assert all(isinstance(w.storage, SQLiteStorage) for w in workers)
+
+    login = RateLimitItemPerMinute(3)
+    assert [workers[i % 2].hit(login, "1.2.3.4") for i in range(4)] == [True, True, True, False]
+    assert workers[0].hit(login, "5.6.7.8")  # other clients are unaffected
+    assert workers[1].get_window_stats(login, "1.2.3.4").remaining == 0
+
+
+def test_sqlite_limiter_window_moves(tmp_path, monkeypatch):
+    from limits import RateLimitItemPerMinute
+    from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+
+    from app import ratelimit
+
+    storage = ratelimit.SQLiteStorage(f"sqlite:///{tmp_path}/ratelimit.db")
+    now = [1_000_000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    limit = RateLimitItemPerMinute(2)
+
+    moving = MovingWindowRateLimiter(storage)
+    assert moving.hit(limit, "a")
+    now[0] += 40
+    assert moving.hit(limit, "a")
+    assert not moving.hit(limit, "a")
+    now[0] += 21  # the first hit has left the window; the second has not
+    assert moving.hit(limit, "a")
+    assert not moving.hit(limit, "a")
+
+    fixed = FixedWindowRateLimiter(storage)
+    assert fixed.hit(limit, "b") and fixed.hit(limit, "b")
+    assert not fixed.hit(limit, "b")
+    now[0] += 61
+    assert fixed.hit(limit, "b")
+    assert storage.reset() > 0
+
+
+def test_a_relative_sqlite_limiter_path_lives_in_the_instance_folder(tmp_path):
+    from app.ratelimit import resolve_uri
+
+    instance = str(tmp_path)
+    assert resolve_uri("sqlite:///ratelimit.db", instance) == f"sqlite:///{tmp_path}/ratelimit.db"
+    assert resolve_uri("sqlite:////var/lib/rl.db", instance) == "sqlite:////var/lib/rl.db"
+    assert resolve_uri("redis://cache:6379", instance) == "redis://cache:6379"
+    assert resolve_uri("memory://", instance) == "memory://"
+
+
+def test_the_limiter_keeps_flask_limiter_s_default_strategy(app):
+    assert app.config["RATELIMIT_STRATEGY"] == "fixed-window"
@@ -4,6 +4,8 @@ from __future__ import annotations
 
 from datetime import date, timedelta
 
+import pytest
+
 from app.extensions import db
 from app.models import CheckIn, checkin_calendar, compute_streaks
 
@@ -134,3 +136,138 @@ def test_export_returns_everything_decrypted(auth_client, hf, user):
 
 def test_export_requires_login(client):
     assert client.get("/api/export").status_code in (302, 401)
+
+
+# --- Stored streak state ------------------------------------------------------
+
+def test_checkins_update_stored_state_incrementally(auth_client, user):
+    from app.models import StreakState
+
+    auth_client.post("/api/checkin", json={})
+    state = db.session.get(StreakState, user.id)
+    assert (state.current_run, state.longest_run, state.total_checkins) == (1, 1, 1)
+    assert state.last_checkin == date.today()
+
+
+def test_stored_state_is_built_from_history_on_first_read(app, user):
+    from app.services import streaks
+
+    _seed(user.id, [20, 19, 18, 17, 16, 10, 1, 0])
+    assert streaks.get_streaks(user.id) == compute_streaks(user.id)
+
+
+def test_incremental_update_matches_the_derived_value(app, user):
+    from app.services import streaks
+
+    start = date.today() - timedelta(days=12)
+    for off in [0, 1, 2, 5, 6, 7, 8, 11, 12]:
+        day = start + timedelta(days=off)
+        db.session.add(CheckIn(user_id=user.id, checkin_date=day))
+        streaks.apply_checkin(user.id, day)
+        db.session.commit()
+    assert streaks.get_streaks(user.id) == compute_streaks(user.id)
+
+
+def test_out_of_order_checkin_falls_back_to_a_rebuild(app, user):
+    from app.services import streaks
+
+    _seed(user.id, [3, 1, 0])
+    streaks.get_streaks(user.id)
+    day = date.today() - timedelta(days=2)
+    db.session.add(CheckIn(user_id=user.id, checkin_date=day))
+    streaks.apply_checkin(user.id, day)
+    db.session.commit()
+    assert streaks.get_streaks(user.id)["current_streak"] == 4
+
+
+def test_rejected_checkin_leaves_the_state_untouched(auth_client, user):
+    from app.models import StreakState
+
+    auth_client.post("/api/checkin", json={})
+    auth_client.post("/api/checkin", json={})
+    assert db.session.get(StreakState, user.id).total_checkins == 1
+
+
+def test_check_streaks_reports_and_fixes_drift(app, user):
+    from app.models import StreakState
+    from app.services import streaks
+
+    _seed(user.id, [2, 1, 0])
+    streaks.get_streaks(user.id)
+    db.session.get(StreakState, user.id).total_checkins = 99
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(app.cli.get_command(None, "check-streaks"))
+    assert result.exit_code == 1
+    assert "1 users disagree" in result.output
+
+    result = runner.invoke(app.cli.get_command(None, "check-streaks"), ["--fix"])
+    assert result.exit_code == 0
+    assert db.session.get(StreakState, user.id).total_checkins == 3
+
+
+@pytest.mark.parametrize(
+    "offsets",
+    [[], [0], [1], [5, 4, 3], [2, 1, 0], [20, 19, 18, 17, 16, 10, 1, 0], [9, 7, 5, 3, 1]],
+)
+def test_sql_streaks_match_the_python_walk(app, user, offsets):
+    from app.models import compute_streaks_sql
+
+    _seed(user.id, offsets)
+    assert compute_streaks_sql(user.id) == compute_streaks(user.id)
+
+
+def test_streak_engine_is_selectable(app, user):
+    from app.services import streaks
+
+    _seed(user.id, [3, 2, 1])
+    app.config["STREAK_ENGINE"] = "sql"
+    assert streaks.derive(user.id) == compute_streaks(user.id)
+    assert streaks.rebuild(user.id).longest_run == 3
+
+
+# --- Combined check-in summary --------------------------------------------------
+
+def _record(statements, conn, cursor, statement, *args):
+    statements.append(statement)
+
+
+def test_summary_matches_the_separate_derivations(app, user):
+    from app.services import streaks
+
+    _seed(user.id, [40, 39, 3, 2, 1, 0])
+    summary = streaks.checkin_summary(user.id)
+    assert summary.streak == compute_streaks(user.id)
+    assert summary.calendar == checkin_calendar(user.id)
+
+
+def test_summary_is_one_query_once_state_exists(app, user):
+    from functools import partial
+
+    from sqlalchemy import event
+
+    from app.services import streaks
+
+    user_id = user.id
+    _seed(user_id, [2, 1, 0])
+    streaks.get_streaks(user_id)
+    db.session.expire_all()
+
+    statements = []
+    listener = partial(_record, statements)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        with app.test_request_context():
+            streaks.checkin_summary(user_id)
+            streaks.checkin_summary(user_id)  # memoised for the rest of the request
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+
+
+def test_checkin_response_reflects_the_new_checkin(auth_client, user):
+    auth_client.get("/api/streak")
+    data = auth_client.post("/api/checkin", json={"mood_score": 3}).get_json()
+    assert data["streak"]["checked_in_today"] is True
+    assert data["calendar"][-1]["mood_score"] == 3